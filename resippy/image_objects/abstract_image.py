@@ -1,7 +1,11 @@
 from __future__ import division
 
 import abc
+from collections import OrderedDict
+
+import numpy as np
 from numpy import ndarray
+from typing import Union
 from resippy.image_objects.abstract_image_metadata import AbstractImageMetadata
 from six import add_metaclass
 
@@ -24,6 +28,10 @@ class AbstractImage():
         """
         self._image_data = None
         self._metadata = None
+        self._band_cache = OrderedDict()
+        self._band_cache_max_bytes = 0
+        self._band_cache_hits = 0
+        self._band_cache_misses = 0
 
     @abc.abstractmethod
     def read_all_image_data_from_disk(self):  # type: (...) -> ndarray
@@ -45,6 +53,145 @@ class AbstractImage():
         :return: ndarray containing image data of dimensions (ny, nx)
         """
 
+    def read_band(self,
+                  band_number   # type: int
+                  ):            # type: (...) -> ndarray
+        """
+        Gets an image band.  Image data that has already been loaded into the image object is used if it exists.
+        Otherwise the band is read from disk, unless it is in the band cache.  Bands read from disk are added to the
+        band cache if it is enabled, see set_band_cache_max_bytes.  Cached bands are shared between calls, so they are
+        returned read-only, copy them before modifying them.
+        :param band_number: band number to get.  This is zero-based
+        :return: ndarray containing image data of dimensions (ny, nx)
+        """
+        if self._image_data is not None:
+            return self.get_image_band(band_number)
+        if band_number in self._band_cache:
+            self._band_cache_hits += 1
+            self._band_cache.move_to_end(band_number)
+            return self._band_cache[band_number]
+        band_data = self.read_band_from_disk(band_number)
+        if self._band_cache_max_bytes > 0:
+            self._band_cache_misses += 1
+            self._add_to_band_cache(band_number, band_data)
+        return band_data
+
+    def _add_to_band_cache(self,
+                           band_number,     # type: int
+                           band_data        # type: ndarray
+                           ):               # type: (...) -> None
+        if band_data.nbytes > self._band_cache_max_bytes:
+            return
+        # callers get the cached array itself, so it is made read-only to keep one caller from changing another's band
+        band_data.setflags(write=False)
+        self._band_cache[band_number] = band_data
+        # evict the least recently used bands
+        while sum(cached.nbytes for cached in self._band_cache.values()) > self._band_cache_max_bytes:
+            self._band_cache.popitem(last=False)
+
+    def set_band_cache_max_bytes(self,
+                                 max_bytes  # type: int
+                                 ):         # type: (...) -> None
+        """
+        Enables a least recently used cache of bands that are read from disk by read_band.  Windows read with
+        read_window are sliced from cached bands when possible.  The cache is disabled by default.
+        :param max_bytes: maximum total size of the cached bands in bytes.  0 or None disables the cache and clears it
+        :return: None
+        """
+        self._band_cache_max_bytes = max_bytes or 0
+        if self._band_cache_max_bytes > 0:
+            while sum(cached.nbytes for cached in self._band_cache.values()) > self._band_cache_max_bytes:
+                self._band_cache.popitem(last=False)
+        else:
+            self._band_cache.clear()
+
+    def get_band_cache_max_bytes(self):    # type: (...) -> int
+        return self._band_cache_max_bytes
+
+    def get_band_cache_hits(self):  # type: (...) -> int
+        """
+        gets the number of band and window reads that were served by the band cache
+        :return: number of cache hits
+        """
+        return self._band_cache_hits
+
+    def get_band_cache_misses(self):    # type: (...) -> int
+        """
+        gets the number of bands that were read from disk by read_band while the band cache was enabled
+        :return: number of cache misses
+        """
+        return self._band_cache_misses
+
+    def clear_band_cache(self):    # type: (...) -> None
+        """
+        Removes all bands from the band cache and resets the hit and miss counters
+        :return: None
+        """
+        self._band_cache.clear()
+        self._band_cache_hits = 0
+        self._band_cache_misses = 0
+
+    def close_image(self):  # type: (...) -> None
+        """
+        Releases resources held by the image object.  The band cache is invalidated, concrete implementations that
+        keep file handles open should extend this to close them.
+        :return: None
+        """
+        self.clear_band_cache()
+
+    def read_window(self,
+                    bands,          # type: Union[int, list]
+                    x_offset,       # type: int
+                    y_offset,       # type: int
+                    nx,             # type: int
+                    ny              # type: int
+                    ):              # type: (...) -> ndarray
+        """
+        Reads a rectangular window of image data.  Image data that has already been loaded into the image object is
+        sliced, as are bands in the band cache.  Otherwise the window is read from disk using read_window_from_disk.
+        The window should lie within the image.
+        :param bands: band number, or list of band numbers to read.  If None all bands are read.  Zero-based.
+        :param x_offset: x pixel of the upper left corner of the window
+        :param y_offset: y pixel of the upper left corner of the window
+        :param nx: number of x pixels in the window
+        :param ny: number of y pixels in the window
+        :return: ndarray containing image data of dimensions (ny, nx, nbands)
+        """
+        if bands is None:
+            bands = list(range(self.get_metadata().get_n_bands()))
+        elif isinstance(bands, (int, np.integer)):
+            bands = [bands]
+        if self._image_data is not None:
+            return self._image_data[y_offset:y_offset + ny, x_offset:x_offset + nx, bands]
+        if len(self._band_cache) > 0 and all(band in self._band_cache for band in bands):
+            self._band_cache_hits += len(bands)
+            for band in bands:
+                self._band_cache.move_to_end(band)
+            return np.stack([self._band_cache[band][y_offset:y_offset + ny, x_offset:x_offset + nx]
+                             for band in bands], axis=2)
+        return self.read_window_from_disk(bands, x_offset, y_offset, nx, ny)
+
+    def read_window_from_disk(self,
+                              bands,        # type: list
+                              x_offset,     # type: int
+                              y_offset,     # type: int
+                              nx,           # type: int
+                              ny            # type: int
+                              ):            # type: (...) -> ndarray
+        """
+        Reads a window of image data from disk.  This default implementation reads the full bands with read_band, so
+        that they can be cached, and slices them.  Concrete implementations that can read windows directly from disk
+        should override it.
+        :param bands: list of zero-based band numbers to read
+        :param x_offset: x pixel of the upper left corner of the window
+        :param y_offset: y pixel of the upper left corner of the window
+        :param nx: number of x pixels in the window
+        :param ny: number of y pixels in the window
+        :return: ndarray containing image data of dimensions (ny, nx, nbands)
+        """
+        return np.stack([self.read_band(band)[y_offset:y_offset + ny, x_offset:x_offset + nx]
+                         for band in bands], axis=2)
+
     def set_image_data(self,
                        image_data   # type: ndarray
                        ):           # type: (...) -> None
@@ -57,3 +57,16 @@ class ViewReadyStereoImage(AbstractEarthOverheadImage):
                             ):  # type: (...) -> ndarray
         band = self._dset.GetRasterBand(band_number + 1)
         return band.ReadAsArray()
+
+    def read_window_from_disk(self,
+                              bands,  # type: list
+                              x_offset,  # type: int
+                              y_offset,  # type: int
+                              nx,  # type: int
+                              ny  # type: int
+                              ):  # type: (...) -> ndarray
+        numpy_arr = []
+        for bandnum in bands:
+            band = self._dset.GetRasterBand(bandnum + 1)
+            numpy_arr.append(band.ReadAsArray(x_offset, y_offset, nx, ny))
+        return np.stack(numpy_arr, axis=2)
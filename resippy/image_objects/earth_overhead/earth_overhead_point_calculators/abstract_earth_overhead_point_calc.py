@@ -1,6 +1,9 @@
 from __future__ import division
 
 import abc
+import threading
+from concurrent.futures import Executor
+from concurrent.futures import ThreadPoolExecutor
 from numpy import ndarray
 from pyproj import Proj
 from pyproj import transform as proj_transform
@@ -10,6 +13,12 @@ from resippy.photogrammetry.dem.abstract_dem import AbstractDem
 import resippy.utils.image_utils.image_utils as image_utils
 from six import add_metaclass
 
+# tile size used for multithreaded projections when no chunk size has been set
+DEFAULT_PARALLEL_TILE_SIZE = 65536
+
+# marks threads that are already projecting a tile, nested projections on those threads run serially
+_tile_worker_state = threading.local()
+
 
 @add_metaclass(abc.ABCMeta)
 class AbstractEarthOverheadPointCalc:
@@ -27,10 +36,17 @@ class AbstractEarthOverheadPointCalc:
         _projection: The native projection of the point calculator
         _bands_coregistered: If the image this point calculator supports has multiple bands this variable
         specifies whether or not they are coregistered.
+        _chunk_size: The maximum number of points that are passed to the native methods at once.  If this is None
+        all of the points are processed at once.
+        _n_workers: The number of threads used to project blocks of points concurrently.
+        _executor: An optional shared executor that is used instead of creating a thread pool for each call.
         """
         self._lon_lat_center_approximate = None
         self._projection = None
         self._bands_coregistered = True
+        self._chunk_size = None
+        self._n_workers = 1
+        self._executor = None
 
     @abc.abstractmethod
     def _lon_lat_alt_to_pixel_x_y_native(self,
@@ -75,6 +91,25 @@ class AbstractEarthOverheadPointCalc:
         """
         pass
 
+    def _pixel_x_y_alt_to_lon_lat_native_with_threshold(self,
+                                                        pixel_xs,  # type: ndarray
+                                                        pixel_ys,  # type: ndarray
+                                                        alts,  # type: ndarray
+                                                        band,  # type: int
+                                                        max_pixel_error,  # type: float
+                                                        max_iter,  # type: int
+                                                        ):  # type: (...) -> (ndarray, ndarray)
+        """
+        Same as _pixel_x_y_alt_to_lon_lat_native, with the convergence threshold and iteration limit requested by the
+        caller of pixel_x_y_alt_to_lon_lat.  Point calculators whose native inverse is iterative can override this
+        method to use them, by default they are ignored.
+        :param max_pixel_error: convergence threshold, in pixels
+        :param max_iter: maximum number of iterations
+        :return: (longitudes, latitudes) in the point calculator's native projection, or None if
+        _pixel_x_y_alt_to_lon_lat_native is not implemented
+        """
+        return self._pixel_x_y_alt_to_lon_lat_native(pixel_xs, pixel_ys, alts, band=band)
+
     def lon_lat_alt_to_pixel_x_y(self,
                                  lons,  # type: ndarray
                                  lats,  # type: ndarray
@@ -101,12 +136,11 @@ class AbstractEarthOverheadPointCalc:
         # standardize inputs, make everything 1 dimensional ndarrays
         lons_is_number = isinstance(lons, numbers.Number)
         lats_is_number = isinstance(lats, numbers.Number)
-        alts_is_number = isinstance(alts, numbers.Number)
+        # 0-d ndarrays can't be indexed by the blocks below, so they are treated as single values
+        alts_is_number = isinstance(alts, numbers.Number) or np.ndim(alts) == 0
         if lons_is_number or lats_is_number:
             lons = np.array([lons])
             lats = np.array([lats])
-        if alts_is_number:
-            alts = np.zeros(lons.shape) + alts
         world_xyz_is_2d = False
         # auto-detect if world x-y-z arrays are 2d and flatten world_x and world_y arrays they are are 2d.
         # This is done to make all the vector math less complicated and keep it fast without needing to use loops
@@ -116,14 +150,32 @@ class AbstractEarthOverheadPointCalc:
             ny = np.shape(lons)[0]
             lons = np.reshape(lons, nx * ny)
             lats = np.reshape(lats, nx * ny)
-            alts = np.reshape(alts, nx * ny)
+            if not alts_is_number:
+                alts = np.reshape(alts, nx * ny)
 
         # now actually do the calculations with everything in a standard form
         if world_proj is None:
             world_proj = self.get_projection()
-        if world_proj.srs != self.get_projection().srs:
-            lons, lats, alts = proj_transform(world_proj, self.get_projection(), lons, lats, alts)
-        pixel_coords = self._lon_lat_alt_to_pixel_x_y_native(lons, lats, alts, band)
+        n_points = np.size(lons)
+        if self._get_block_size(n_points) >= n_points:
+            if alts_is_number:
+                alts = np.zeros(lons.shape) + alts
+            pixel_coords = self._lon_lat_alt_to_pixel_x_y_block(lons, lats, alts, world_proj, band)
+        else:
+            # process the points in blocks and write them into preallocated outputs to bound memory usage
+            pixel_coords = np.zeros(n_points), np.zeros(n_points)
+
+            def project_block(block):
+                block_lons = lons[block]
+                if alts_is_number:
+                    block_alts = np.zeros(block_lons.shape) + alts
+                else:
+                    block_alts = alts[block]
+                block_pixels_x, block_pixels_y = \
+                    self._lon_lat_alt_to_pixel_x_y_block(block_lons, lats[block], block_alts, world_proj, band)
+                pixel_coords[0][block] = block_pixels_x
+                pixel_coords[1][block] = block_pixels_y
+            self._process_blocks(n_points, project_block)
 
         if lons_is_number or lats_is_number:
             pixel_coords = pixel_coords[0][0], pixel_coords[1][0]
@@ -156,15 +208,134 @@ class AbstractEarthOverheadPointCalc:
         :param alts: altitudes in the point calculator's native elevation datum reference, provided as a numpy ndarray
         :param world_proj: projection of the input longitudes and latitudes
         :param band: band number of the image
-        :param pixel_error_threshold: pixel threshold to use if the iterative solver is used. Defaults to 0.01 pixels
+        :param pixel_error_threshold: pixel threshold to use if the iterative solver, or an iterative native inverse
+        such as the RPC Newton inverse, is used. Defaults to 0.01 pixels
         :param max_iter: maximum iteration.  This is used if the iterative solver does not converge to avoid entering
         an infinite loop.  Defaults to 1000 iterations.
         :return: (lon, lat) as a tuple of float, or tuple of 1d or 2d numpy ndarray, to match the input of pixel_xs, and pixel_ys
         """
         if world_proj is None:
             world_proj = self.get_projection()
-        if self._pixel_x_y_alt_to_lon_lat_native(pixel_xs, pixel_ys, alts, band) is not None:
-            native_lons, native_lats = self._pixel_x_y_alt_to_lon_lat_native(pixel_xs, pixel_ys, alts, band=band)
+        if self._get_block_size(np.size(pixel_xs)) >= np.size(pixel_xs):
+            return self._pixel_x_y_alt_to_lon_lat_block(pixel_xs, pixel_ys, alts, world_proj, band,
+                                                        pixel_error_threshold, max_iter)
+
+        # process the pixels in blocks and write them into preallocated outputs to bound memory usage
+        output_shape = np.shape(pixel_xs)
+        pixel_xs = np.ravel(pixel_xs)
+        pixel_ys = np.ravel(pixel_ys)
+        if np.ndim(alts) != 0:
+            alts = np.ravel(alts)
+        n_points = np.size(pixel_xs)
+        lons, lats = np.zeros(n_points), np.zeros(n_points)
+
+        def project_block(block):
+            block_alts = alts if np.ndim(alts) == 0 else alts[block]
+            lons[block], lats[block] = self._pixel_x_y_alt_to_lon_lat_block(pixel_xs[block], pixel_ys[block],
+                                                                            block_alts, world_proj, band,
+                                                                            pixel_error_threshold, max_iter)
+        self._process_blocks(n_points, project_block)
+        return np.reshape(lons, output_shape), np.reshape(lats, output_shape)
+
+    def _use_threads(self):  # type: (...) -> bool
+        """
+        Whether or not blocks of points should be projected concurrently.  Projections that are started from within
+        a tile worker thread always run serially, so nested calls can not deadlock a shared executor.
+        :return: True if blocks should be projected on a thread pool
+        """
+        in_tile_worker = getattr(_tile_worker_state, "active", False)
+        return (self._n_workers > 1 or self._executor is not None) and not in_tile_worker
+
+    def _get_block_size(self,
+                        n_points  # type: int
+                        ):  # type: (...) -> int
+        """
+        Returns the number of points per block.  Multithreaded projections use DEFAULT_PARALLEL_TILE_SIZE when no
+        chunk size has been set.  The block boundaries only depend on the chunk size, never on the number of
+        workers, so a multithreaded projection is bitwise identical to a serial one with the same chunk size.
+        :param n_points: total number of points
+        :return: number of points per block
+        """
+        chunk_size = self.get_chunk_size()
+        if chunk_size is None:
+            if self._use_threads():
+                return DEFAULT_PARALLEL_TILE_SIZE
+            return max(n_points, 1)
+        return chunk_size
+
+    def _process_blocks(self,
+                        n_points,  # type: int
+                        process_block,  # type: callable
+                        ):  # type: (...) -> None
+        """
+        Calls process_block with consecutive slices that cover n_points points.  process_block is responsible for
+        writing its results into preallocated outputs, the slices are disjoint so this is safe across threads.
+        :param n_points: total number of points
+        :param process_block: function that takes a slice object
+        :return: None
+        """
+        block_size = self._get_block_size(n_points)
+        blocks = [slice(block_start, block_start + block_size) for block_start in range(0, n_points, block_size)]
+        if not self._use_threads() or len(blocks) < 2:
+            for block in blocks:
+                process_block(block)
+            return
+
+        def process_block_in_worker(block):
+            _tile_worker_state.active = True
+            try:
+                process_block(block)
+            finally:
+                _tile_worker_state.active = False
+
+        executor = self._executor
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=min(self._n_workers, len(blocks)))
+        try:
+            # consuming the results re-raises any exception from the workers
+            list(executor.map(process_block_in_worker, blocks))
+        finally:
+            if executor is not self._executor:
+                executor.shutdown()
+
+    def _lon_lat_alt_to_pixel_x_y_block(self,
+                                        lons,  # type: ndarray
+                                        lats,  # type: ndarray
+                                        alts,  # type: ndarray
+                                        world_proj,  # type: Proj
+                                        band  # type: int
+                                        ):  # type: (...) -> (ndarray, ndarray)
+        """
+        Projects a block of 1d world locations to pixel locations.  This is used by lon_lat_alt_to_pixel_x_y
+        :param lons: longitudes in world_proj, as a 1d numpy ndarray
+        :param lats: latitudes in world_proj, as a 1d numpy ndarray
+        :param alts: altitudes, as a 1d numpy ndarray
+        :param world_proj: projection of the input longitudes and latitudes
+        :param band: image band as an int or None if all the bands are coregistered
+        :return: (pixel x, pixel y) as a tuple of 1d numpy ndarrays
+        """
+        if world_proj.srs != self.get_projection().srs:
+            lons, lats, alts = proj_transform(world_proj, self.get_projection(), lons, lats, alts)
+        return self._lon_lat_alt_to_pixel_x_y_native(lons, lats, alts, band)
+
+    def _pixel_x_y_alt_to_lon_lat_block(self,
+                                        pixel_xs,  # type: ndarray
+                                        pixel_ys,  # type: ndarray
+                                        alts,  # type: ndarray
+                                        world_proj,  # type: Proj
+                                        band,  # type: int
+                                        pixel_error_threshold,  # type: float
+                                        max_iter,  # type: int
+                                        ):  # type: (...) -> (ndarray, ndarray)
+        """
+        Projects a block of pixel locations to world locations.  This is used by pixel_x_y_alt_to_lon_lat, see its
+        documentation for a description of the parameters
+        :return: (lon, lat) in world_proj, with the same dimensions as pixel_xs
+        """
+        native_lons_lats = self._pixel_x_y_alt_to_lon_lat_native_with_threshold(pixel_xs, pixel_ys, alts, band,
+                                                                                pixel_error_threshold, max_iter)
+        if native_lons_lats is not None:
+            native_lons, native_lats = native_lons_lats
         else:
             native_lons, native_lats = \
                 self._pixel_x_y_alt_to_lon_lat_native_solver(pixel_xs,
@@ -188,10 +359,12 @@ class AbstractEarthOverheadPointCalc:
                                                 band=None,  # type: int
                                                 max_pixel_error=0.01,  # type: float
                                                 max_iter=1000,  # type: int
+                                                return_solver_stats=False,  # type: bool
                                                 ):  # type: (...) -> (ndarray, ndarray)
         """
         This is a protected method that is used to solve for longitude, and latitude given pixel x, y and altitude values.
-        It uses an approximation of a newton method solver.
+        It uses an approximation of a newton method solver.  Convergence is tracked for each point individually, and
+        only the points that have not yet converged are recomputed on each iteration.
         :param pixel_xs: pixel x values, as a 1d numpy ndarray
         :param pixel_ys: pixel y values, as a 1d numpy ndarray
         :param alts: altitudes in the point calculator's native elevation datum reference, provided as a numpy ndarray
@@ -200,7 +373,12 @@ class AbstractEarthOverheadPointCalc:
         :param band: image band as an int or None if all the bands are coregistered
         :param max_pixel_error: maximum pixel error.  Same as the description in pixel_x_y_alt_to_lon_lat
         :param max_iter: Same as the description in pixel_x_y_alt_to_lon_lat
-        :return: (longitude, latitude) in the point calculator's native projection, as a tuple of numpy ndarrays
+        :param return_solver_stats: If True, the number of iterations and the final pixel residual for each point are
+        returned along with the longitudes and latitudes.  The residual is the larger of the absolute x and y pixel
+        errors.  Defaults to False.
+        :return: (longitude, latitude) in the point calculator's native projection, as a tuple of numpy ndarrays, or
+        (longitude, latitude, n_iterations, pixel_residuals) if return_solver_stats is True.  The outputs have the same
+        dimensions as pixel_xs
         """
 
         n_pixels = np.shape(pixel_xs)
@@ -250,41 +428,69 @@ class AbstractEarthOverheadPointCalc:
                                             np.square(machine_pixels_lat_y_diff) > np.square(d_pixel))[0])[0]
             d_lat = machine_d_lats[lat_gt1_pixel_index] - approximate_lat
 
+        # work on flat copies so that converged points can be dropped from the active set
+        pixel_xs_1d = np.ravel(pixel_xs)
+        pixel_ys_1d = np.ravel(pixel_ys)
+        alts_1d = np.ravel(np.zeros(n_pixels) + alts)
+        lons = np.ravel(lons)
+        lats = np.ravel(lats)
+
+        n_iterations = np.zeros(np.shape(lons), dtype=int)
+        pixel_x_estimate, pixel_y_estimate = self.lon_lat_alt_to_pixel_x_y(lons, lats, alts_1d, band=band)
+        residuals = np.maximum(np.abs(pixel_xs_1d - pixel_x_estimate), np.abs(pixel_ys_1d - pixel_y_estimate))
+        # NaN residuals never compare as converged, so they stay active until max_iter, same as before
+        active = np.where(np.logical_not(residuals <= max_pixel_error))[0]
+
         for i in range(max_iter):
-            pixel_x_estimate, pixel_y_estimate = self.lon_lat_alt_to_pixel_x_y(lons, lats, alts, band=band)
+            if len(active) == 0:
+                break
+            active_lons = lons[active]
+            active_lats = lats[active]
+            active_alts = alts_1d[active]
+            active_pixel_x_estimate = pixel_x_estimate[active]
+            active_pixel_y_estimate = pixel_y_estimate[active]
 
-            lon_shift = lons + d_lon
-            lat_shift = lats + d_lat
+            lon_shift = active_lons + d_lon
+            lat_shift = active_lats + d_lat
 
-            pixel_x_shift_x, pixel_y_shift_x = self.lon_lat_alt_to_pixel_x_y(lon_shift, lats, alts, band=band)
-            pixel_x_shift_y, pixel_y_shift_y = self.lon_lat_alt_to_pixel_x_y(lons, lat_shift, alts, band=band)
+            pixel_x_shift_x, pixel_y_shift_x = \
+                self.lon_lat_alt_to_pixel_x_y(lon_shift, active_lats, active_alts, band=band)
+            pixel_x_shift_y, pixel_y_shift_y = \
+                self.lon_lat_alt_to_pixel_x_y(active_lons, lat_shift, active_alts, band=band)
 
-            pxx = (pixel_x_shift_x - pixel_x_estimate) / d_lon
-            pxy = (pixel_x_shift_y - pixel_x_estimate) / d_lat
-            pyx = (pixel_y_shift_x - pixel_y_estimate) / d_lon
-            pyy = (pixel_y_shift_y - pixel_y_estimate) / d_lat
+            pxx = (pixel_x_shift_x - active_pixel_x_estimate) / d_lon
+            pxy = (pixel_x_shift_y - active_pixel_x_estimate) / d_lat
+            pyx = (pixel_y_shift_x - active_pixel_y_estimate) / d_lon
+            pyy = (pixel_y_shift_y - active_pixel_y_estimate) / d_lat
 
-            delta_px = pixel_xs - pixel_x_estimate
-            delta_py = pixel_ys - pixel_y_estimate
+            delta_px = pixel_xs_1d[active] - active_pixel_x_estimate
+            delta_py = pixel_ys_1d[active] - active_pixel_y_estimate
 
             delta_lat = (delta_py * pxx - pyx * delta_px) / (pyy * pxx - pxy * pyx)
             delta_lon = (delta_px - delta_lat * pxy) / pxx
 
-            new_lons = lons + delta_lon
-            new_lats = lats + delta_lat
+            new_lons = active_lons + delta_lon
+            new_lats = active_lats + delta_lat
 
-            new_pixel_x, new_pixel_y = self.lon_lat_alt_to_pixel_x_y(new_lons, new_lats, alts, band=band)
+            # the pixel locations of the updated estimates are reused as the starting estimates of the next iteration
+            new_pixel_x, new_pixel_y = self.lon_lat_alt_to_pixel_x_y(new_lons, new_lats, active_alts, band=band)
 
-            lons = new_lons
-            lats = new_lats
+            lons[active] = new_lons
+            lats[active] = new_lats
+            pixel_x_estimate[active] = new_pixel_x
+            pixel_y_estimate[active] = new_pixel_y
+            n_iterations[active] += 1
 
-            x_err = np.abs(pixel_xs - new_pixel_x).max()
-            y_err = np.abs(pixel_ys - new_pixel_y).max()
+            active_residuals = np.maximum(np.abs(pixel_xs_1d[active] - new_pixel_x),
+                                          np.abs(pixel_ys_1d[active] - new_pixel_y))
+            residuals[active] = active_residuals
+            active = active[np.logical_not(active_residuals <= max_pixel_error)]
 
-            if x_err <= max_pixel_error and y_err <= max_pixel_error:
-                break
-
-        return lons, lats
+        # restore the input dimensions, scalar inputs get scalar outputs
+        solver_outputs = [np.reshape(arr, n_pixels)[()] for arr in (lons, lats, n_iterations, residuals)]
+        if return_solver_stats:
+            return tuple(solver_outputs)
+        return solver_outputs[0], solver_outputs[1]
 
 
     def _pixel_x_y_to_lon_lat_ray_caster_native(self,
@@ -298,7 +504,9 @@ class AbstractEarthOverheadPointCalc:
                                                 ):  # type: (...) -> (ndarray, ndarray, ndarray)
         """
         Protected method that solves for pixel x, y by casting rays onto a DEM.  This is used when the pixel altitudes
-        are not already known, and only a method for _lon_lat_alt_to_pixel_x_y_native is available.
+        are not already known, and only a method for _lon_lat_alt_to_pixel_x_y_native is available.  The rays are
+        marched through the DEM's elevation pyramid, see AbstractDem.get_elevation_pyramid, and pixels whose rays do
+        not intersect the DEM are set to NaN.
         :param pixels_x: x pixels, as a numpy ndarray
         :param pixels_y: y pixels, as a numpy ndarray
         :param dem: digital elevation model, as concrete implementation of an AbstractDem object
@@ -321,15 +529,17 @@ class AbstractEarthOverheadPointCalc:
             pixels_x = image_utils.flatten_image_band(pixels_x)
             pixels_y = image_utils.flatten_image_band(pixels_y)
 
-        n_pixels_to_project = len(pixels_x)
-
         max_alt = dem_highest_alt
         min_alt = dem_lowest_alt
 
-        if max_alt is None:
-            max_alt = dem.get_highest_alt()
-        if min_alt is None:
-            min_alt = dem.get_lowest_alt()
+        if max_alt is None or min_alt is None:
+            # bound the DEM over the footprint of the rays instead of the whole DEM, this shortens the rays
+            footprint = self.get_ray_footprint_bounds(pixels_x, pixels_y, dem.get_highest_alt(), dem.get_lowest_alt(),
+                                                      band=band)
+            if max_alt is None:
+                max_alt = dem.get_highest_alt(region=footprint, world_proj=self.get_projection())
+            if min_alt is None:
+                min_alt = dem.get_lowest_alt(region=footprint, world_proj=self.get_projection())
         alt_range = max_alt - min_alt
 
         # put the max and min alts at 1 percent above and below the maximum returned by the DEM
@@ -339,52 +549,14 @@ class AbstractEarthOverheadPointCalc:
         lons_max_alt, lats_max_alt = self.pixel_x_y_alt_to_lon_lat(pixels_x, pixels_y, max_alt, band=band)
         lons_min_alt, lats_min_alt = self.pixel_x_y_alt_to_lon_lat(pixels_x, pixels_y, min_alt, band=band)
 
-        # TODO this operation becomes very expensive at very fine DEM resolutions
-        # TODO create implementation for a raster DEM that works faster
-        # TODO the time consuming operations are obtaining lon/lats for many points as the DEM resolution becomes finer
-
-        ray_horizontal_lens = np.sqrt(
-            np.square(lons_max_alt - lons_min_alt) + np.square(lats_max_alt - lats_min_alt))
-        n_steps_per_ray = int(np.ceil(np.max(ray_horizontal_lens) / dem_sample_distance) + 1)
-
-        lons_matrix = np.zeros((n_pixels_to_project, n_steps_per_ray)) + np.linspace(0, 1, n_steps_per_ray)
-        lats_matrix = np.zeros((n_pixels_to_project, n_steps_per_ray)) + np.linspace(0, 1, n_steps_per_ray)
-
-        lons_matrix = np.tile((lons_min_alt - lons_max_alt), (n_steps_per_ray, 1)).transpose() * \
-                      lons_matrix + np.tile(lons_max_alt, (n_steps_per_ray, 1)).transpose()
-        lats_matrix = np.tile((lats_min_alt - lats_max_alt), (n_steps_per_ray, 1)).transpose() * \
-                      lats_matrix + np.tile(lats_max_alt, (n_steps_per_ray, 1)).transpose()
-
-        all_elevations = dem.get_elevations(np.array(lons_matrix), np.array(lats_matrix))
-
-        ray = np.linspace(max_alt, min_alt, n_steps_per_ray)
-        first_ray_intersect_indices = np.zeros(n_pixels_to_project, dtype=np.int)
-        ray_step_indices = list(range(n_steps_per_ray))
-        ray_step_indices.reverse()
-        for i in ray_step_indices:
-            does_ray_intersect = all_elevations[:, i] > ray[i]
-            first_ray_intersect_indices[np.where(does_ray_intersect)] = i
-
-        all_pixel_indices = np.arange(0, n_pixels_to_project, dtype=int)
-
-        first_ray_intersect_indices = first_ray_intersect_indices - 1
-        second_ray_intersect_indices = first_ray_intersect_indices + 1
-        b_rays = ray[first_ray_intersect_indices]
-        b_alts = all_elevations[all_pixel_indices, first_ray_intersect_indices]
-
-        m_rays = ray[1] - ray[0]
-        m_alts = all_elevations[all_pixel_indices, second_ray_intersect_indices] - b_alts
-
-        xs = (b_alts - b_rays) / (m_rays - m_alts)
-        intersected_lons = (lons_matrix[all_pixel_indices, second_ray_intersect_indices] -
-                            lons_matrix[all_pixel_indices, first_ray_intersect_indices]) * xs + \
-                           lons_matrix[all_pixel_indices, first_ray_intersect_indices]
-        intersected_lats = (lats_matrix[all_pixel_indices, second_ray_intersect_indices] -
-                            lats_matrix[all_pixel_indices, first_ray_intersect_indices]) * xs + \
-                           lats_matrix[all_pixel_indices, first_ray_intersect_indices]
-        intersected_alts = (all_elevations[all_pixel_indices, second_ray_intersect_indices] -
-                            all_elevations[all_pixel_indices, first_ray_intersect_indices]) * xs + \
-                           all_elevations[all_pixel_indices, first_ray_intersect_indices]
+        # march the rays coarse-to-fine through the DEM's min / max elevation pyramid over the rays' footprint
+        footprint_lons = np.concatenate((lons_max_alt, lons_min_alt))
+        footprint_lats = np.concatenate((lats_max_alt, lats_min_alt))
+        pyramid = dem.get_elevation_pyramid(np.nanmin(footprint_lons), np.nanmax(footprint_lons),
+                                            np.nanmin(footprint_lats), np.nanmax(footprint_lats),
+                                            dem_sample_distance)
+        intersected_lons, intersected_lats, intersected_alts = pyramid.cast_rays(lons_max_alt, lats_max_alt, max_alt,
+                                                                                 lons_min_alt, lats_min_alt, min_alt)
 
         if is2d:
             intersected_lons = image_utils.unflatten_image_band(intersected_lons, nx, ny)
@@ -394,6 +566,56 @@ class AbstractEarthOverheadPointCalc:
         return intersected_lons, intersected_lats, intersected_alts
 
 
+    def get_ray_footprint_bounds(self,
+                                 pixels_x,  # type: ndarray
+                                 pixels_y,  # type: ndarray
+                                 highest_alt,  # type: float
+                                 lowest_alt,  # type: float
+                                 band=None,  # type: int
+                                 n_edge_samples=32,  # type: int
+                                 ):  # type: (...) -> tuple
+        """
+        Returns the bounding box of the ground locations that the pixels' rays can pass over between two altitudes.
+        This can be passed as the region to a DEM's get_highest_alt and get_lowest_alt methods.  Rather than projecting
+        every pixel, only the border of the pixels' bounding rectangle is projected, with n_edge_samples per edge, and
+        the bounds are grown by half of the largest distance between neighboring projected border samples to cover
+        curvature of the projected edges between samples.
+        :param pixels_x: x pixels, as a numpy ndarray
+        :param pixels_y: y pixels, as a numpy ndarray
+        :param highest_alt: highest altitude of the rays
+        :param lowest_alt: lowest altitude of the rays
+        :param band: image band, as an int, or None if all the image bands are coregistered.
+        :param n_edge_samples: number of samples along each edge of the pixels' bounding rectangle
+        :return: (min_lon, min_lat, max_lon, max_lat) in the point calculator's native projection
+        """
+        min_x, max_x = np.nanmin(pixels_x), np.nanmax(pixels_x)
+        min_y, max_y = np.nanmin(pixels_y), np.nanmax(pixels_y)
+        edge_fractions = np.linspace(0, 1, n_edge_samples, endpoint=False)
+        edge_xs = min_x + (max_x - min_x) * edge_fractions
+        edge_ys = min_y + (max_y - min_y) * edge_fractions
+        # walk around the bounding rectangle, so that neighboring samples are next to each other on the border
+        border_x = np.concatenate((edge_xs, np.zeros(n_edge_samples) + max_x, edge_xs[::-1] + (max_x - min_x) /
+                                   n_edge_samples, np.zeros(n_edge_samples) + min_x))
+        border_y = np.concatenate((np.zeros(n_edge_samples) + min_y, edge_ys, np.zeros(n_edge_samples) + max_y,
+                                   edge_ys[::-1] + (max_y - min_y) / n_edge_samples))
+
+        footprint_lons = []
+        footprint_lats = []
+        margin = 0
+        for alt in (highest_alt, lowest_alt):
+            border_lons, border_lats = self.pixel_x_y_alt_to_lon_lat(border_x, border_y, np.zeros_like(border_x) + alt,
+                                                                     band=band)
+            sample_distances = np.hypot(np.diff(border_lons, append=border_lons[0]),
+                                        np.diff(border_lats, append=border_lats[0]))
+            if np.isfinite(sample_distances).any():
+                margin = max(margin, np.nanmax(sample_distances) / 2)
+            footprint_lons.append(border_lons)
+            footprint_lats.append(border_lats)
+        footprint_lons = np.concatenate(footprint_lons)
+        footprint_lats = np.concatenate(footprint_lats)
+        return (np.nanmin(footprint_lons) - margin, np.nanmin(footprint_lats) - margin,
+                np.nanmax(footprint_lons) + margin, np.nanmax(footprint_lats) + margin)
+
     def pixel_x_y_to_lon_lat_alt(self,
                                  pixels_x,  # type: ndarray
                                  pixels_y,  # type: ndarray
@@ -485,3 +707,76 @@ class AbstractEarthOverheadPointCalc:
         :return: boolean, False if bands are not coregistered, True if they are.
         """
         return self._bands_coregistered
+
+    def get_chunk_size(self):  # type: (...) -> int
+        """
+        returns the maximum number of points that lon_lat_alt_to_pixel_x_y and pixel_x_y_alt_to_lon_lat pass to the
+        native methods at once.
+        :return: chunk size as an int, or None if all of the points are processed at once
+        """
+        return self._chunk_size
+
+    def set_chunk_size(self,
+                       chunk_size  # type: int
+                       ):  # type: (...) -> None
+        """
+        sets the maximum number of points that lon_lat_alt_to_pixel_x_y and pixel_x_y_alt_to_lon_lat pass to the
+        native methods at once.  Large inputs are processed block by block and written into preallocated outputs,
+        which bounds the size of the temporary arrays created by the native methods.
+        :param chunk_size: number of points per block, or None to process all of the points at once
+        :return: None
+        """
+        if chunk_size is not None:
+            chunk_size = int(chunk_size)
+            if chunk_size < 1:
+                raise ValueError("chunk_size must be a positive integer or None")
+        self._chunk_size = chunk_size
+
+    def set_memory_budget(self,
+                          memory_budget_bytes,  # type: int
+                          bytes_per_point=512  # type: int
+                          ):  # type: (...) -> None
+        """
+        convenience method that sets the chunk size from an approximate memory budget for the temporary arrays
+        created during a calculation.
+        :param memory_budget_bytes: memory budget in bytes
+        :param bytes_per_point: approximate number of bytes of temporary arrays used per point.  The default of 512
+        bytes, or 64 float64 values, is a conservative estimate for the point calculators in this package
+        :return: None
+        """
+        self.set_chunk_size(max(int(memory_budget_bytes // bytes_per_point), 1))
+
+    def get_n_workers(self):  # type: (...) -> int
+        """
+        returns the number of threads used to project blocks of points concurrently
+        :return: number of worker threads as an int
+        """
+        return self._n_workers
+
+    def set_n_workers(self,
+                      n_workers  # type: int
+                      ):  # type: (...) -> None
+        """
+        sets the number of threads used to project blocks of points concurrently.  Large inputs to
+        lon_lat_alt_to_pixel_x_y and pixel_x_y_alt_to_lon_lat are split into tiles of chunk_size points, or
+        DEFAULT_PARALLEL_TILE_SIZE points if no chunk size has been set, and the tiles are projected on a thread pool.
+        The numpy operations used by the native methods release the GIL, so the tiles run across cores.
+        :param n_workers: number of worker threads, 1 projects everything serially
+        :return: None
+        """
+        n_workers = int(n_workers)
+        if n_workers < 1:
+            raise ValueError("n_workers must be a positive integer")
+        self._n_workers = n_workers
+
+    def set_executor(self,
+                     executor  # type: Executor
+                     ):  # type: (...) -> None
+        """
+        sets a shared executor, such as a concurrent.futures.ThreadPoolExecutor, that is used to project tiles
+        concurrently instead of creating a thread pool for every call.  The executor is not shut down by the
+        point calculator.
+        :param executor: executor to use, or None to go back to using n_workers
+        :return: None
+        """
+        self._executor = executor
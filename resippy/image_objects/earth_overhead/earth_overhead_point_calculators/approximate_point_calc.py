@@ -0,0 +1,302 @@
+from __future__ import division
+
+import numpy as np
+from numpy import ndarray
+from pyproj import Proj
+
+from resippy.image_objects.earth_overhead.earth_overhead_point_calculators.abstract_earth_overhead_point_calc \
+    import AbstractEarthOverheadPointCalc
+
+
+class ApproximatePointCalc(AbstractEarthOverheadPointCalc):
+    """
+    This is a wrapper around any concrete AbstractEarthOverheadPointCalc that speeds up lon/lat to pixel calculations
+    on dense 2d grids, such as the ground grids used for orthorectification.  The wrapped point calculator is only
+    evaluated on a sparse grid, and the remaining pixel locations are bilinearly interpolated.  The sparse grid is
+    refined adaptively, a grid cell is split in four until the interpolated pixel locations at its center and edge
+    midpoints are within a pixel tolerance of the wrapped point calculator's values, and until the altitudes within the
+    cell are close enough to planar that their deviations shift the pixel locations by less than that tolerance.
+    1d inputs and single values are passed directly to the wrapped point calculator.
+    """
+
+    def __init__(self):
+        super(ApproximatePointCalc, self).__init__()
+        self._point_calc = None             # type: AbstractEarthOverheadPointCalc
+        self._max_pixel_error = 0.125       # type: float
+        self._initial_grid_spacing = 64     # type: int
+
+    @classmethod
+    def init_from_point_calc(cls,
+                             point_calc,  # type: AbstractEarthOverheadPointCalc
+                             max_pixel_error=0.125,  # type: float
+                             initial_grid_spacing=64,  # type: int
+                             ):  # type: (...) -> ApproximatePointCalc
+        """
+        Wraps an existing point calculator
+        :param point_calc: point calculator to wrap
+        :param max_pixel_error: maximum allowed interpolation error, in pixels.  Defaults to 1/8 of a pixel
+        :param initial_grid_spacing: spacing of the coarsest sparse grid, in grid points.  This is rounded up to a
+        power of 2.  Defaults to 64
+        :return: ApproximatePointCalc
+        """
+        approximate_point_calc = cls()
+        approximate_point_calc._point_calc = point_calc
+        approximate_point_calc._max_pixel_error = max_pixel_error
+        approximate_point_calc._initial_grid_spacing = int(2 ** np.ceil(np.log2(max(initial_grid_spacing, 1))))
+        approximate_point_calc._projection = point_calc.get_projection()
+        approximate_point_calc._lon_lat_center_approximate = point_calc.get_approximate_lon_lat_center()
+        approximate_point_calc._bands_coregistered = point_calc.bands_coregistered()
+        return approximate_point_calc
+
+    def get_wrapped_point_calc(self):  # type: (...) -> AbstractEarthOverheadPointCalc
+        """
+        Returns the point calculator wrapped by this approximate point calculator
+        :return: the wrapped point calculator
+        """
+        return self._point_calc
+
+    def _lon_lat_alt_to_pixel_x_y_native(self,
+                                         lons,  # type: ndarray
+                                         lats,  # type: ndarray
+                                         alts,  # type: ndarray
+                                         band=None  # type: int
+                                         ):  # type: (...) -> (ndarray, ndarray)
+        return self._point_calc._lon_lat_alt_to_pixel_x_y_native(lons, lats, alts, band=band)
+
+    def _pixel_x_y_alt_to_lon_lat_native(self,
+                                         pixel_xs,  # type: ndarray
+                                         pixel_ys,  # type: ndarray
+                                         alts=None,  # type: ndarray
+                                         band=None  # type: int
+                                         ):  # type: (...) -> (ndarray, ndarray)
+        return self._point_calc._pixel_x_y_alt_to_lon_lat_native(pixel_xs, pixel_ys, alts, band=band)
+
+    def _pixel_x_y_alt_to_lon_lat_native_with_threshold(self,
+                                                        pixel_xs,  # type: ndarray
+                                                        pixel_ys,  # type: ndarray
+                                                        alts,  # type: ndarray
+                                                        band,  # type: int
+                                                        max_pixel_error,  # type: float
+                                                        max_iter,  # type: int
+                                                        ):  # type: (...) -> (ndarray, ndarray)
+        return self._point_calc._pixel_x_y_alt_to_lon_lat_native_with_threshold(pixel_xs, pixel_ys, alts, band,
+                                                                                max_pixel_error, max_iter)
+
+    def lon_lat_alt_to_pixel_x_y(self,
+                                 lons,  # type: ndarray
+                                 lats,  # type: ndarray
+                                 alts,  # type: ndarray
+                                 world_proj=None,  # type: Proj
+                                 band=None  # type: int
+                                 ):  # type: (...) -> (ndarray, ndarray)
+        """
+        See documentation for AbstractEarthOverheadPointCalc.  If lons and lats are 2d grids the results are
+        interpolated from an adaptively refined sparse grid, otherwise the wrapped point calculator is used directly.
+        """
+        if np.ndim(lons) != 2 or np.shape(lons)[0] < 2 or np.shape(lons)[1] < 2:
+            return self._point_calc.lon_lat_alt_to_pixel_x_y(lons, lats, alts, world_proj=world_proj, band=band)
+        if alts is None:
+            alts = 0
+        alts = np.zeros(np.shape(lons)) + alts
+
+        def project(rows, cols, alt_offsets=0):
+            return self._point_calc.lon_lat_alt_to_pixel_x_y(lons[rows, cols], lats[rows, cols],
+                                                             alts[rows, cols] + alt_offsets,
+                                                             world_proj=world_proj, band=band)
+        if (alts == alts[0, 0]).all():
+            return self._adaptive_grid_projection(project, np.shape(lons))
+        return self._adaptive_grid_projection(project, np.shape(lons), alts=alts)
+
+    def _adaptive_grid_projection(self,
+                                  project,  # type: callable
+                                  grid_shape,  # type: tuple
+                                  alts=None,  # type: ndarray
+                                  ):  # type: (...) -> (ndarray, ndarray)
+        """
+        Computes pixel locations over a 2d grid, evaluating the projection function on as few grid points as possible.
+        Cells of the sparse grid are processed one refinement level at a time.  At every level the cell corners,
+        centers and edge midpoints are projected exactly, cells whose interpolation errors at the centers and
+        edge midpoints are within the pixel tolerance are filled by bilinear interpolation, and the remaining
+        cells are split in four for the next level.  At a grid spacing of 1 every remaining grid point is
+        projected exactly.
+
+        The center and edge midpoint checks only bound the error where the pixel locations vary smoothly over a cell,
+        which is not the case when the altitudes within a cell are not planar, such as at buildings and cliffs of a
+        DEM.  When altitudes are provided, the largest deviation of the altitudes in each cell from the bilinear
+        interpolation of its corner altitudes is also computed, and the cell center is projected again with its
+        altitude offset by that deviation.  The resulting pixel shift is added to the interpolation error, so that
+        cells whose altitudes are not locally planar keep being refined.
+        :param project: function that takes 1d arrays of grid rows and columns, and optionally altitude offsets for
+        those grid points, and returns the exact pixel x and pixel y locations for those grid points
+        :param grid_shape: (ny, nx) of the grid
+        :param alts: optional 2d ndarray of the altitudes of the grid points, of dimensions grid_shape
+        :return: (pixel x, pixel y) as 2d ndarrays of dimensions grid_shape
+        """
+        ny, nx = grid_shape
+        pixels_x = np.zeros(grid_shape)
+        pixels_y = np.zeros(grid_shape)
+        known = np.zeros(grid_shape, dtype=bool)
+        filled = np.zeros(grid_shape, dtype=bool)
+
+        def project_unknown(rows, cols):
+            unknown = np.logical_not(known[rows, cols])
+            if unknown.any():
+                flat_indices = np.unique(np.ravel_multi_index((rows[unknown], cols[unknown]), grid_shape))
+                unknown_rows, unknown_cols = np.unravel_index(flat_indices, grid_shape)
+                exact_x, exact_y = project(unknown_rows, unknown_cols)
+                pixels_x[unknown_rows, unknown_cols] = exact_x
+                pixels_y[unknown_rows, unknown_cols] = exact_y
+                known[unknown_rows, unknown_cols] = True
+                filled[unknown_rows, unknown_cols] = True
+
+        spacing = self._initial_grid_spacing
+        pending = None
+        while spacing >= 1:
+            node_rows = np.minimum(np.arange(0, ny - 1 + spacing, spacing), ny - 1)
+            node_cols = np.minimum(np.arange(0, nx - 1 + spacing, spacing), nx - 1)
+            n_cell_rows = len(node_rows) - 1
+            n_cell_cols = len(node_cols) - 1
+            if pending is None:
+                pending = np.ones((n_cell_rows, n_cell_cols), dtype=bool)
+            else:
+                # each pending cell from the previous level is split into four cells
+                pending = np.repeat(np.repeat(pending, 2, axis=0), 2, axis=1)[0:n_cell_rows, 0:n_cell_cols]
+
+            cell_rows, cell_cols = np.nonzero(pending)
+            if len(cell_rows) == 0:
+                break
+            r0 = node_rows[cell_rows]
+            r1 = node_rows[cell_rows + 1]
+            c0 = node_cols[cell_cols]
+            c1 = node_cols[cell_cols + 1]
+            r_mid = (r0 + r1) // 2
+            c_mid = (c0 + c1) // 2
+
+            project_unknown(np.concatenate((r0, r0, r1, r1)), np.concatenate((c0, c1, c0, c1)))
+            if spacing == 1:
+                break
+
+            test_rows = np.array([r_mid, r0, r1, r_mid, r_mid])
+            test_cols = np.array([c_mid, c_mid, c_mid, c0, c1])
+            project_unknown(np.ravel(test_rows), np.ravel(test_cols))
+
+            max_errors = np.zeros(len(cell_rows))
+            for rows, cols in zip(test_rows, test_cols):
+                interpolated_x, interpolated_y = self._bilinear_from_corners(pixels_x, pixels_y, rows, cols,
+                                                                             r0, r1, c0, c1)
+                errors = np.maximum(np.abs(interpolated_x - pixels_x[rows, cols]),
+                                    np.abs(interpolated_y - pixels_y[rows, cols]))
+                # NaN errors are treated as failures so those cells keep being refined
+                errors[np.isnan(errors)] = np.inf
+                max_errors = np.maximum(max_errors, errors)
+            if alts is not None:
+                max_errors += self._get_alt_deviation_errors(project, alts, pixels_x, pixels_y, spacing,
+                                                             node_rows, node_cols, cell_rows, cell_cols, r_mid, c_mid)
+            accepted = max_errors <= self._max_pixel_error
+
+            # fill the grid points that belong to accepted cells, and have not already been projected or filled
+            if accepted.any():
+                accepted_cells = np.zeros((n_cell_rows, n_cell_cols), dtype=bool)
+                accepted_cells[cell_rows[accepted], cell_cols[accepted]] = True
+                grid_cell_rows = np.minimum(np.arange(ny) // spacing, n_cell_rows - 1)
+                grid_cell_cols = np.minimum(np.arange(nx) // spacing, n_cell_cols - 1)
+                to_fill = accepted_cells[grid_cell_rows][:, grid_cell_cols]
+                to_fill &= np.logical_not(filled)
+                for values in (pixels_x, pixels_y):
+                    interpolated = self._separable_bilinear(values, node_rows, node_cols,
+                                                            grid_cell_rows, grid_cell_cols)
+                    np.copyto(values, interpolated, where=to_fill)
+                filled |= to_fill
+
+            pending[cell_rows[accepted], cell_cols[accepted]] = False
+            spacing = spacing // 2
+
+        return pixels_x, pixels_y
+
+    def _get_alt_deviation_errors(self,
+                                  project,  # type: callable
+                                  alts,  # type: ndarray
+                                  pixels_x,  # type: ndarray
+                                  pixels_y,  # type: ndarray
+                                  spacing,  # type: int
+                                  node_rows,  # type: ndarray
+                                  node_cols,  # type: ndarray
+                                  cell_rows,  # type: ndarray
+                                  cell_cols,  # type: ndarray
+                                  r_mid,  # type: ndarray
+                                  c_mid,  # type: ndarray
+                                  ):  # type: (...) -> ndarray
+        """
+        Estimates the pixel error caused by the altitudes of each pending cell deviating from the bilinear
+        interpolation of the cell's corner altitudes.  The cell centers must already have been projected.
+        :return: ndarray of pixel errors, one per pending cell
+        """
+        n_cell_rows = len(node_rows) - 1
+        n_cell_cols = len(node_cols) - 1
+        ny, nx = np.shape(alts)
+        grid_cell_rows = np.minimum(np.arange(ny) // spacing, n_cell_rows - 1)
+        grid_cell_cols = np.minimum(np.arange(nx) // spacing, n_cell_cols - 1)
+        deviations = np.abs(alts - self._separable_bilinear(alts, node_rows, node_cols,
+                                                            grid_cell_rows, grid_cell_cols))
+        # NaN altitudes are treated as failures so those cells keep being refined
+        deviations[np.isnan(deviations)] = np.inf
+        cell_deviations = np.maximum.reduceat(np.maximum.reduceat(deviations, node_rows[:-1], axis=0),
+                                              node_cols[:-1], axis=1)[cell_rows, cell_cols]
+
+        errors = np.zeros(len(cell_rows))
+        errors[np.isinf(cell_deviations)] = np.inf
+        to_project = np.logical_and(cell_deviations > 0, np.isfinite(cell_deviations))
+        if to_project.any():
+            rows = r_mid[to_project]
+            cols = c_mid[to_project]
+            offset_x, offset_y = project(rows, cols, cell_deviations[to_project])
+            offset_errors = np.maximum(np.abs(offset_x - pixels_x[rows, cols]),
+                                       np.abs(offset_y - pixels_y[rows, cols]))
+            offset_errors[np.isnan(offset_errors)] = np.inf
+            errors[to_project] = offset_errors
+        return errors
+
+    @staticmethod
+    def _separable_bilinear(values,  # type: ndarray
+                            node_rows,  # type: ndarray
+                            node_cols,  # type: ndarray
+                            grid_cell_rows,  # type: ndarray
+                            grid_cell_cols,  # type: ndarray
+                            ):  # type: (...) -> ndarray
+        """
+        Bilinearly interpolates the values at the sparse grid nodes over the full grid, first along the columns of
+        the node rows, then along the rows.  Only values at nodes that have been projected are meaningful.
+        """
+        ny, nx = np.shape(values)
+        c0 = node_cols[grid_cell_cols]
+        c1 = node_cols[grid_cell_cols + 1]
+        col_weights = (np.arange(nx) - c0) / np.maximum(c1 - c0, 1)
+        node_row_values = values[node_rows]
+        left = node_row_values[:, c0]
+        right = node_row_values[:, c1]
+        interpolated_node_rows = left + (right - left) * col_weights
+        r0 = node_rows[grid_cell_rows]
+        r1 = node_rows[grid_cell_rows + 1]
+        row_weights = ((np.arange(ny) - r0) / np.maximum(r1 - r0, 1))[:, np.newaxis]
+        top = interpolated_node_rows[grid_cell_rows]
+        bottom = interpolated_node_rows[grid_cell_rows + 1]
+        return top + (bottom - top) * row_weights
+
+    @staticmethod
+    def _bilinear_from_corners(pixels_x,  # type: ndarray
+                               pixels_y,  # type: ndarray
+                               rows,  # type: ndarray
+                               cols,  # type: ndarray
+                               r0,  # type: ndarray
+                               r1,  # type: ndarray
+                               c0,  # type: ndarray
+                               c1,  # type: ndarray
+                               ):  # type: (...) -> (ndarray, ndarray)
+        row_weights = (rows - r0) / np.maximum(r1 - r0, 1)
+        col_weights = (cols - c0) / np.maximum(c1 - c0, 1)
+        interpolated = []
+        for values in (pixels_x, pixels_y):
+            top = values[r0, c0] + (values[r0, c1] - values[r0, c0]) * col_weights
+            bottom = values[r1, c0] + (values[r1, c1] - values[r1, c0]) * col_weights
+            interpolated.append(top + (bottom - top) * row_weights)
+        return interpolated[0], interpolated[1]
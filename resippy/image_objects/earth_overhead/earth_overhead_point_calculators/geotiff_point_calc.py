@@ -16,6 +16,7 @@ class GeotiffPointCalc(AbstractEarthOverheadPointCalc):
     """
 
     def __init__(self):
+        super(GeotiffPointCalc, self).__init__()
         self._geo_t = None
         self._inv_geo_t = None
         self._npix_x = None
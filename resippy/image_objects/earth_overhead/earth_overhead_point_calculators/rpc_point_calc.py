@@ -15,6 +15,7 @@ class RPCPointCalc(AbstractEarthOverheadPointCalc):
     """
 
     def __init__(self):
+        super(RPCPointCalc, self).__init__()
         self._samp_num_coeff = None      # type: ndarray
         self._samp_den_coeff = None       # type: ndarray
         self._samp_scale = None          # type: float
@@ -34,6 +35,9 @@ class RPCPointCalc(AbstractEarthOverheadPointCalc):
         self._height_scale = None        # type: float
         self._height_off = None          # type: float
 
+        self._inverse_rpc = None         # type: dict
+        self._inverse_rpc_newton_polish = True
+
         self.set_projection(crs_defs.PROJ_4326)
         self._bands_coregistered = True
 
@@ -185,6 +189,54 @@ class RPCPointCalc(AbstractEarthOverheadPointCalc):
             a15*y_squared*x + a16*x_cubed + a17*x*z_squared + a18*y_squared*z + a19*x_squared*y + a20*z_cubed
         return p
 
+    @classmethod
+    def compute_p_and_partials(cls,
+                               coeffs,       # type: ndarray
+                               x,            # type: ndarray
+                               y,            # type: ndarray
+                               z             # type: ndarray
+                               ):            # type: (...) -> (ndarray, ndarray, ndarray)
+        """
+        This method computes the same polynomial as compute_p, along with its closed-form partial derivatives with
+        respect to the normalized latitudes and longitudes.  The monomials are computed once and shared between the
+        polynomial and its derivatives, and several coefficient sets can be evaluated at once by stacking them, which
+        is considerably cheaper than estimating the derivatives with finite differences.
+        :param coeffs: coefficients for line/sample numerator/denominator to be calculated, either a single set of
+        20 coefficients, or an ndarray of shape (n_polynomials, 20)
+        :param x: normalized latitudes, calculated by (lats - lat_off)/lat_scale, as a 1d ndarray
+        :param y: normalized longitudes, calculated by (lons - lon_off)/lon_scale, as a 1d ndarray
+        :param z: normalized altitudes, calculated by (alts - height_off)/height_scale, as a 1d ndarray
+        :return: (p, dp/dx, dp/dy) as a tuple of ndarrays, each of shape (n_polynomials, n_points) if multiple
+        coefficient sets were provided
+        """
+        coeffs = np.asarray(coeffs)
+        ones = np.ones(np.shape(x))
+
+        x_squared = x*x
+        y_squared = y*y
+        z_squared = z*z
+
+        xy = x*y
+        xz = x*z
+        yz = y*z
+
+        # the term ordering matches compute_p
+        monomials = np.array([ones, y, x, z, xy, yz, xz, y_squared, x_squared, z_squared, xy*z, y_squared*y,
+                              y*x_squared, y*z_squared, y_squared*x, x_squared*x, x*z_squared, y_squared*z,
+                              x_squared*y, z_squared*z])
+
+        # only the terms with a nonzero derivative are kept
+        dx_indices = [2, 4, 6, 8, 10, 12, 14, 15, 16, 18]
+        dx_monomials = np.array([ones, y, z, 2*x, yz, 2*xy, y_squared, 3*x_squared, z_squared, 2*xy])
+
+        dy_indices = [1, 4, 5, 7, 10, 11, 12, 13, 14, 17, 18]
+        dy_monomials = np.array([ones, x, z, 2*y, xz, 3*y_squared, x_squared, z_squared, 2*xy, 2*yz, x_squared])
+
+        p = np.dot(coeffs[..., 0:20], monomials)
+        dp_dx = np.dot(np.take(coeffs, dx_indices, axis=-1), dx_monomials)
+        dp_dy = np.dot(np.take(coeffs, dy_indices, axis=-1), dy_monomials)
+        return p, dp_dx, dp_dy
+
     def _lon_lat_alt_to_pixel_x_y_native(self,
                                          lons,  # type: ndarray
                                          lats,  # type: ndarray
@@ -231,7 +283,321 @@ class RPCPointCalc(AbstractEarthOverheadPointCalc):
         :param band:
         :return:
         """
-        return None
+        return self._pixel_x_y_alt_to_lon_lat_native_with_threshold(x_pixels, y_pixels, alts, band, 0.001, 20)
+
+    def _pixel_x_y_alt_to_lon_lat_native_with_threshold(self,
+                                                        x_pixels,  # type: ndarray
+                                                        y_pixels,  # type: ndarray
+                                                        alts,  # type: ndarray
+                                                        band,  # type: int
+                                                        max_pixel_error,  # type: float
+                                                        max_iter,  # type: int
+                                                        ):  # type: (...) -> (ndarray, ndarray)
+        """
+        See documentation in AbstractEarthOverheadPointCalc.  The threshold and iteration limit are used by the Newton
+        inverse, and by the Newton polish of the fitted inverse RPC.
+        """
+        if self._inverse_rpc is None:
+            return self._pixel_x_y_alt_to_lon_lat_newton(x_pixels, y_pixels, alts, max_pixel_error=max_pixel_error,
+                                                         max_iter=max_iter)
+        lons, lats = self.compute_inverse_rpc(x_pixels, y_pixels, alts)
+        if self._inverse_rpc_newton_polish:
+            lons, lats = self._pixel_x_y_alt_to_lon_lat_newton(x_pixels, y_pixels, alts,
+                                                               max_pixel_error=max_pixel_error, max_iter=max_iter,
+                                                               initial_lons=lons, initial_lats=lats)
+        return lons, lats
+
+    def _pixel_x_y_alt_to_lon_lat_newton(self,
+                                         x_pixels,  # type: ndarray
+                                         y_pixels,  # type: ndarray
+                                         alts=None,  # type: ndarray
+                                         max_pixel_error=0.001,  # type: float
+                                         max_iter=20,  # type: int
+                                         initial_lons=None,  # type: ndarray
+                                         initial_lats=None,  # type: ndarray
+                                         ):  # type: (...) -> (ndarray, ndarray)
+        """
+        Inverts the RPC model with a vectorized Newton method, using the analytic partial derivatives from
+        compute_p_and_partials.  The solve is done in normalized coordinates starting from the RPC offsets, unless
+        an initial estimate is provided, and only points that have not yet converged are updated on each iteration.
+        RPCs are close to linear over the image domain, so this typically converges within a few iterations.
+        :param x_pixels: x pixels, as a float or 1d or 2d numpy ndarray
+        :param y_pixels: y pixels, as a float or 1d or 2d numpy ndarray
+        :param alts: altitudes, as a float or a numpy ndarray with the same dimensions as x_pixels.  Defaults to 0
+        :param max_pixel_error: convergence threshold, in pixels.  Defaults to 0.001 pixels
+        :param max_iter: maximum number of Newton iterations.  Defaults to 20
+        :param initial_lons: optional initial longitude estimates, with the same dimensions as x_pixels
+        :param initial_lats: optional initial latitude estimates, with the same dimensions as x_pixels
+        :return: (longitudes, latitudes) with the same dimensions as x_pixels
+        """
+        if alts is None:
+            alts = 0
+        n_pixels = np.shape(x_pixels)
+
+        samp_targets = (np.ravel(x_pixels) - self._samp_off - 0.5) / self._samp_scale
+        line_targets = (np.ravel(y_pixels) - self._line_off - 0.5) / self._line_scale
+        z = np.ravel((np.zeros(n_pixels) + alts - self._height_off) / self._height_scale)
+
+        x = np.zeros(np.shape(samp_targets))
+        y = np.zeros(np.shape(samp_targets))
+        start_at_origin = initial_lons is None or initial_lats is None
+        if not start_at_origin:
+            x = x + (np.ravel(initial_lats) - self._lat_off) / self._lat_scale
+            y = y + (np.ravel(initial_lons) - self._lon_off) / self._lon_scale
+
+        samp_tolerance = max_pixel_error / np.abs(self._samp_scale)
+        line_tolerance = max_pixel_error / np.abs(self._line_scale)
+
+        all_coeffs = np.array([self._samp_num_coeff, self._samp_den_coeff,
+                               self._line_num_coeff, self._line_den_coeff])
+
+        # the unconverged points are kept in compacted arrays, and written back to x and y once they converge
+        active = np.arange(len(x))
+        active_x = x.copy()
+        active_y = y.copy()
+        for i in range(max_iter):
+            if i == 0 and start_at_origin:
+                # every estimate starts at the origin, where only the height terms of the polynomials are nonzero
+                z_squared = z*z
+                p = all_coeffs[:, [0]] + all_coeffs[:, [3]]*z + all_coeffs[:, [9]]*z_squared + \
+                    all_coeffs[:, [19]]*z_squared*z
+                p_dx = all_coeffs[:, [2]] + all_coeffs[:, [6]]*z + all_coeffs[:, [16]]*z_squared
+                p_dy = all_coeffs[:, [1]] + all_coeffs[:, [5]]*z + all_coeffs[:, [13]]*z_squared
+            else:
+                p, p_dx, p_dy = self.compute_p_and_partials(all_coeffs, active_x, active_y, z)
+
+            samp_errors = samp_targets - p[0] / p[1]
+            line_errors = line_targets - p[2] / p[3]
+
+            converged = np.logical_and(np.abs(samp_errors) <= samp_tolerance, np.abs(line_errors) <= line_tolerance)
+            if converged.any():
+                x[active[converged]] = active_x[converged]
+                y[active[converged]] = active_y[converged]
+                not_converged = np.logical_not(converged)
+                active = active[not_converged]
+                if len(active) == 0:
+                    break
+                active_x, active_y, z = active_x[not_converged], active_y[not_converged], z[not_converged]
+                samp_targets, line_targets = samp_targets[not_converged], line_targets[not_converged]
+                samp_errors, line_errors = samp_errors[not_converged], line_errors[not_converged]
+                p, p_dx, p_dy = p[:, not_converged], p_dx[:, not_converged], p_dy[:, not_converged]
+
+            # quotient rule for the jacobian of the normalized (sample, line) with respect to normalized (x, y)
+            samp_den_squared = p[1] * p[1]
+            line_den_squared = p[3] * p[3]
+            samp_dx = (p_dx[0] * p[1] - p[0] * p_dx[1]) / samp_den_squared
+            samp_dy = (p_dy[0] * p[1] - p[0] * p_dy[1]) / samp_den_squared
+            line_dx = (p_dx[2] * p[3] - p[2] * p_dx[3]) / line_den_squared
+            line_dy = (p_dy[2] * p[3] - p[2] * p_dy[3]) / line_den_squared
+
+            determinant = samp_dx * line_dy - samp_dy * line_dx
+            active_x = active_x + (samp_errors * line_dy - line_errors * samp_dy) / determinant
+            active_y = active_y + (line_errors * samp_dx - samp_errors * line_dx) / determinant
+        else:
+            # points that did not converge within max_iter keep their last estimate
+            x[active] = active_x
+            y[active] = active_y
+
+        lats = np.reshape(x * self._lat_scale + self._lat_off, n_pixels)[()]
+        lons = np.reshape(y * self._lon_scale + self._lon_off, n_pixels)[()]
+        return lons, lats
+
+    def fit_inverse_rpc(self,
+                        n_samples=21,  # type: int
+                        n_lines=21,  # type: int
+                        n_heights=7,  # type: int
+                        ):  # type: (...) -> dict
+        """
+        Fits a set of inverse rational polynomials that map (sample, line, height) to (longitude, latitude) over the
+        RPC's valid domain, which is the range covered by the sample, line and height offsets and scales.  The
+        inverse uses the same 20-term polynomials as the forward model, with x as the normalized line, y as the
+        normalized sample and z as the normalized height.  The fit is done with linear least squares on a grid of
+        points solved with the Newton inverse.  Fit errors are measured on a second grid that is offset from the
+        fitting grid by half a cell, by projecting the fitted locations back into the image.
+        Once fitted, the inverse RPC is cached on the point calculator and used by pixel_x_y_alt_to_lon_lat.
+        :param n_samples: number of fitting grid points in the sample direction.  Defaults to 21
+        :param n_lines: number of fitting grid points in the line direction.  Defaults to 21
+        :param n_heights: number of fitting grid points in the height direction.  Defaults to 7
+        :return: dictionary of fit error statistics, in pixels
+        """
+        samps_normalized, lines_normalized, heights_normalized = \
+            [np.ravel(arr) for arr in np.meshgrid(np.linspace(-1, 1, n_samples),
+                                                  np.linspace(-1, 1, n_lines),
+                                                  np.linspace(-1, 1, n_heights))]
+        x_pixels, y_pixels, alts = self._denormalize_samp_line_height(samps_normalized, lines_normalized,
+                                                                      heights_normalized)
+        lons, lats = self._pixel_x_y_alt_to_lon_lat_newton(x_pixels, y_pixels, alts)
+
+        lats_normalized = (lats - self._lat_off) / self._lat_scale
+        lons_normalized = (lons - self._lon_off) / self._lon_scale
+        lat_num_coeff, lat_den_coeff = self._fit_rational_polynomial(lats_normalized, lines_normalized,
+                                                                     samps_normalized, heights_normalized)
+        lon_num_coeff, lon_den_coeff = self._fit_rational_polynomial(lons_normalized, lines_normalized,
+                                                                     samps_normalized, heights_normalized)
+        inverse_rpc = {"lat_num_coeff": lat_num_coeff,
+                       "lat_den_coeff": lat_den_coeff,
+                       "lon_num_coeff": lon_num_coeff,
+                       "lon_den_coeff": lon_den_coeff}
+        self.set_inverse_rpc(inverse_rpc)
+
+        # measure the fit errors between the fitting grid points
+        samp_step = 1.0 / (n_samples - 1)
+        line_step = 1.0 / (n_lines - 1)
+        height_step = 1.0 / max(n_heights - 1, 1)
+        check_samps, check_lines, check_heights = \
+            [np.ravel(arr) for arr in np.meshgrid(np.linspace(-1 + samp_step, 1 - samp_step, n_samples - 1),
+                                                  np.linspace(-1 + line_step, 1 - line_step, n_lines - 1),
+                                                  np.linspace(-1 + height_step, 1 - height_step,
+                                                              max(n_heights - 1, 1)))]
+        check_x_pixels, check_y_pixels, check_alts = self._denormalize_samp_line_height(check_samps, check_lines,
+                                                                                        check_heights)
+        fitted_lons, fitted_lats = self.compute_inverse_rpc(check_x_pixels, check_y_pixels, check_alts)
+        fitted_x_pixels, fitted_y_pixels = self._lon_lat_alt_to_pixel_x_y_native(fitted_lons, fitted_lats,
+                                                                                 check_alts)
+        pixel_errors = np.sqrt(np.square(fitted_x_pixels - check_x_pixels) +
+                               np.square(fitted_y_pixels - check_y_pixels))
+        inverse_rpc["fit_errors"] = {"max_pixel_error": float(np.max(pixel_errors)),
+                                     "mean_pixel_error": float(np.mean(pixel_errors)),
+                                     "rms_pixel_error": float(np.sqrt(np.mean(np.square(pixel_errors))))}
+        return inverse_rpc["fit_errors"]
+
+    def compute_inverse_rpc(self,
+                            x_pixels,  # type: ndarray
+                            y_pixels,  # type: ndarray
+                            alts=None,  # type: ndarray
+                            ):  # type: (...) -> (ndarray, ndarray)
+        """
+        Evaluates the fitted inverse RPC.  fit_inverse_rpc or set_inverse_rpc must be called before using this method.
+        :param x_pixels: x pixels, as a float or 1d or 2d numpy ndarray
+        :param y_pixels: y pixels, as a float or 1d or 2d numpy ndarray
+        :param alts: altitudes, as a float or a numpy ndarray with the same dimensions as x_pixels.  Defaults to 0
+        :return: (longitudes, latitudes) with the same dimensions as x_pixels
+        """
+        if alts is None:
+            alts = 0
+        n_pixels = np.shape(x_pixels)
+        samps_normalized = (np.ravel(x_pixels) - self._samp_off - 0.5) / self._samp_scale
+        lines_normalized = (np.ravel(y_pixels) - self._line_off - 0.5) / self._line_scale
+        heights_normalized = np.ravel((np.zeros(n_pixels) + alts - self._height_off) / self._height_scale)
+
+        all_coeffs = np.array([self._inverse_rpc["lat_num_coeff"], self._inverse_rpc["lat_den_coeff"],
+                               self._inverse_rpc["lon_num_coeff"], self._inverse_rpc["lon_den_coeff"]])
+        p, _, _ = self.compute_p_and_partials(all_coeffs, lines_normalized, samps_normalized, heights_normalized)
+
+        lats = np.reshape(p[0] / p[1] * self._lat_scale + self._lat_off, n_pixels)[()]
+        lons = np.reshape(p[2] / p[3] * self._lon_scale + self._lon_off, n_pixels)[()]
+        return lons, lats
+
+    def get_inverse_rpc(self):  # type: (...) -> dict
+        """
+        Returns the cached inverse RPC, or None if one has not been fitted or loaded
+        :return: dictionary with the inverse RPC coefficients, and the fit errors under the 'fit_errors' key
+        """
+        return self._inverse_rpc
+
+    def set_inverse_rpc(self,
+                        inverse_rpc  # type: dict
+                        ):  # type: (...) -> None
+        """
+        Sets the cached inverse RPC.  Setting it to None will make pixel_x_y_alt_to_lon_lat use the Newton inverse.
+        :param inverse_rpc: dictionary with 'lat_num_coeff', 'lat_den_coeff', 'lon_num_coeff' and 'lon_den_coeff' keys
+        :return: None
+        """
+        self._inverse_rpc = inverse_rpc
+
+    def get_inverse_rpc_fit_errors(self):  # type: (...) -> dict
+        """
+        Returns the fit error statistics of the cached inverse RPC, in pixels
+        :return: dictionary of fit error statistics, or None if they are not available
+        """
+        if self._inverse_rpc is None:
+            return None
+        return self._inverse_rpc.get("fit_errors")
+
+    def set_inverse_rpc_newton_polish(self,
+                                      newton_polish  # type: bool
+                                      ):  # type: (...) -> None
+        """
+        Sets whether results from the inverse RPC are refined with the Newton inverse.  The polish step starts from
+        the inverse RPC's estimates, so it usually only needs a single forward evaluation to confirm convergence.
+        This is True by default.
+        :param newton_polish: True to polish inverse RPC results, False to return them directly
+        :return: None
+        """
+        self._inverse_rpc_newton_polish = newton_polish
+
+    def save_inverse_rpc(self,
+                         fname  # type: str
+                         ):  # type: (...) -> None
+        """
+        Saves the cached inverse RPC and its fit errors to a numpy .npz file
+        :param fname: output filename
+        :return: None
+        """
+        arrays = {key: val for key, val in self._inverse_rpc.items() if key != "fit_errors"}
+        fit_errors = self.get_inverse_rpc_fit_errors() or {}
+        for key, val in fit_errors.items():
+            arrays["fit_errors_" + key] = val
+        np.savez(fname, **arrays)
+
+    def load_inverse_rpc(self,
+                         fname  # type: str
+                         ):  # type: (...) -> None
+        """
+        Loads an inverse RPC that was saved with save_inverse_rpc and caches it on the point calculator.
+        :param fname: filename of the saved inverse RPC
+        :return: None
+        """
+        inverse_rpc = {}
+        fit_errors = {}
+        with np.load(fname) as npz:
+            for key in npz.files:
+                if key.startswith("fit_errors_"):
+                    fit_errors[key[len("fit_errors_"):]] = float(npz[key])
+                else:
+                    inverse_rpc[key] = npz[key]
+        if fit_errors:
+            inverse_rpc["fit_errors"] = fit_errors
+        self.set_inverse_rpc(inverse_rpc)
+
+    def _denormalize_samp_line_height(self,
+                                      samps_normalized,  # type: ndarray
+                                      lines_normalized,  # type: ndarray
+                                      heights_normalized  # type: ndarray
+                                      ):  # type: (...) -> (ndarray, ndarray, ndarray)
+        x_pixels = samps_normalized * self._samp_scale + self._samp_off + 0.5
+        y_pixels = lines_normalized * self._line_scale + self._line_off + 0.5
+        alts = heights_normalized * self._height_scale + self._height_off
+        return x_pixels, y_pixels, alts
+
+    @classmethod
+    def _fit_rational_polynomial(cls,
+                                 targets,  # type: ndarray
+                                 x,  # type: ndarray
+                                 y,  # type: ndarray
+                                 z,  # type: ndarray
+                                 regularization=1e-6  # type: float
+                                 ):  # type: (...) -> (ndarray, ndarray)
+        """
+        Fits numerator and denominator coefficients so that compute_p(num, x, y, z) / compute_p(den, x, y, z)
+        approximates the targets.  The first denominator coefficient is fixed to 1, and the problem is linearized as
+        num . m - targets * (den[1:] . m[1:]) = targets, where m are the polynomial terms.  A small ridge penalty is
+        applied to the denominator coefficients, without it the fit can place poles inside the fitting domain.
+        :return: (numerator coefficients, denominator coefficients)
+        """
+        identity = np.eye(20)
+        monomials = np.array([cls.compute_p(identity[i], x, y, z) for i in range(20)]).transpose()
+        design_matrix = np.concatenate((monomials, -targets[:, np.newaxis] * monomials[:, 1:]), axis=1)
+
+        ridge_rows = np.zeros((19, 39))
+        ridge_rows[:, 20:] = np.eye(19) * np.sqrt(regularization * len(targets))
+        design_matrix = np.concatenate((design_matrix, ridge_rows), axis=0)
+        observations = np.concatenate((targets, np.zeros(19)))
+
+        solution = np.linalg.lstsq(design_matrix, observations, rcond=None)[0]
+        num_coeff = solution[0:20]
+        den_coeff = np.concatenate(([1.0], solution[20:]))
+        return num_coeff, den_coeff
 
     @staticmethod
     def _str_to_numpy_arr(string_entry,     # type: str
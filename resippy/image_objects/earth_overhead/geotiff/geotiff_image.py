@@ -1,5 +1,8 @@
 from __future__ import division
 
+import os
+from typing import Iterable, Union
+
 import gdal
 import numpy as np
 import osr
@@ -10,6 +13,10 @@ from pyproj import Proj
 from resippy.image_objects.earth_overhead.abstract_earth_overhead_image import AbstractEarthOverheadImage
 from resippy.image_objects.earth_overhead.geotiff.geotiff_metadata import GeotiffMetadata
 from resippy.image_objects.earth_overhead.geotiff.geotiff_point_calc import GeotiffPointCalc
+import resippy.utils.image_utils.image_utils as image_utils
+
+# width and height of the internal tiles of written geotiffs
+DEFAULT_GTIFF_BLOCK_SIZE = 256
 
 
 class GeotiffImage(AbstractEarthOverheadImage):
@@ -85,12 +92,17 @@ class GeotiffImage(AbstractEarthOverheadImage):
     def get_dset(self):  # type: (...) -> gdal.Dataset
         return self._dset
 
-    def read_all_image_data_from_disk(self):  # type: (...) -> ndarray
-        numpy_arr = []
-        for bandnum in range(self.get_metadata().get_n_bands()):
-            band = self._dset.GetRasterBand(bandnum + 1)
-            numpy_arr.append(band.ReadAsArray())
-        return np.stack(numpy_arr, axis=2)
+    def read_all_image_data_from_disk(self,
+                                      workers=None,  # type: int
+                                      interleaved=False,  # type: bool
+                                      ):  # type: (...) -> ndarray
+        """
+        Reads all image data from disk into a single preallocated array
+        :param workers: number of threads used to read bands concurrently, see image_utils.gdal_read_all_bands
+        :param interleaved: if True the bands are read with a single band-interleaved read of the dataset
+        :return: ndarray containing image data of dimensions (ny, nx, nbands)
+        """
+        return image_utils.gdal_read_all_bands(self._dset, workers=workers, interleaved=interleaved)
 
     def read_band_from_disk(self,
                             band_number  # type: int
@@ -98,6 +110,19 @@ class GeotiffImage(AbstractEarthOverheadImage):
         band = self._dset.GetRasterBand(band_number + 1)
         return band.ReadAsArray()
 
+    def read_window_from_disk(self,
+                              bands,  # type: list
+                              x_offset,  # type: int
+                              y_offset,  # type: int
+                              nx,  # type: int
+                              ny  # type: int
+                              ):  # type: (...) -> ndarray
+        numpy_arr = []
+        for bandnum in bands:
+            band = self._dset.GetRasterBand(bandnum + 1)
+            numpy_arr.append(band.ReadAsArray(x_offset, y_offset, nx, ny))
+        return np.stack(numpy_arr, axis=2)
+
     def get_gdal_mem_datset(self):  # type: (...) -> gdal.Dataset
         driver = gdal.GetDriverByName('MEM')
         dtype = self.get_metadata().get_gdal_datatype()
@@ -110,39 +135,215 @@ class GeotiffImage(AbstractEarthOverheadImage):
 
         dataset.SetGeoTransform(self.get_point_calculator().get_geot())
         dataset.SetProjection(self.get_point_calculator().get_gdal_projection_wkt())
-        if self.get_image_data() is None:
-            self.set_image_data(self.read_all_image_data_from_disk())
         for band in range(self.get_metadata().get_n_bands()):
-            dataset.GetRasterBand(band + 1).WriteArray(self.get_image_band(band))
+            dataset.GetRasterBand(band + 1).WriteArray(self.read_band(band))
             if self.get_metadata().get_nodata_val() is not None:
                 dataset.GetRasterBand(band + 1).SetNoDataValue(int(self.get_metadata().get_nodata_val()))
         return dataset
 
     def write_to_disk(self,
                       fname,  # type: str
-                      compression="LZW"  # type: str
+                      compression="LZW",  # type: str
+                      predictor=None,  # type: int
+                      compression_level=None,  # type: int
+                      num_threads=None,  # type: Union[int, str]
+                      bigtiff="IF_SAFER",  # type: str
+                      block_size=DEFAULT_GTIFF_BLOCK_SIZE,  # type: int
                       ):  # type: (...) -> None
+        """
+        Writes the image to a tiled geotiff.  Image data is streamed from the image object in strips of block_size
+        rows using read_window, so images that are only on disk are never fully loaded into memory.
+        See get_gtiff_creation_options for a description of the compression options.
+        :param fname: output filename
+        :param compression: GDAL compression method
+        :param predictor: GDAL predictor
+        :param compression_level: DEFLATE or ZSTD compression level
+        :param num_threads: number of threads used by GDAL to compress blocks
+        :param bigtiff: GDAL BIGTIFF creation option
+        :param block_size: size of the geotiff's internal tiles, and number of rows per streamed strip
+        :return: None
+        """
+        npix_x = self.get_metadata().get_npix_x()
+        npix_y = self.get_metadata().get_npix_y()
+        strips = ((0, y_offset, self.read_window(None, 0, y_offset, npix_x, min(block_size, npix_y - y_offset)))
+                  for y_offset in range(0, npix_y, block_size))
+        self.write_tiles_to_disk(fname, strips, npix_x, npix_y, self.get_metadata().get_n_bands(),
+                                 self.get_metadata().get_gdal_datatype(), self.get_point_calculator().get_geot(),
+                                 self.get_point_calculator().get_projection(),
+                                 nodata_val=self.get_metadata().get_nodata_val(), compression=compression,
+                                 predictor=predictor, compression_level=compression_level, num_threads=num_threads,
+                                 bigtiff=bigtiff, block_size=block_size, open_output=False)
+
+    def write_cog_to_disk(self,
+                          fname,  # type: str
+                          overview_resampling="AVERAGE",  # type: str
+                          overview_levels=None,  # type: list
+                          compression="DEFLATE",  # type: str
+                          predictor=None,  # type: int
+                          compression_level=None,  # type: int
+                          num_threads=None,  # type: Union[int, str]
+                          bigtiff="IF_SAFER",  # type: str
+                          block_size=512,  # type: int
+                          ):  # type: (...) -> None
+        """
+        Writes the image as a cloud optimized geotiff: a tiled geotiff with internal overviews, whose image file
+        directories are all at the start of the file, followed by the overviews from the smallest to full resolution.
+        Viewers can then read any zoom level of any region with a few range requests.
+        The image is first streamed to a temporary tiled geotiff next to fname, overviews are built block by block by
+        GDAL in the temporary file, and the result is copied to fname with GDAL's COPY_SRC_OVERVIEWS layout.  This
+        only uses the GTiff driver, so it also works with GDAL versions that do not have the COG driver.
+        See get_gtiff_creation_options for a description of the compression options.
+        :param fname: output filename
+        :param overview_resampling: GDAL overview resampling method, such as "AVERAGE", "NEAREST", "GAUSS", "CUBIC" or
+        "MODE".  "NEAREST" or "MODE" should be used for classification maps
+        :param overview_levels: list of overview decimation factors.  Defaults to powers of 2, up to the first level
+        that fits in a single block
+        :param compression: GDAL compression method
+        :param predictor: GDAL predictor
+        :param compression_level: DEFLATE or ZSTD compression level
+        :param num_threads: number of threads used by GDAL to compress blocks
+        :param bigtiff: GDAL BIGTIFF creation option
+        :param block_size: size of the internal tiles of the image and of its overviews
+        :return: None
+        """
+        npix_x = self.get_metadata().get_npix_x()
+        npix_y = self.get_metadata().get_npix_y()
+        if overview_levels is None:
+            overview_levels = []
+            while max(npix_x, npix_y) / 2 ** len(overview_levels) > block_size:
+                overview_levels.append(2 ** (len(overview_levels) + 1))
+
+        tmp_fname = fname + ".tmp.tif"
+        previous_ovr_blocksize = gdal.GetConfigOption("GDAL_TIFF_OVR_BLOCKSIZE")
+        try:
+            self.write_to_disk(tmp_fname, compression=compression, predictor=predictor,
+                               compression_level=compression_level, num_threads=num_threads, bigtiff=bigtiff,
+                               block_size=block_size)
+            tmp_dataset = gdal.Open(tmp_fname, gdal.GA_Update)
+            if len(overview_levels) > 0:
+                gdal.SetConfigOption("GDAL_TIFF_OVR_BLOCKSIZE", str(block_size))
+                tmp_dataset.BuildOverviews(overview_resampling, overview_levels)
+            ops = self.get_gtiff_creation_options(compression=compression, predictor=predictor,
+                                                  compression_level=compression_level, num_threads=num_threads,
+                                                  bigtiff=bigtiff, block_size=block_size)
+            dataset = gdal.GetDriverByName('GTiff').CreateCopy(fname, tmp_dataset,
+                                                               options=ops + ["COPY_SRC_OVERVIEWS=YES"])
+        finally:
+            # close the datasets before removing the temporary file, also when building overviews or copying failed
+            dataset = None
+            tmp_dataset = None
+            gdal.SetConfigOption("GDAL_TIFF_OVR_BLOCKSIZE", previous_ovr_blocksize)
+            if os.path.exists(tmp_fname):
+                os.remove(tmp_fname)
+
+    @staticmethod
+    def get_gtiff_creation_options(compression="LZW",  # type: str
+                                   predictor=None,  # type: int
+                                   compression_level=None,  # type: int
+                                   num_threads=None,  # type: Union[int, str]
+                                   bigtiff="IF_SAFER",  # type: str
+                                   block_size=DEFAULT_GTIFF_BLOCK_SIZE,  # type: int
+                                   ):  # type: (...) -> list
+        """
+        Creates the GDAL creation options of a band interleaved, tiled geotiff
+        :param compression: GDAL compression method, such as "LZW", "DEFLATE", "ZSTD" or "NONE"
+        :param predictor: GDAL predictor, 2 for horizontal differencing of integer data, 3 for floating point data.
+        Predictors usually improve the compression ratio of LZW, DEFLATE and ZSTD considerably
+        :param compression_level: compression level, only supported for DEFLATE (1-9) and ZSTD (1-22) compression
+        :param num_threads: number of threads used by GDAL to compress blocks, or "ALL_CPUS"
+        :param bigtiff: GDAL BIGTIFF creation option, one of "YES", "NO", "IF_NEEDED" or "IF_SAFER"
+        :param block_size: width and height of the internal tiles, should be a multiple of 16
+        :return: list of GDAL creation options
+        """
+        ops = ['COMPRESS=' + compression, "INTERLEAVE=BAND", "TILED=YES", "BLOCKXSIZE=" + str(block_size),
+               "BLOCKYSIZE=" + str(block_size), "BIGTIFF=" + bigtiff]
+        if predictor is not None:
+            ops.append("PREDICTOR=" + str(predictor))
+        if compression_level is not None:
+            if compression.upper() == "DEFLATE":
+                ops.append("ZLEVEL=" + str(compression_level))
+            elif compression.upper() == "ZSTD":
+                ops.append("ZSTD_LEVEL=" + str(compression_level))
+            else:
+                raise ValueError("compression levels are only supported for DEFLATE and ZSTD compression")
+        if num_threads is not None:
+            ops.append("NUM_THREADS=" + str(num_threads))
+        return ops
+
+    @staticmethod
+    def write_tiles_to_disk(fname,  # type: str
+                            tiles,  # type: Iterable[tuple]
+                            npix_x,  # type: int
+                            npix_y,  # type: int
+                            n_bands,  # type: int
+                            gdal_datatype,  # type: int
+                            geo_t,  # type: list
+                            projection,  # type: Proj
+                            nodata_val=None,  # type: float
+                            alpha_band=False,  # type: bool
+                            compression="LZW",  # type: str
+                            predictor=None,  # type: int
+                            compression_level=None,  # type: int
+                            num_threads=None,  # type: Union[int, str]
+                            bigtiff="IF_SAFER",  # type: str
+                            block_size=DEFAULT_GTIFF_BLOCK_SIZE,  # type: int
+                            open_output=True,  # type: bool
+                            ):  # type: (...) -> GeotiffImage
+        """
+        Writes a geotiff from an iterable of tiles, so that products can be written while they are still being
+        computed.  Only the tile being written is held in memory.  Tiles can be any rectangular window of the image,
+        writing tiles that are aligned with block_size avoids recompressing partially written blocks.
+        See get_gtiff_creation_options for a description of the compression options.
+        :param fname: output filename
+        :param tiles: iterable of (x_offset, y_offset, tile_data) or (x_offset, y_offset, tile_data, bands) tuples.
+        tile_data is an ndarray of dimensions (ny, nx, nbands), or (ny, nx) for a single band.  bands is the list of
+        zero-based output bands that the bands of tile_data are written to, by default all bands are written.
+        :param npix_x: number of x pixels in the output image
+        :param npix_y: number of y pixels in the output image
+        :param n_bands: number of bands in the output image
+        :param gdal_datatype: GDAL datatype of the output image
+        :param geo_t: geo transform of the output image
+        :param projection: projection of the output image
+        :param nodata_val: nodata value of the output image bands
+        :param alpha_band: if True the last band is an alpha band, and does not get the nodata value
+        :param compression: GDAL compression method
+        :param predictor: GDAL predictor
+        :param compression_level: DEFLATE or ZSTD compression level
+        :param num_threads: number of threads used by GDAL to compress blocks
+        :param bigtiff: GDAL BIGTIFF creation option
+        :param block_size: size of the geotiff's internal tiles
+        :param open_output: if True the written geotiff is opened and returned
+        :return: the written image as a GeotiffImage if open_output is True, otherwise None
+        """
+        ops = GeotiffImage.get_gtiff_creation_options(compression=compression, predictor=predictor,
+                                                      compression_level=compression_level, num_threads=num_threads,
+                                                      bigtiff=bigtiff, block_size=block_size)
+        output_point_calc = GeotiffPointCalc()
+        output_point_calc.set_projection(projection)
         driver = gdal.GetDriverByName('GTiff')
-        dtype = self.get_metadata().get_gdal_datatype()
-        ops = ['COMPRESS=' + compression, "INTERLEAVE=BAND", "TILED=YES"]
-        dataset = driver.Create(
-            fname,
-            self.get_metadata().get_npix_x(),
-            self.get_metadata().get_npix_y(),
-            self.get_metadata().get_n_bands(),
-            dtype,
-            ops)
-        dataset.SetGeoTransform(self.get_point_calculator().get_geot())
-        dataset.SetProjection(self.get_point_calculator().get_gdal_projection_wkt())
-        if self.get_image_data() is None:
-            self.set_image_data(self.read_all_image_data_from_disk())
-        for band in range(self.get_metadata().get_n_bands()):
-            dataset.GetRasterBand(band + 1).WriteArray(self.get_image_band(band))
-            if self.get_metadata().get_nodata_val() is not None:
-                dataset.GetRasterBand(band + 1).SetNoDataValue(int(self.get_metadata().get_nodata_val()))
+        dataset = driver.Create(fname, npix_x, npix_y, n_bands, gdal_datatype, ops)
+        dataset.SetGeoTransform(geo_t)
+        dataset.SetProjection(output_point_calc.get_gdal_projection_wkt())
+        if nodata_val is not None:
+            for band in range(n_bands - 1 if alpha_band else n_bands):
+                dataset.GetRasterBand(band + 1).SetNoDataValue(float(nodata_val))
+
+        for tile in tiles:
+            x_offset, y_offset, tile_data = tile[0], tile[1], tile[2]
+            if np.ndim(tile_data) == 2:
+                tile_data = np.expand_dims(tile_data, axis=2)
+            tile_bands = tile[3] if len(tile) > 3 else range(n_bands)
+            for i, band in enumerate(tile_bands):
+                dataset.GetRasterBand(band + 1).WriteArray(tile_data[:, :, i], int(x_offset), int(y_offset))
         dataset.FlushCache()
         dataset = None
 
+        if not open_output:
+            return None
+        gtiff_image = GeotiffImage.init_from_file(fname)
+        gtiff_image.get_metadata().set_nodata_val(nodata_val)
+        return gtiff_image
+
     @staticmethod
     def gdalwarp_geotiff_image(image,           # type: GeotiffImage
                                warp_ops,        # type: gdal.WarpOptions
@@ -186,6 +387,7 @@ class GeotiffImage(AbstractEarthOverheadImage):
         gdal2tiles.generate_tiles(mem_fname, out_dir)
 
     def close_image(self):  # type: (...) -> None
+        super(GeotiffImage, self).close_image()
         self._dset = None
 
     def __del__(self):
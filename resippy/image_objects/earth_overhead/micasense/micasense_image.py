@@ -1,5 +1,6 @@
 from __future__ import division
 
+import gdal
 from numpy import ndarray
 import numpy as np
 from imageio import imread
@@ -14,6 +15,8 @@ class MicasenseImage(AbstractEarthOverheadImage):
     def __init__(self):
         super(MicasenseImage, self).__init__()
         self.band_fnames = []
+        # GDAL datasets of the band files, opened the first time a window is read from a band
+        self._band_dsets = {}
 
     def read_all_image_data_from_disk(self):  # type: (...) -> ndarray
         imgs = [imread(fname) for fname in self.band_fnames]
@@ -26,6 +29,38 @@ class MicasenseImage(AbstractEarthOverheadImage):
                             ):              # type: (...) -> ndarray
         return imread(self.band_fnames[band_number])
 
+    def read_window_from_disk(self,
+                              bands,        # type: list
+                              x_offset,     # type: int
+                              y_offset,     # type: int
+                              nx,           # type: int
+                              ny            # type: int
+                              ):            # type: (...) -> ndarray
+        # each band is a separate tiff, GDAL is used to read the windows without decoding the whole file
+        numpy_arr = []
+        for band_number in bands:
+            dset = self._get_band_dset(band_number)
+            numpy_arr.append(dset.GetRasterBand(1).ReadAsArray(x_offset, y_offset, nx, ny))
+        return np.stack(numpy_arr, axis=2)
+
+    def _get_band_dset(self,
+                       band_number  # type: int
+                       ):  # type: (...) -> gdal.Dataset
+        """
+        Returns the GDAL dataset of a band file, opening it the first time it is needed.  Datasets are kept open until
+        the image is closed, so that reading many windows does not reopen the band files.
+        """
+        if band_number not in self._band_dsets:
+            self._band_dsets[band_number] = gdal.Open(self.band_fnames[band_number], gdal.GA_ReadOnly)
+        return self._band_dsets[band_number]
+
+    def close_image(self):  # type: (...) -> None
+        super(MicasenseImage, self).close_image()
+        self._band_dsets = {}
+
+    def __del__(self):
+        self._band_dsets = {}
+
     def get_gps_timestamp_and_center(self,
                                      band_number    # type: int
                                      ):             # type: (...) -> dict
@@ -29,6 +29,21 @@ class PhysicalCameraImage(AbstractEarthOverheadImage):
             band = self._dset.GetRasterBand(band_number + 1)
         return band.ReadAsArray()
 
+    def read_window_from_disk(self,
+                              bands,        # type: list
+                              x_offset,     # type: int
+                              y_offset,     # type: int
+                              nx,           # type: int
+                              ny            # type: int
+                              ):            # type: (...) -> ndarray
+        if not self.read_with_gdal:
+            return super(PhysicalCameraImage, self).read_window_from_disk(bands, x_offset, y_offset, nx, ny)
+        numpy_arr = []
+        for bandnum in bands:
+            band = self._dset.GetRasterBand(bandnum + 1)
+            numpy_arr.append(band.ReadAsArray(x_offset, y_offset, nx, ny))
+        return np.stack(numpy_arr, axis=2)
+
     def set_gdal_dset(self,
                       dset  # type: gdal.Dataset
                       ):   # type: (...) -> None
@@ -2,6 +2,7 @@ from __future__ import division
 
 from resippy.image_objects.abstract_image import AbstractImage
 from resippy.image_objects.envi.envi_metadata import EnviMetadata
+import resippy.utils.image_utils.image_utils as image_utils
 
 import gdal
 from numpy import ndarray
@@ -40,11 +41,29 @@ class EnviImage(AbstractImage):
         band = self._dset.GetRasterBand(band_number + 1)
         return band.ReadAsArray()
 
-    def read_all_image_data_from_disk(self):  # type: (...) -> ndarray
+    def read_all_image_data_from_disk(self,
+                                      workers=None,  # type: int
+                                      interleaved=False,  # type: bool
+                                      ):  # type: (...) -> ndarray
+        """
+        Reads all image data from disk into a single preallocated array
+        :param workers: number of threads used to read bands concurrently, see image_utils.gdal_read_all_bands
+        :param interleaved: if True the bands are read with a single band-interleaved read of the dataset
+        :return: ndarray containing image data of dimensions (ny, nx, nbands)
+        """
+        return image_utils.gdal_read_all_bands(self._dset, workers=workers, interleaved=interleaved)
+
+    def read_window_from_disk(self,
+                              bands,  # type: list
+                              x_offset,  # type: int
+                              y_offset,  # type: int
+                              nx,  # type: int
+                              ny  # type: int
+                              ):  # type: (...) -> ndarray
         numpy_arr = []
-        for bandnum in range(self.get_metadata().get_n_bands()):
+        for bandnum in bands:
             band = self._dset.GetRasterBand(bandnum + 1)
-            numpy_arr.append(band.ReadAsArray())
+            numpy_arr.append(band.ReadAsArray(x_offset, y_offset, nx, ny))
         return np.stack(numpy_arr, axis=2)
 
     def set_dset(self,
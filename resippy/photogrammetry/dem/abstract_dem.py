@@ -1,7 +1,9 @@
 from __future__ import division
 
 import abc
+from typing import Union
 from pyproj import Proj
+from shapely.geometry.base import BaseGeometry
 from numpy import ndarray
 from six import add_metaclass
 
@@ -18,6 +20,7 @@ class AbstractDem:
         # Codes can be found at: https://epsg.io/
         # Example: https://epsg.io/5773 is the geoid commonly used by pix4d
         self.reference = None
+        self._elevation_pyramid = None
 
     def set_projection(self,
                        projection  # type: Proj
@@ -51,13 +54,75 @@ class AbstractDem:
         pass
 
     @abc.abstractmethod
-    def get_highest_alt(self):  # type: (...) -> float
+    def get_highest_alt(self,
+                        region=None,  # type: Union[BaseGeometry, tuple]
+                        world_proj=None  # type: Proj
+                        ):  # type: (...) -> float
+        """
+        Returns the highest elevation of the DEM, or of a region of the DEM.  Regional values may be conservative,
+        concrete implementations are allowed to return an upper bound of the highest elevation within the region.
+        :param region: None for the full DEM, or the region to query as a shapely geometry or a
+        (min_x, min_y, max_x, max_y) tuple.  Only the region's bounding box is used
+        :param world_proj: projection of the region, defaults to the DEM's projection
+        :return: highest elevation
+        """
         pass
 
     @abc.abstractmethod
-    def get_lowest_alt(self):  # type: (...) -> float
+    def get_lowest_alt(self,
+                       region=None,  # type: Union[BaseGeometry, tuple]
+                       world_proj=None  # type: Proj
+                       ):  # type: (...) -> float
+        """
+        Returns the lowest elevation of the DEM, or of a region of the DEM.  Regional values may be conservative,
+        concrete implementations are allowed to return a lower bound of the lowest elevation within the region.
+        :param region: None for the full DEM, or the region to query as a shapely geometry or a
+        (min_x, min_y, max_x, max_y) tuple.  Only the region's bounding box is used
+        :param world_proj: projection of the region, defaults to the DEM's projection
+        :return: lowest elevation
+        """
         pass
 
+    @staticmethod
+    def get_region_bounds(region  # type: Union[BaseGeometry, tuple]
+                          ):  # type: (...) -> tuple
+        """
+        Returns the bounding box of a region passed to get_highest_alt or get_lowest_alt
+        :param region: shapely geometry or (min_x, min_y, max_x, max_y) tuple
+        :return: (min_x, min_y, max_x, max_y)
+        """
+        if hasattr(region, 'bounds'):
+            return tuple(region.bounds)
+        return tuple(region)
+
+    def get_elevation_pyramid(self,
+                              min_x,  # type: float
+                              max_x,  # type: float
+                              min_y,  # type: float
+                              max_y,  # type: float
+                              sample_distance,  # type: float
+                              ):  # type: (...) -> DemElevationPyramid
+        """
+        Returns a min / max elevation pyramid that covers a bounding box, used to cast rays onto the DEM.  By default
+        the DEM is sampled over the bounding box, and the pyramid is kept and reused by later calls whose bounding
+        boxes it covers at the same sample distance.  DEMs with a native raster should override this to build the
+        pyramid from their own cells.
+        :param min_x: minimum x (longitude) of the bounding box, in the DEM's projection
+        :param max_x: maximum x (longitude) of the bounding box, in the DEM's projection
+        :param min_y: minimum y (latitude) of the bounding box, in the DEM's projection
+        :param max_y: maximum y (latitude) of the bounding box, in the DEM's projection
+        :param sample_distance: resolution at which to sample the DEM, in the units of the DEM's projection
+        :return: DemElevationPyramid
+        """
+        from resippy.photogrammetry.dem.dem_elevation_pyramid import DemElevationPyramid
+        # concrete implementations do not always call AbstractDem.__init__
+        pyramid = getattr(self, '_elevation_pyramid', None)
+        if pyramid is None or pyramid.get_sample_distance() != sample_distance or \
+                not pyramid.covers(min_x, max_x, min_y, max_y):
+            pyramid = DemElevationPyramid.init_from_dem(self, min_x, max_x, min_y, max_y, sample_distance)
+            self._elevation_pyramid = pyramid
+        return pyramid
+
     @abc.abstractmethod
     def get_mean_alt(self):  # type: (...) -> float
         pass
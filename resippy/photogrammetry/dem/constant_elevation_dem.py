@@ -1,7 +1,10 @@
 from __future__ import division
 
+from typing import Union
 from pyproj import Proj
+from shapely.geometry.base import BaseGeometry
 from resippy.photogrammetry.dem.abstract_dem import AbstractDem
+from resippy.photogrammetry.dem.dem_elevation_pyramid import DemElevationPyramid
 import numpy as np
 import resippy.photogrammetry.crs_defs as crs_defs
 
@@ -17,12 +20,34 @@ class ConstantElevationDem(AbstractDem):
                        ):  # type: (...) -> np.ndarray
         return np.zeros(np.shape(world_x)) + self.elevation
 
-    def get_highest_alt(self):  # type: (...) -> float
+    def get_highest_alt(self,
+                        region=None,  # type: Union[BaseGeometry, tuple]
+                        world_proj=None  # type: Proj
+                        ):  # type: (...) -> float
         return self.elevation
 
-    def get_lowest_alt(self):  # type: (...) -> float
+    def get_lowest_alt(self,
+                       region=None,  # type: Union[BaseGeometry, tuple]
+                       world_proj=None  # type: Proj
+                       ):  # type: (...) -> float
         return self.elevation
 
+    def get_elevation_pyramid(self,
+                              min_x,  # type: float
+                              max_x,  # type: float
+                              min_y,  # type: float
+                              max_y,  # type: float
+                              sample_distance,  # type: float
+                              ):  # type: (...) -> DemElevationPyramid
+        """
+        See documentation for AbstractDem.  The DEM is flat, so a single cell covers the bounding box and rays are only
+        sampled where they leave it.
+        """
+        cell_size = max(max_x - min_x, max_y - min_y, sample_distance)
+        elevations = np.zeros((1, 1)) + self.elevation
+        return DemElevationPyramid.init_from_levels(self, min_x, min_y, cell_size, cell_size, [elevations],
+                                                    [elevations], cell_size)
+
     def get_mean_alt(self):  # type: (...) -> float
         return self.elevation
 
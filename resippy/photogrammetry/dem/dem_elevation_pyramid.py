@@ -0,0 +1,439 @@
+from __future__ import division
+
+import numpy as np
+from numpy import ndarray
+
+from resippy.photogrammetry.dem.abstract_dem import AbstractDem
+
+
+class DemElevationPyramid:
+    """
+    A min / max elevation pyramid over a DEM, used to cast rays onto the DEM.  Level 0 of the pyramid stores the
+    minimum and maximum elevations of each cell of a regular grid, and each coarser level stores the minimum and
+    maximum of 2 x 2 cells of the level below it.  Rays are marched coarse-to-fine: cells that the ray passes over
+    without dipping below the cell's maximum elevation are skipped at the coarsest level possible, and within a level 0
+    cell the ray is sampled against the DEM itself at the pyramid's sample distance, and the first crossing is refined
+    by bisection.
+
+    DEMs with a native raster, such as GeotiffDem, provide pyramids whose level 0 cells are the raster's own cells, see
+    AbstractDem.get_elevation_pyramid.  Those are built once per DEM and share the DEM's regional min / max pyramid, so
+    casting rays does not allocate anything that scales with the area of the rays' footprint.  init_from_dem is the
+    fallback for analytic DEMs, which samples the DEM on a regular grid.
+    """
+
+    def __init__(self):
+        self._dem = None                    # type: AbstractDem
+        self._x0 = None                     # type: float
+        self._y0 = None                     # type: float
+        self._cell_width = None             # type: float
+        self._cell_height = None            # type: float
+        self._sample_distance = None        # type: float
+        self._interpolation_reach = 0.0     # type: float
+        self._overshoot = 0.0               # type: float
+        self._min_levels = []               # type: list
+        self._max_levels = []               # type: list
+
+    @classmethod
+    def init_from_levels(cls,
+                         dem,  # type: AbstractDem
+                         x0,  # type: float
+                         y0,  # type: float
+                         cell_width,  # type: float
+                         cell_height,  # type: float
+                         min_levels,  # type: list
+                         max_levels,  # type: list
+                         sample_distance,  # type: float
+                         interpolation_reach=0.0,  # type: float
+                         overshoot=0.0,  # type: float
+                         ):  # type: (...) -> DemElevationPyramid
+        """
+        Creates a pyramid from existing min / max levels, such as the levels built by build_min_max_levels.  The cell at
+        row r and column c of level 0 covers x0 + c * cell_width to x0 + (c + 1) * cell_width, and likewise for y, so a
+        north up geotiff's geotransform can be used directly.  Locations outside of the grid use the nearest edge cells,
+        the same as a DEM that clamps to its edges.
+        :param dem: concrete implementation of an AbstractDem, used to sample elevations within level 0 cells
+        :param x0: x (longitude) of the level 0 grid origin, in the DEM's projection
+        :param y0: y (latitude) of the level 0 grid origin, in the DEM's projection
+        :param cell_width: width of the level 0 cells, can be negative
+        :param cell_height: height of the level 0 cells, can be negative
+        :param min_levels: list of minimum levels, finest level first
+        :param max_levels: list of maximum levels, finest level first
+        :param sample_distance: spacing at which rays are sampled against the DEM within level 0 cells, in the units of
+        the DEM's projection
+        :param interpolation_reach: distance outside of a cell, in level 0 cells, from which DEM values can affect the
+        interpolated elevations within the cell.  The bound of a cell includes the neighboring cells within this reach
+        :param overshoot: fraction of the elevation range of a cell's neighborhood that the DEM's interpolation can
+        overshoot the neighborhood's maximum by, such as for cubic convolution
+        :return: DemElevationPyramid
+        """
+        pyramid = cls()
+        pyramid._dem = dem
+        pyramid._x0 = x0
+        pyramid._y0 = y0
+        pyramid._cell_width = cell_width
+        pyramid._cell_height = cell_height
+        pyramid._min_levels = list(min_levels)
+        pyramid._max_levels = list(max_levels)
+        pyramid._sample_distance = sample_distance
+        pyramid._interpolation_reach = interpolation_reach
+        pyramid._overshoot = overshoot
+        return pyramid
+
+    @classmethod
+    def init_from_dem(cls,
+                      dem,  # type: AbstractDem
+                      min_x,  # type: float
+                      max_x,  # type: float
+                      min_y,  # type: float
+                      max_y,  # type: float
+                      sample_distance,  # type: float
+                      ):  # type: (...) -> DemElevationPyramid
+        """
+        Builds an elevation pyramid by sampling a DEM over a bounding box.  This is the fallback for DEMs without a
+        native raster, such as analytic DEMs.  Level 0 cells are the cells between samples, and their bounds are the
+        min / max of their 4 corner samples, so features that are narrower than the sample distance can be missed.
+        Memory scales with the area of the bounding box divided by the square of the sample distance.
+        :param dem: concrete implementation of an AbstractDem
+        :param min_x: minimum x (longitude) of the bounding box, in the DEM's projection
+        :param max_x: maximum x (longitude) of the bounding box, in the DEM's projection
+        :param min_y: minimum y (latitude) of the bounding box, in the DEM's projection
+        :param max_y: maximum y (latitude) of the bounding box, in the DEM's projection
+        :param sample_distance: spacing of the DEM samples, in the units of the DEM's projection
+        :return: DemElevationPyramid
+        """
+        # pad by one sample so rays that end exactly on the bounding box stay inside the grid
+        x0 = min_x - sample_distance
+        y0 = min_y - sample_distance
+        nx = int(np.ceil((max_x - min_x) / sample_distance)) + 3
+        ny = int(np.ceil((max_y - min_y) / sample_distance)) + 3
+
+        grid_x = x0 + np.arange(nx) * sample_distance
+        grid_y = y0 + np.arange(ny) * sample_distance
+        elevations = np.zeros((ny, nx))
+        # sample the DEM a row at a time to avoid building full size coordinate grids
+        for row, y in enumerate(grid_y):
+            elevations[row, :] = dem.get_elevations(grid_x, np.zeros(nx) + y)
+
+        # np.fmin / np.fmax ignore nodata (NaN) samples unless every sample in a cell is NaN
+        cell_mins = np.fmin(np.fmin(elevations[:-1, :-1], elevations[:-1, 1:]),
+                            np.fmin(elevations[1:, :-1], elevations[1:, 1:]))
+        cell_maxes = np.fmax(np.fmax(elevations[:-1, :-1], elevations[:-1, 1:]),
+                             np.fmax(elevations[1:, :-1], elevations[1:, 1:]))
+        min_levels, max_levels = cls.build_min_max_levels(cell_mins, cell_maxes)
+        return cls.init_from_levels(dem, x0, y0, sample_distance, sample_distance, min_levels, max_levels,
+                                    sample_distance)
+
+    def covers(self,
+               min_x,  # type: float
+               max_x,  # type: float
+               min_y,  # type: float
+               max_y,  # type: float
+               ):  # type: (...) -> bool
+        """
+        :return: True if the bounding box is within the pyramid's level 0 grid
+        """
+        ny, nx = self._max_levels[0].shape
+        grid_xs = sorted([self._x0, self._x0 + nx * self._cell_width])
+        grid_ys = sorted([self._y0, self._y0 + ny * self._cell_height])
+        return grid_xs[0] <= min_x and max_x <= grid_xs[1] and grid_ys[0] <= min_y and max_y <= grid_ys[1]
+
+    def get_sample_distance(self):  # type: (...) -> float
+        return self._sample_distance
+
+    @classmethod
+    def build_min_max_levels(cls,
+                             cell_mins,  # type: ndarray
+                             cell_maxes,  # type: ndarray
+                             ):  # type: (...) -> (list, list)
+        """
+        Builds the levels of a min / max pyramid.  Each level reduces 2 x 2 cells of the level below it, up to a
+        single cell.  NaN values are ignored unless all of the reduced cells are NaN.
+        :param cell_mins: minimum values of the finest level, as a 2d numpy ndarray
+        :param cell_maxes: maximum values of the finest level, as a 2d numpy ndarray
+        :return: (list of minimum levels, list of maximum levels), finest level first
+        """
+        min_levels = [cell_mins]
+        max_levels = [cell_maxes]
+        while cell_mins.shape[0] > 1 or cell_mins.shape[1] > 1:
+            cell_mins = cls._reduce_level(cell_mins, np.fmin)
+            cell_maxes = cls._reduce_level(cell_maxes, np.fmax)
+            min_levels.append(cell_mins)
+            max_levels.append(cell_maxes)
+        return min_levels, max_levels
+
+    @staticmethod
+    def _reduce_level(level,  # type: ndarray
+                      reduce_function,  # type: np.ufunc
+                      ):  # type: (...) -> ndarray
+        ny, nx = level.shape
+        padded = np.full((ny + ny % 2, nx + nx % 2), np.nan, dtype=level.dtype)
+        padded[0:ny, 0:nx] = level
+        return reduce_function(reduce_function(padded[0::2, 0::2], padded[0::2, 1::2]),
+                               reduce_function(padded[1::2, 0::2], padded[1::2, 1::2]))
+
+    def get_n_levels(self):  # type: (...) -> int
+        """
+        :return: number of levels in the pyramid
+        """
+        return len(self._max_levels)
+
+    def get_cell_min_max(self,
+                         level,  # type: int
+                         ):  # type: (...) -> (ndarray, ndarray)
+        """
+        :param level: pyramid level, 0 is the finest level
+        :return: (cell minimum elevations, cell maximum elevations) for the level, as 2d numpy ndarrays
+        """
+        return self._min_levels[level], self._max_levels[level]
+
+    def cast_rays(self,
+                  start_xs,  # type: ndarray
+                  start_ys,  # type: ndarray
+                  start_alts,  # type: ndarray
+                  end_xs,  # type: ndarray
+                  end_ys,  # type: ndarray
+                  end_alts,  # type: ndarray
+                  max_iter=100000,  # type: int
+                  max_samples_per_iter=64,  # type: int
+                  ):  # type: (...) -> (ndarray, ndarray, ndarray)
+        """
+        Finds the first intersection of straight, descending rays with the DEM
+        :param start_xs: ray start x (longitude) locations, as a 1d numpy ndarray
+        :param start_ys: ray start y (latitude) locations, as a 1d numpy ndarray
+        :param start_alts: ray start altitudes, these must be above the DEM, as a float or 1d numpy ndarray
+        :param end_xs: ray end x (longitude) locations, as a 1d numpy ndarray
+        :param end_ys: ray end y (latitude) locations, as a 1d numpy ndarray
+        :param end_alts: ray end altitudes, these should be below the DEM, as a float or 1d numpy ndarray
+        :param max_iter: maximum number of marching iterations, to avoid entering an infinite loop
+        :param max_samples_per_iter: maximum number of DEM samples per ray within a level 0 cell for each iteration,
+        this bounds the memory used to sample rays that cross large cells
+        :return: (x, y, altitude) of the intersections as a tuple of 1d numpy ndarrays.  Rays that do not intersect
+        the DEM are set to NaN
+        """
+        n_rays = len(start_xs)
+        start_alts = np.zeros(n_rays) + start_alts
+        end_alts = np.zeros(n_rays) + end_alts
+        dxs = end_xs - start_xs
+        dys = end_ys - start_ys
+        dzs = end_alts - start_alts
+        horizontal_lengths = np.sqrt(np.square(dxs) + np.square(dys))
+        # march in level 0 grid coordinates, where cells are 1 x 1
+        start_us = (start_xs - self._x0) / self._cell_width
+        start_vs = (start_ys - self._y0) / self._cell_height
+        dus = dxs / self._cell_width
+        dvs = dys / self._cell_height
+        # smallest step along a ray, used to move past cell boundaries, and the step between DEM samples within cells
+        t_eps = 1e-6 * self._sample_distance / np.maximum(horizontal_lengths, self._sample_distance)
+        with np.errstate(divide='ignore'):
+            sample_steps = self._sample_distance / horizontal_lengths
+
+        top_level = self.get_n_levels() - 1
+        ts = np.zeros(n_rays)
+        levels = np.zeros(n_rays, dtype=int) + top_level
+        brackets_low = np.full(n_rays, np.nan)
+        brackets_high = np.full(n_rays, np.nan)
+
+        active = np.arange(n_rays)
+        for i in range(max_iter):
+            if len(active) == 0:
+                break
+            t = ts[active]
+            level = levels[active]
+            t_exit, cell_bound = self._cell_exit(start_us[active], start_vs[active], dus[active], dvs[active], t, level)
+            # the ray descends, so its lowest altitude within the cell is where it exits the cell.  Cells without any
+            # valid elevations have NaN bounds, and are missed
+            alt_exit = start_alts[active] + t_exit * dzs[active]
+            misses_cell = np.logical_not(alt_exit <= cell_bound)
+
+            # within level 0 cells that the ray dips into, sample the DEM along the ray to find the first sample that
+            # is below the surface.  The ray is above the surface where it enters the cell, so that sample and the
+            # one before it bracket the intersection
+            at_finest_level = np.logical_and(np.logical_not(misses_cell), level == 0)
+            hits = np.zeros(len(active), dtype=bool)
+            sampled_ts = t_exit - t_eps[active]
+            if at_finest_level.any():
+                finest = active[at_finest_level]
+                # the last sample is just inside of the cell, the cell's exit can belong to the next cell's pixel
+                last_ts = np.maximum(t_exit[at_finest_level] - t_eps[finest], t[at_finest_level])
+                hit_lows, hit_highs, sampled_ts[at_finest_level] = self._sample_cell(
+                    start_xs[finest], start_ys[finest], start_alts[finest], dxs[finest], dys[finest], dzs[finest],
+                    t[at_finest_level], last_ts, sample_steps[finest], max_samples_per_iter)
+                hits[at_finest_level] = np.isfinite(hit_lows)
+                brackets_low[finest] = hit_lows
+                brackets_high[finest] = hit_highs
+            partially_sampled = np.logical_and(at_finest_level, sampled_ts < t_exit - t_eps[active])
+            ts[active[partially_sampled]] = sampled_ts[partially_sampled]
+
+            # rays that are still above the surface move on to the next cell, and try a coarser level
+            advance = np.logical_or(misses_cell, at_finest_level)
+            advance = np.logical_and(advance, np.logical_not(np.logical_or(hits, partially_sampled)))
+            descend = np.logical_and(np.logical_not(misses_cell), level > 0)
+            ts[active[advance]] = t_exit[advance] + t_eps[active[advance]]
+            levels[active[advance]] = np.minimum(level[advance] + 1, top_level)
+            levels[active[descend]] = level[descend] - 1
+
+            finished = np.logical_or(hits, np.logical_and(advance, t_exit >= 1))
+            active = active[np.logical_not(finished)]
+
+        intersected = np.where(np.isfinite(brackets_low))[0]
+        ts_low, ts_high, alts_low, alts_high = self._bisect(start_xs[intersected], start_ys[intersected],
+                                                            start_alts[intersected], dxs[intersected],
+                                                            dys[intersected], dzs[intersected],
+                                                            horizontal_lengths[intersected],
+                                                            brackets_low[intersected], brackets_high[intersected])
+
+        # finish with a linear interpolation between the final bracket ends, the same as a single secant step
+        ray_alts_low = start_alts[intersected] + ts_low * dzs[intersected]
+        ray_alts_high = start_alts[intersected] + ts_high * dzs[intersected]
+        heights_low = ray_alts_low - alts_low
+        heights_high = ray_alts_high - alts_high
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fractions = heights_low / (heights_low - heights_high)
+        fractions = np.clip(np.nan_to_num(fractions), 0, 1)
+        ts_intersect = ts_low + (ts_high - ts_low) * fractions
+
+        intersected_xs = np.full(n_rays, np.nan)
+        intersected_ys = np.full(n_rays, np.nan)
+        intersected_alts = np.full(n_rays, np.nan)
+        intersected_xs[intersected] = start_xs[intersected] + ts_intersect * dxs[intersected]
+        intersected_ys[intersected] = start_ys[intersected] + ts_intersect * dys[intersected]
+        intersected_alts[intersected] = alts_low + (alts_high - alts_low) * fractions
+        return intersected_xs, intersected_ys, intersected_alts
+
+    def _cell_exit(self,
+                   start_us,  # type: ndarray
+                   start_vs,  # type: ndarray
+                   dus,  # type: ndarray
+                   dvs,  # type: ndarray
+                   ts,  # type: ndarray
+                   levels,  # type: ndarray
+                   ):  # type: (...) -> (ndarray, ndarray)
+        """
+        Finds the pyramid cell each ray is in at its current position.  Locations are in level 0 grid coordinates.
+        Cells outside of the grid are bounded by the nearest edge cells.
+        :return: (ray parameter where the ray exits the cell, upper bound of the DEM's elevations within the cell)
+        """
+        cell_sizes = np.power(2.0, levels)
+        cols = np.floor((start_us + ts * dus) / cell_sizes)
+        rows = np.floor((start_vs + ts * dvs) / cell_sizes)
+        cell_bound = np.zeros(len(ts))
+        for level in np.unique(levels):
+            at_level = levels == level
+            cell_bound[at_level] = self._get_cell_bounds(level, rows[at_level].astype(int), cols[at_level].astype(int))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_exit_u = np.where(dus > 0, ((cols + 1) * cell_sizes - start_us) / dus,
+                                np.where(dus < 0, (cols * cell_sizes - start_us) / dus, np.inf))
+            t_exit_v = np.where(dvs > 0, ((rows + 1) * cell_sizes - start_vs) / dvs,
+                                np.where(dvs < 0, (rows * cell_sizes - start_vs) / dvs, np.inf))
+        t_exit = np.clip(np.minimum(t_exit_u, t_exit_v), ts, 1)
+        return t_exit, cell_bound
+
+    def _get_cell_bounds(self,
+                         level,  # type: int
+                         rows,  # type: ndarray
+                         cols,  # type: ndarray
+                         ):  # type: (...) -> ndarray
+        """
+        Returns upper bounds of the DEM's interpolated elevations within cells of a pyramid level.  The cell maximums
+        are widened to include the neighboring cells within the DEM's interpolation reach, and the interpolation's
+        overshoot.  Cells whose neighborhoods do not have any valid elevations are NaN.
+        """
+        level_mins = self._min_levels[level]
+        level_maxes = self._max_levels[level]
+        n_rows, n_cols = level_maxes.shape
+        radius = int(np.ceil(self._interpolation_reach / 2 ** level))
+        neighborhood_min = np.full(len(rows), np.nan)
+        neighborhood_max = np.full(len(rows), np.nan)
+        for row_offset in range(-radius, radius + 1):
+            neighbor_rows = np.clip(rows + row_offset, 0, n_rows - 1)
+            for col_offset in range(-radius, radius + 1):
+                neighbor_cols = np.clip(cols + col_offset, 0, n_cols - 1)
+                neighborhood_min = np.fmin(neighborhood_min, level_mins[neighbor_rows, neighbor_cols])
+                neighborhood_max = np.fmax(neighborhood_max, level_maxes[neighbor_rows, neighbor_cols])
+        if self._overshoot > 0:
+            neighborhood_max = neighborhood_max + self._overshoot * (neighborhood_max - neighborhood_min)
+        return neighborhood_max
+
+    def _sample_cell(self,
+                     start_xs,  # type: ndarray
+                     start_ys,  # type: ndarray
+                     start_alts,  # type: ndarray
+                     dxs,  # type: ndarray
+                     dys,  # type: ndarray
+                     dzs,  # type: ndarray
+                     ts,  # type: ndarray
+                     ts_last,  # type: ndarray
+                     sample_steps,  # type: ndarray
+                     max_samples,  # type: int
+                     ):  # type: (...) -> (ndarray, ndarray, ndarray)
+        """
+        Samples the DEM along rays from ts up to ts_last, every sample_steps, and always including ts_last.  At most
+        max_samples samples are taken per ray.
+        :return: (bracket lows, bracket highs, last ray parameter sampled).  Brackets are NaN for rays that stay above
+        the DEM.
+        """
+        with np.errstate(invalid='ignore'):
+            n_samples = np.ceil((ts_last - ts) / sample_steps)
+        n_samples = np.clip(np.nan_to_num(n_samples, nan=1, posinf=max_samples), 1, max_samples).astype(int)
+        sample_numbers = np.arange(1, np.max(n_samples) + 1)
+        sample_ts = np.minimum(ts[:, None] + sample_numbers[None, :] * np.nan_to_num(sample_steps[:, None]),
+                               ts_last[:, None])
+        valid = sample_numbers[None, :] <= n_samples[:, None]
+        # rays that have a step of 0 or infinity only sample their last locations
+        only_exit = np.logical_not(np.logical_and(sample_steps > 0, np.isfinite(sample_steps)))
+        sample_ts[only_exit] = ts_last[only_exit, None]
+
+        ray_indices, sample_indices = np.where(valid)
+        sampled = sample_ts[ray_indices, sample_indices]
+        surface = self._dem.get_elevations(start_xs[ray_indices] + sampled * dxs[ray_indices],
+                                           start_ys[ray_indices] + sampled * dys[ray_indices])
+        below_surface = np.zeros(sample_ts.shape, dtype=bool)
+        below_surface[ray_indices, sample_indices] = start_alts[ray_indices] + sampled * dzs[ray_indices] <= surface
+
+        hit = below_surface.any(axis=1)
+        first_below = np.argmax(below_surface, axis=1)
+        previous_ts = np.concatenate((ts[:, None], sample_ts[:, :-1]), axis=1)
+        row_indices = np.arange(len(ts))
+        bracket_lows = np.where(hit, previous_ts[row_indices, first_below], np.nan)
+        bracket_highs = np.where(hit, sample_ts[row_indices, first_below], np.nan)
+        last_ts = sample_ts[row_indices, n_samples - 1]
+        return bracket_lows, bracket_highs, last_ts
+
+    def _bisect(self,
+                start_xs,  # type: ndarray
+                start_ys,  # type: ndarray
+                start_alts,  # type: ndarray
+                dxs,  # type: ndarray
+                dys,  # type: ndarray
+                dzs,  # type: ndarray
+                horizontal_lengths,  # type: ndarray
+                ts_low,  # type: ndarray
+                ts_high,  # type: ndarray
+                relative_tolerance=1e-3,  # type: float
+                max_iter=60,  # type: int
+                ):  # type: (...) -> (ndarray, ndarray, ndarray, ndarray)
+        """
+        Bisects the bracketed intersections until the brackets are smaller than relative_tolerance times the sample
+        distance horizontally, and relative_tolerance vertically
+        :return: (ts_low, ts_high, DEM elevations at ts_low, DEM elevations at ts_high)
+        """
+        ts_low = np.array(ts_low)
+        ts_high = np.array(ts_high)
+        bracket_scales = np.maximum(horizontal_lengths / self._sample_distance, np.abs(dzs))
+        active = np.arange(len(ts_low))
+        for i in range(max_iter):
+            active = active[(ts_high[active] - ts_low[active]) * bracket_scales[active] > relative_tolerance]
+            if len(active) == 0:
+                break
+            ts_mid = (ts_low[active] + ts_high[active]) / 2
+            surface_mid = self._dem.get_elevations(start_xs[active] + ts_mid * dxs[active],
+                                                   start_ys[active] + ts_mid * dys[active])
+            below_surface = start_alts[active] + ts_mid * dzs[active] <= surface_mid
+            ts_high[active[below_surface]] = ts_mid[below_surface]
+            ts_low[active[np.logical_not(below_surface)]] = ts_mid[np.logical_not(below_surface)]
+        if len(ts_low) == 0:
+            return ts_low, ts_high, np.zeros(0), np.zeros(0)
+        alts_low = self._dem.get_elevations(start_xs + ts_low * dxs, start_ys + ts_low * dys)
+        alts_high = self._dem.get_elevations(start_xs + ts_high * dxs, start_ys + ts_high * dys)
+        return ts_low, ts_high, np.zeros(len(ts_low)) + alts_low, np.zeros(len(ts_high)) + alts_high
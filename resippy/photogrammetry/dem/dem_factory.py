@@ -10,10 +10,14 @@ class DemFactory:
     def from_gtiff_file(fname,  # type: str
                         nodata_value=None,  # type: float
                         interpolation_method='bilinear', # type: str
+                        lazy_loading=False,  # type: bool
+                        tile_size=512,  # type: int
+                        max_cached_tiles=64,  # type: int
                         ):  # type (...) -> GeotiffDem
         # type: (str) -> GeotiffDem
         gtiff = GeotiffImageFactory.from_file(fname)
         gtiff_dem = GeotiffDem()
+        gtiff_dem.set_lazy_loading(lazy_loading, tile_size=tile_size, max_cached_tiles=max_cached_tiles)
         gtiff_dem.set_geotiff_image(gtiff)
         # attempt to get nodata value from the gtiff file itself
         if nodata_value is None:
@@ -23,8 +27,10 @@ class DemFactory:
             gtiff_dem.set_interpolation_to_bilinear()
         elif interpolation_method == 'nearest':
             gtiff_dem.set_interpolation_to_nearest()
+        elif interpolation_method == 'bicubic':
+            gtiff_dem.set_interpolation_to_bicubic()
         else:
-            TypeError("interpolation method should either be 'bilinear' or 'nearest'")
+            raise TypeError("interpolation method should either be 'bilinear', 'bicubic' or 'nearest'")
         return gtiff_dem
 
     @staticmethod
@@ -1,6 +1,13 @@
 from __future__ import division
 
+from collections import OrderedDict
+from typing import Union
+
+from pyproj import Proj
+from shapely.geometry.base import BaseGeometry
+
 from resippy.photogrammetry.dem.abstract_dem import AbstractDem
+from resippy.photogrammetry.dem.dem_elevation_pyramid import DemElevationPyramid
 
 from resippy.image_objects.earth_overhead.geotiff.geotiff_image import GeotiffImage
 import numpy as np
@@ -14,6 +21,35 @@ class GeotiffDem(AbstractDem):
         self.gtiff = GeotiffImage
         self.nodata_value = None
         self.interpolation_method = 'bilinear'
+        self.elevation_dtype = np.float64
+        # lazy loading reads DEM tiles through GDAL windows into a bounded LRU cache instead of loading the full raster
+        self.lazy_loading = False
+        self.tile_size = 512
+        self.max_cached_tiles = 64
+        self._tile_cache = OrderedDict()
+        self._tile_stats = None
+        self._min_max_levels = None
+
+    def set_lazy_loading(self,
+                         lazy_loading=True,  # type: bool
+                         tile_size=512,  # type: int
+                         max_cached_tiles=64  # type: int
+                         ):  # type: (...) -> None
+        """
+        Turns lazy loading on or off.  In lazy mode the DEM is read in tile_size x tile_size blocks on demand, and at
+        most max_cached_tiles blocks are kept in memory, the least recently used blocks are dropped first.  This
+        should be set before the geotiff image is set.
+        :param lazy_loading: True to read DEM tiles on demand, False to load the full raster into dem_data
+        :param tile_size: width and height of the tiles, in DEM pixels
+        :param max_cached_tiles: maximum number of tiles to keep in memory
+        :return: None
+        """
+        self.lazy_loading = lazy_loading
+        self.tile_size = tile_size
+        self.max_cached_tiles = max_cached_tiles
+        self._clear_tiles()
+        if self.gtiff is not GeotiffImage:
+            self.set_geotiff_image(self.gtiff)
 
     def set_interpolation_to_nearest(self):
         self.interpolation_method = 'nearest'
@@ -21,6 +57,23 @@ class GeotiffDem(AbstractDem):
     def set_interpolation_to_bilinear(self):
         self.interpolation_method = 'bilinear'
 
+    def set_interpolation_to_bicubic(self):
+        self.interpolation_method = 'bicubic'
+
+    def set_float32(self,
+                    use_float32=True  # type: bool
+                    ):  # type: (...) -> None
+        """
+        Stores and interpolates elevations as float32 instead of float64, which halves the DEM's memory use.  World
+        and pixel locations are always kept in float64, since float32 cannot resolve projected coordinates
+        :param use_float32: True to use float32, False to use float64
+        :return: None
+        """
+        self.elevation_dtype = np.float32 if use_float32 else np.float64
+        self._clear_tiles()
+        if self.dem_data is not None:
+            self.dem_data = self.dem_data.astype(self.elevation_dtype)
+
     def get_interpolation_method(self):     # type: (...) -> str
         return self.interpolation_method
 
@@ -62,7 +115,9 @@ class GeotiffDem(AbstractDem):
                              nodata_value  # type: float
                              ):  # type: (...) -> None
         self.nodata_value = nodata_value
-        if self.nodata_value is not None:
+        # cached tiles, tile statistics and the min / max pyramid depend on the nodata value
+        self._clear_tiles()
+        if not self.lazy_loading and self.nodata_value is not None:
             if self.dem_data is not None:
                 self.dem_data[np.where(self.dem_data == nodata_value)] = np.nan
 
@@ -70,7 +125,11 @@ class GeotiffDem(AbstractDem):
                           geotiff_image  # type: GeotiffImage
                           ):  # type: (...) -> None
         self.gtiff = geotiff_image
-        self.dem_data = np.squeeze(self.gtiff.read_all_image_data_from_disk())
+        self._clear_tiles()
+        if self.lazy_loading:
+            self.dem_data = None
+        else:
+            self.dem_data = np.squeeze(self.gtiff.read_all_image_data_from_disk()).astype(self.elevation_dtype)
         self.set_projection(self.gtiff.get_point_calculator().get_projection())
         self.remove_nodata_values(self.nodata_value)
 
@@ -79,71 +138,353 @@ class GeotiffDem(AbstractDem):
                        world_y,  # type: ndarray
                        world_proj=None,     # type: Proj
                        ):  # type: (...) -> ndarray
-
-        pixel_locs_x, pixel_locs_y = self.gtiff.get_point_calculator().lon_lat_alt_to_pixel_x_y(world_x, world_y,
-                                                                                                alts=None,
-                                                                                                world_proj=world_proj)
-        world_xyz_is_2d = False
-        if np.ndim(world_x) == 2:
-            world_xyz_is_2d = True
-            nx = np.shape(world_x)[1]
-            ny = np.shape(world_x)[0]
-            pixel_locs_x = np.reshape(pixel_locs_x, nx * ny)
-            pixel_locs_y = np.reshape(pixel_locs_y, nx * ny)
-
-        if type(pixel_locs_x) is float:
-            pixel_locs_x = np.array(pixel_locs_x)
-            pixel_locs_y = np.array(pixel_locs_y)
-
-        # TODO implement other interpoloation methods, right now we just grab the closest pixels
-        if self.get_interpolation_method() is 'nearest':
-            pixel_locs_x = np.clip(pixel_locs_x.astype(int), a_min=0, a_max=self.gtiff.get_metadata().get_npix_x()-1)
-            pixel_locs_y = np.clip(pixel_locs_y.astype(int), a_min=0, a_max=self.gtiff.get_metadata().get_npix_y()-1)
-            elevations = self.dem_data[pixel_locs_y, pixel_locs_x]
-        elif self.get_interpolation_method() is 'bilinear':
-            # Do a bilinear interpolation between closest pixels by taking a weighted average
-            pixel_locs_x_1 = np.clip(pixel_locs_x.astype(int), a_min=0, a_max=self.gtiff.get_metadata().get_npix_x() - 1)
-            pixel_locs_y_1 = np.clip(pixel_locs_y.astype(int), a_min=0, a_max=self.gtiff.get_metadata().get_npix_y() - 1)
-
-            pixel_locs_x_2 = np.clip(np.ceil(pixel_locs_x).astype(int), a_min=0, a_max=self.gtiff.get_metadata().get_npix_x() - 1)
-            pixel_locs_y_2 = np.clip(np.ceil(pixel_locs_y).astype(int), a_min=0, a_max=self.gtiff.get_metadata().get_npix_y() - 1)
-
-            elevations_y1x1 = self.dem_data[pixel_locs_y_1, pixel_locs_x_1]
-            elevations_y1x2 = self.dem_data[pixel_locs_y_1, pixel_locs_x_2]
-            elevations_y2x1 = self.dem_data[pixel_locs_y_2, pixel_locs_x_1]
-            elevations_y2x2 = self.dem_data[pixel_locs_y_2, pixel_locs_x_2]
-
-            x_distances_1 = pixel_locs_x - pixel_locs_x_1
-            x_distances_2 = pixel_locs_x_2 - pixel_locs_x
-            y_distances_1 = pixel_locs_y - pixel_locs_y_1
-            y_distances_2 = pixel_locs_y_2 - pixel_locs_y
-
-            distances_y1x1 = np.sqrt(np.square(y_distances_1) + np.square(x_distances_1))
-            distances_y1x2 = np.sqrt(np.square(y_distances_1) + np.square(x_distances_2))
-            distances_y2x1 = np.sqrt(np.square(y_distances_2) + np.square(x_distances_1))
-            distances_y2x2 = np.sqrt(np.square(y_distances_2) + np.square(x_distances_2))
-
-            elevations_arr = np.array((elevations_y1x1, elevations_y1x2, elevations_y2x1, elevations_y2x2))
-            weights_arr = np.array((distances_y1x1, distances_y1x2, distances_y2x1, distances_y2x2))
-
-            elevations = np.average(elevations_arr, weights=weights_arr, axis=0,)
-
+        """
+        Interpolates DEM elevations at world locations.  If world_proj is None or matches the DEM's projection the
+        DEM's inverse geotransform is applied directly, otherwise the locations are transformed through the DEM's
+        point calculator first.  Locations outside of the DEM are clamped to the DEM's edges.
+        :param world_x: world x (longitude) locations, as a float or numpy ndarray
+        :param world_y: world y (latitude) locations, as a float or numpy ndarray
+        :param world_proj: projection of world_x and world_y
+        :return: elevations as a numpy ndarray with the same dimensions as world_x.  Nodata values are returned as NaN
+        """
+        point_calc = self.gtiff.get_point_calculator()
+        if world_proj is None or world_proj.srs == point_calc.get_projection().srs:
+            inv_geo_t = point_calc.get_inv_geot()
+            world_x = np.asarray(world_x, dtype=np.float64)
+            world_y = np.asarray(world_y, dtype=np.float64)
+            pixel_locs_x = inv_geo_t[0] + inv_geo_t[1] * world_x + inv_geo_t[2] * world_y
+            pixel_locs_y = inv_geo_t[3] + inv_geo_t[4] * world_x + inv_geo_t[5] * world_y
         else:
-            TypeError("interpolation must be set to either 'nearest' or 'bilinear' "
-                      "when getting elevations from a GeoTiff DEM")
+            pixel_locs_x, pixel_locs_y = point_calc.lon_lat_alt_to_pixel_x_y(world_x, world_y, alts=None,
+                                                                             world_proj=world_proj)
+        return self.sample_pixels(pixel_locs_x, pixel_locs_y)
 
-        # unflatten world_xyz arrays if the original inputs were 2d
-        if world_xyz_is_2d:
-            elevations = np.reshape(elevations, (ny, nx))
+    def sample_pixels(self,
+                      pixel_locs_x,  # type: ndarray
+                      pixel_locs_y,  # type: ndarray
+                      ):  # type: (...) -> ndarray
+        """
+        Interpolates DEM elevations at fractional pixel locations, using the DEM's interpolation method.  Pixel
+        locations follow the geotransform convention, so pixel (0, 0) is the upper left corner of the upper left
+        pixel, and pixel centers are at half pixel offsets.  Bilinear and bicubic interpolation are separable and
+        are done between pixel centers.  Samples next to nodata values are interpolated from the valid neighboring
+        pixels only.
+        :param pixel_locs_x: fractional pixel x locations, as a float or numpy ndarray
+        :param pixel_locs_y: fractional pixel y locations, as a float or numpy ndarray
+        :return: elevations as a numpy ndarray with the same dimensions as pixel_locs_x
+        """
+        # locations are kept in float64, only the elevations and interpolation weights use the elevation dtype
+        pixel_locs_x = np.asarray(pixel_locs_x, dtype=np.float64)
+        pixel_locs_y = np.asarray(pixel_locs_y, dtype=np.float64)
+        if self.get_interpolation_method() == 'nearest':
+            return self._sample_nearest(pixel_locs_x, pixel_locs_y)
+        elif self.get_interpolation_method() == 'bilinear':
+            return self._sample_bilinear(pixel_locs_x, pixel_locs_y)
+        elif self.get_interpolation_method() == 'bicubic':
+            return self._sample_bicubic(pixel_locs_x, pixel_locs_y)
         else:
-            elevations = np.squeeze(elevations)
+            raise TypeError("interpolation must be set to either 'nearest', 'bilinear' or 'bicubic' "
+                            "when getting elevations from a GeoTiff DEM")
+
+    def _get_clipped_dem_values(self,
+                                pixel_rows,  # type: ndarray
+                                pixel_cols  # type: ndarray
+                                ):  # type: (...) -> ndarray
+        pixel_rows = np.clip(pixel_rows, 0, self.gtiff.get_metadata().get_npix_y() - 1)
+        pixel_cols = np.clip(pixel_cols, 0, self.gtiff.get_metadata().get_npix_x() - 1)
+        return self._get_dem_values(pixel_rows, pixel_cols)
+
+    def _sample_nearest(self,
+                        pixel_locs_x,  # type: ndarray
+                        pixel_locs_y  # type: ndarray
+                        ):  # type: (...) -> ndarray
+        return self._get_clipped_dem_values(np.floor(pixel_locs_y).astype(int), np.floor(pixel_locs_x).astype(int))
+
+    def _sample_bilinear(self,
+                         pixel_locs_x,  # type: ndarray
+                         pixel_locs_y  # type: ndarray
+                         ):  # type: (...) -> ndarray
+        # shift so that integer locations are pixel centers
+        center_locs_x = pixel_locs_x - 0.5
+        center_locs_y = pixel_locs_y - 0.5
+        cols_1 = np.floor(center_locs_x)
+        rows_1 = np.floor(center_locs_y)
+        x_fractions = (center_locs_x - cols_1).astype(self.elevation_dtype)
+        y_fractions = (center_locs_y - rows_1).astype(self.elevation_dtype)
+        cols_1 = cols_1.astype(int)
+        rows_1 = rows_1.astype(int)
+
+        elevations_y1x1 = self._get_clipped_dem_values(rows_1, cols_1)
+        elevations_y1x2 = self._get_clipped_dem_values(rows_1, cols_1 + 1)
+        elevations_y2x1 = self._get_clipped_dem_values(rows_1 + 1, cols_1)
+        elevations_y2x2 = self._get_clipped_dem_values(rows_1 + 1, cols_1 + 1)
+
+        elevations_y1 = elevations_y1x1 + (elevations_y1x2 - elevations_y1x1) * x_fractions
+        elevations_y2 = elevations_y2x1 + (elevations_y2x2 - elevations_y2x1) * x_fractions
+        elevations = elevations_y1 + (elevations_y2 - elevations_y1) * y_fractions
+
+        # renormalize the weights over the valid neighbors where any of the neighbors are nodata
+        nodata_samples = np.isnan(elevations)
+        if nodata_samples.any():
+            weights = [(1 - x_fractions) * (1 - y_fractions), x_fractions * (1 - y_fractions),
+                       (1 - x_fractions) * y_fractions, x_fractions * y_fractions]
+            neighbors = [elevations_y1x1, elevations_y1x2, elevations_y2x1, elevations_y2x2]
+            weighted_sum = np.zeros(elevations.shape, dtype=elevations.dtype)
+            weight_sum = np.zeros(elevations.shape, dtype=elevations.dtype)
+            for weight, neighbor in zip(weights, neighbors):
+                is_valid = np.logical_not(np.isnan(neighbor))
+                weighted_sum += np.where(is_valid, weight * neighbor, 0)
+                weight_sum += np.where(is_valid, weight, 0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                elevations = np.where(nodata_samples, weighted_sum / weight_sum, elevations)
         return elevations
 
-    def get_highest_alt(self):  # type: (...) -> float
+    def _sample_bicubic(self,
+                        pixel_locs_x,  # type: ndarray
+                        pixel_locs_y  # type: ndarray
+                        ):  # type: (...) -> ndarray
+        center_locs_x = pixel_locs_x - 0.5
+        center_locs_y = pixel_locs_y - 0.5
+        cols_1 = np.floor(center_locs_x)
+        rows_1 = np.floor(center_locs_y)
+        x_weights = self._cubic_convolution_weights((center_locs_x - cols_1).astype(self.elevation_dtype))
+        y_weights = self._cubic_convolution_weights((center_locs_y - rows_1).astype(self.elevation_dtype))
+        cols_1 = cols_1.astype(int)
+        rows_1 = rows_1.astype(int)
+
+        elevations = np.zeros(np.shape(pixel_locs_x), dtype=self.elevation_dtype)
+        for row_offset, y_weight in zip(range(-1, 3), y_weights):
+            row_elevations = np.zeros(np.shape(pixel_locs_x), dtype=self.elevation_dtype)
+            for col_offset, x_weight in zip(range(-1, 3), x_weights):
+                row_elevations += x_weight * self._get_clipped_dem_values(rows_1 + row_offset, cols_1 + col_offset)
+            elevations += y_weight * row_elevations
+
+        # fall back to the nodata aware bilinear interpolation next to nodata values
+        nodata_samples = np.isnan(elevations)
+        if nodata_samples.any():
+            elevations[nodata_samples] = self._sample_bilinear(pixel_locs_x[nodata_samples],
+                                                               pixel_locs_y[nodata_samples])
+        return elevations
+
+    @staticmethod
+    def _cubic_convolution_weights(fractions,  # type: ndarray
+                                   a=-0.5  # type: float
+                                   ):  # type: (...) -> list
+        """
+        Keys cubic convolution weights for the 4 pixels at offsets -1, 0, 1, 2 from the pixel below each fraction
+        """
+        def inner_weight(distance):
+            return ((a + 2) * distance - (a + 3)) * distance * distance + 1
+
+        def outer_weight(distance):
+            return a * (((distance - 5) * distance + 8) * distance - 4)
+
+        return [outer_weight(1 + fractions), inner_weight(fractions),
+                inner_weight(1 - fractions), outer_weight(2 - fractions)]
+
+    def get_highest_alt(self,
+                        region=None,  # type: Union[BaseGeometry, tuple]
+                        world_proj=None  # type: Proj
+                        ):  # type: (...) -> float
+        """
+        See documentation for AbstractDem.  Regional queries are answered from a min / max pyramid.  They are exact
+        for regions that span up to 64 x 64 DEM pixels, larger regions are answered from coarser pyramid levels and
+        return an upper bound that is within one pyramid cell of the region.  In lazy mode the finest pyramid level
+        is the per-tile statistics.
+        """
+        if region is not None:
+            return float(np.nanmax(self._get_region_cells(region, world_proj, self._get_min_max_levels()[2])))
+        if self.lazy_loading:
+            return float(np.nanmax(self.get_tile_statistics()['max']))
         return float(np.nanmax(self.dem_data))
 
-    def get_lowest_alt(self):  # type: (...) -> float
+    def get_lowest_alt(self,
+                       region=None,  # type: Union[BaseGeometry, tuple]
+                       world_proj=None  # type: Proj
+                       ):  # type: (...) -> float
+        """
+        See documentation for AbstractDem and get_highest_alt
+        """
+        if region is not None:
+            return float(np.nanmin(self._get_region_cells(region, world_proj, self._get_min_max_levels()[1])))
+        if self.lazy_loading:
+            return float(np.nanmin(self.get_tile_statistics()['min']))
         return float(np.nanmin(self.dem_data))
 
+    def _get_min_max_levels(self):  # type: (...) -> (int, list, list)
+        """
+        Returns the min / max pyramid used for regional queries, building it the first time it is needed
+        :return: (size of the finest cells in DEM pixels, list of minimum levels, list of maximum levels)
+        """
+        if self._min_max_levels is None:
+            if self.lazy_loading:
+                tile_stats = self.get_tile_statistics()
+                min_levels, max_levels = DemElevationPyramid.build_min_max_levels(tile_stats['min'],
+                                                                                  tile_stats['max'])
+                self._min_max_levels = (self.tile_size, min_levels, max_levels)
+            else:
+                min_levels, max_levels = DemElevationPyramid.build_min_max_levels(self.dem_data, self.dem_data)
+                self._min_max_levels = (1, min_levels, max_levels)
+        return self._min_max_levels
+
+    def get_elevation_pyramid(self,
+                              min_x,  # type: float
+                              max_x,  # type: float
+                              min_y,  # type: float
+                              max_y,  # type: float
+                              sample_distance,  # type: float
+                              ):  # type: (...) -> DemElevationPyramid
+        """
+        See documentation for AbstractDem.  The pyramid's cells are the DEM's own pixels, or its tiles in lazy mode,
+        and it shares the min / max levels used for regional queries, so it covers the full DEM and is only built once.
+        Rays are sampled within cells at the smaller of sample_distance and a quarter of a DEM pixel.  DEMs with rotated
+        geotransforms are sampled over the bounding box instead.
+        """
+        geo_t = self.gtiff.get_point_calculator().get_geot()
+        if geo_t[2] != 0 or geo_t[4] != 0:
+            return super(GeotiffDem, self).get_elevation_pyramid(min_x, max_x, min_y, max_y, sample_distance)
+        base_cell_size, min_levels, max_levels = self._get_min_max_levels()
+        # distance in pixels outside of a pixel from which the interpolation reads DEM values, and for bicubic
+        # interpolation the largest overshoot of the Keys kernel, (1 + 2 / 16) ** 2 - 1
+        interpolation_reach = {'nearest': 0.0, 'bilinear': 0.5, 'bicubic': 1.5}[self.get_interpolation_method()]
+        overshoot = 0.27 if self.get_interpolation_method() == 'bicubic' else 0.0
+        pixel_size = min(abs(geo_t[1]), abs(geo_t[5]))
+        return DemElevationPyramid.init_from_levels(self, geo_t[0], geo_t[3],
+                                                    geo_t[1] * base_cell_size, geo_t[5] * base_cell_size,
+                                                    min_levels, max_levels, min(sample_distance, pixel_size / 4),
+                                                    interpolation_reach=interpolation_reach / base_cell_size,
+                                                    overshoot=overshoot)
+
+    def _get_region_cells(self,
+                          region,  # type: Union[BaseGeometry, tuple]
+                          world_proj,  # type: Proj
+                          levels,  # type: list
+                          max_cells=4096,  # type: int
+                          ):  # type: (...) -> ndarray
+        """
+        Returns the cells of the finest pyramid level at which the region's bounding box covers at most max_cells
+        cells.
+        """
+        min_x, min_y, max_x, max_y = self.get_region_bounds(region)
+        corner_xs = np.array([min_x, max_x, max_x, min_x])
+        corner_ys = np.array([min_y, min_y, max_y, max_y])
+        point_calc = self.gtiff.get_point_calculator()
+        if world_proj is None or world_proj.srs == point_calc.get_projection().srs:
+            inv_geo_t = point_calc.get_inv_geot()
+            pixel_xs = inv_geo_t[0] + inv_geo_t[1] * corner_xs + inv_geo_t[2] * corner_ys
+            pixel_ys = inv_geo_t[3] + inv_geo_t[4] * corner_xs + inv_geo_t[5] * corner_ys
+        else:
+            pixel_xs, pixel_ys = point_calc.lon_lat_alt_to_pixel_x_y(corner_xs, corner_ys, alts=None,
+                                                                     world_proj=world_proj)
+        npix_x = self.gtiff.get_metadata().get_npix_x()
+        npix_y = self.gtiff.get_metadata().get_npix_y()
+        col_min = int(np.clip(np.floor(np.min(pixel_xs)), 0, npix_x - 1))
+        col_max = int(np.clip(np.floor(np.max(pixel_xs)), 0, npix_x - 1))
+        row_min = int(np.clip(np.floor(np.min(pixel_ys)), 0, npix_y - 1))
+        row_max = int(np.clip(np.floor(np.max(pixel_ys)), 0, npix_y - 1))
+
+        base_cell_size = self._get_min_max_levels()[0]
+        for level_number, level in enumerate(levels):
+            cell_size = base_cell_size * 2 ** level_number
+            n_cells = (row_max // cell_size - row_min // cell_size + 1) * \
+                      (col_max // cell_size - col_min // cell_size + 1)
+            if n_cells <= max_cells or level_number == len(levels) - 1:
+                return level[row_min // cell_size:row_max // cell_size + 1,
+                             col_min // cell_size:col_max // cell_size + 1]
+
     def get_mean_alt(self):  # type: (...) -> float
+        if self.lazy_loading:
+            tile_stats = self.get_tile_statistics()
+            return float(np.sum(tile_stats['sum']) / np.sum(tile_stats['count']))
         return float(np.nanmean(self.dem_data))
+
+    def get_tile_statistics(self):  # type: (...) -> dict
+        """
+        Returns per-tile statistics of a lazily loaded DEM.  These are computed with a single pass through the DEM
+        the first time they are needed.
+        :return: dictionary with 'min', 'max', 'sum' and 'count' entries, each a 2d numpy ndarray with one value per
+        tile.  Nodata values are excluded, tiles without any valid elevations have NaN min and max values.
+        """
+        if self._tile_stats is None:
+            n_tile_rows, n_tile_cols = self._get_n_tiles()
+            tile_stats = {'min': np.full((n_tile_rows, n_tile_cols), np.nan),
+                          'max': np.full((n_tile_rows, n_tile_cols), np.nan),
+                          'sum': np.zeros((n_tile_rows, n_tile_cols)),
+                          'count': np.zeros((n_tile_rows, n_tile_cols), dtype=int)}
+            for tile_row in range(n_tile_rows):
+                for tile_col in range(n_tile_cols):
+                    tile = self._get_tile(tile_row, tile_col)
+                    valid = np.isfinite(tile)
+                    n_valid = np.count_nonzero(valid)
+                    if n_valid > 0:
+                        tile_stats['min'][tile_row, tile_col] = np.min(tile[valid])
+                        tile_stats['max'][tile_row, tile_col] = np.max(tile[valid])
+                        tile_stats['sum'][tile_row, tile_col] = np.sum(tile[valid])
+                        tile_stats['count'][tile_row, tile_col] = n_valid
+            self._tile_stats = tile_stats
+        return self._tile_stats
+
+    def _get_n_tiles(self):  # type: (...) -> (int, int)
+        n_tile_rows = int(np.ceil(self.gtiff.get_metadata().get_npix_y() / self.tile_size))
+        n_tile_cols = int(np.ceil(self.gtiff.get_metadata().get_npix_x() / self.tile_size))
+        return n_tile_rows, n_tile_cols
+
+    def _clear_tiles(self):  # type: (...) -> None
+        self._tile_cache = OrderedDict()
+        self._tile_stats = None
+        self._min_max_levels = None
+
+    def _get_tile(self,
+                  tile_row,  # type: int
+                  tile_col  # type: int
+                  ):  # type: (...) -> ndarray
+        """
+        Returns a DEM tile as floats with nodata values set to NaN, reading it from disk if it is not cached
+        """
+        tile_key = (tile_row, tile_col)
+        if tile_key in self._tile_cache:
+            self._tile_cache.move_to_end(tile_key)
+            return self._tile_cache[tile_key]
+
+        x_offset = tile_col * self.tile_size
+        y_offset = tile_row * self.tile_size
+        x_size = min(self.tile_size, self.gtiff.get_metadata().get_npix_x() - x_offset)
+        y_size = min(self.tile_size, self.gtiff.get_metadata().get_npix_y() - y_offset)
+        band = self.gtiff.get_dset().GetRasterBand(1)
+        tile = band.ReadAsArray(x_offset, y_offset, x_size, y_size).astype(self.elevation_dtype)
+        if self.nodata_value is not None:
+            tile[tile == self.nodata_value] = np.nan
+
+        self._tile_cache[tile_key] = tile
+        while len(self._tile_cache) > self.max_cached_tiles:
+            self._tile_cache.popitem(last=False)
+        return tile
+
+    def _get_dem_values(self,
+                        pixel_rows,  # type: ndarray
+                        pixel_cols  # type: ndarray
+                        ):  # type: (...) -> ndarray
+        """
+        Gathers DEM values at integer pixel locations, from dem_data or from the tile cache in lazy mode
+        """
+        if not self.lazy_loading:
+            return self.dem_data[pixel_rows, pixel_cols]
+        pixel_rows = np.asarray(pixel_rows)
+        pixel_cols = np.asarray(pixel_cols)
+        values = np.zeros(pixel_rows.shape, dtype=self.elevation_dtype)
+        flat_rows = np.ravel(pixel_rows)
+        flat_cols = np.ravel(pixel_cols)
+        flat_values = np.ravel(values)
+        n_tile_cols = self._get_n_tiles()[1]
+        tile_ids = (flat_rows // self.tile_size) * n_tile_cols + flat_cols // self.tile_size
+        # group the pixels by tile so that every tile is looked up once
+        order = np.argsort(tile_ids, kind='stable')
+        unique_tile_ids, tile_starts = np.unique(tile_ids[order], return_index=True)
+        tile_ends = np.append(tile_starts[1:], len(order))
+        for tile_id, tile_start, tile_end in zip(unique_tile_ids, tile_starts, tile_ends):
+            tile_row, tile_col = divmod(int(tile_id), n_tile_cols)
+            tile = self._get_tile(tile_row, tile_col)
+            in_tile = order[tile_start:tile_end]
+            flat_values[in_tile] = tile[flat_rows[in_tile] - tile_row * self.tile_size,
+                                        flat_cols[in_tile] - tile_col * self.tile_size]
+        return np.reshape(flat_values, pixel_rows.shape)
@@ -0,0 +1,309 @@
+from __future__ import division
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from numpy import ndarray
+from osgeo import gdal_array
+from pyproj import Proj
+from shapely.geometry import Polygon, box
+from shapely.geometry.base import BaseGeometry
+from shapely.ops import unary_union
+from shapely.strtree import STRtree
+
+from resippy.image_objects.earth_overhead.abstract_earth_overhead_image import AbstractEarthOverheadImage
+from resippy.image_objects.earth_overhead.geotiff.geotiff_image import GeotiffImage
+from resippy.photogrammetry.dem.abstract_dem import AbstractDem
+from resippy.photogrammetry.dem.dem_factory import DemFactory
+from resippy.photogrammetry import crs_defs as crs_defs
+from resippy.photogrammetry import ortho_tools as ortho_tools
+from resippy.utils.photogrammetry_utils import create_ground_grid, world_poly_to_geo_t, reproject_geometry
+
+BLENDING_METHODS = ['feather', 'nadir']
+
+# images and DEM rebuilt by the mosaicking pool workers.  Images are rebuilt the first time a worker needs them.
+_mosaic_worker_state = {}
+
+
+class OrthoMosaic:
+    """
+    Mosaics many overhead images, such as the captures of a flight, into a single orthorectified geotiff.  The
+    footprint of every image is stored in a spatial index (a shapely STRtree, which is a packed R-tree).  The mosaic
+    is written one output tile at a time, and each tile only orthorectifies the images whose footprints intersect it.
+    Overlapping images are blended either with feather weights, which fall off linearly towards the edges of each
+    image, or by keeping, for every output pixel, the image in which the pixel is closest to the image center.  The
+    latter approximates closest-to-nadir selection for near-nadir frame cameras.
+    """
+
+    def __init__(self):
+        self._images = []  # type: list
+        self._footprints = []  # type: list
+        self._footprint_index = None  # type: STRtree
+        self._dem = None  # type: AbstractDem
+        self._world_proj = crs_defs.PROJ_4326  # type: Proj
+        self._bands = None  # type: list
+
+    @classmethod
+    def init_from_images(cls,
+                         overhead_images,  # type: list
+                         dem=None,  # type: AbstractDem
+                         world_proj=crs_defs.PROJ_4326,  # type: Proj
+                         bands=None,  # type: list
+                         footprints=None,  # type: list
+                         ):  # type: (...) -> OrthoMosaic
+        """
+        Creates a mosaic from a list of overhead images
+        :param overhead_images: list of AbstractEarthOverheadImage objects
+        :param dem: DEM used for the ground elevations, defaults to a constant elevation of 0
+        :param world_proj: projection of the footprints and of the output mosaic
+        :param bands: list of bands to mosaic, defaults to all bands of the first image
+        :param footprints: optional list of image footprints in world_proj.  If they are not provided they are
+        computed with ortho_tools.get_extent, which returns footprints in the DEM's projection, and reprojected to
+        world_proj.
+        :return: OrthoMosaic
+        """
+        if dem is None:
+            dem = DemFactory.constant_elevation(0)
+            dem.set_projection(crs_defs.PROJ_4326)
+        if bands is None:
+            bands = list(range(overhead_images[0].get_metadata().get_n_bands()))
+        if footprints is None:
+            footprints = [reproject_geometry(ortho_tools.get_extent(overhead_image, dem=dem, bands=bands),
+                                             dem.get_projection(), world_proj)
+                          for overhead_image in overhead_images]
+
+        mosaic = cls()
+        mosaic._images = list(overhead_images)
+        mosaic._footprints = list(footprints)
+        mosaic._footprint_index = STRtree(mosaic._footprints)
+        mosaic._dem = dem
+        mosaic._world_proj = world_proj
+        mosaic._bands = list(bands)
+        return mosaic
+
+    def get_images(self):  # type: (...) -> list
+        return self._images
+
+    def get_footprints(self):  # type: (...) -> list
+        return self._footprints
+
+    def get_extent(self):  # type: (...) -> Polygon
+        """
+        :return: the envelope of all image footprints
+        """
+        return unary_union(self._footprints).envelope
+
+    def get_contributing_images(self,
+                                region,  # type: BaseGeometry
+                                ):  # type: (...) -> list
+        """
+        Finds the images whose footprints intersect a region
+        :param region: shapely geometry in the mosaic's projection
+        :return: sorted list of image indices
+        """
+        candidates = self._footprint_index.query(region)
+        if len(candidates) > 0 and isinstance(candidates[0], BaseGeometry):
+            # older versions of shapely return the geometries rather than their indices
+            footprint_indices = {id(footprint): i for i, footprint in enumerate(self._footprints)}
+            candidates = [footprint_indices[id(candidate)] for candidate in candidates]
+        return sorted([int(i) for i in candidates if self._footprints[int(i)].intersects(region)])
+
+    def create_mosaic(self,
+                      output_fname,  # type: str
+                      ortho_nx_pix,  # type: int
+                      ortho_ny_pix,  # type: int
+                      world_polygon=None,  # type: Polygon
+                      tile_size=512,  # type: int
+                      blending='feather',  # type: str
+                      nodata_val=0,  # type: float
+                      interpolation='nearest',  # type: str
+                      warp_backend='skimage',  # type: str
+                      workers=None,  # type: int
+                      ):  # type: (...) -> GeotiffImage
+        """
+        Orthorectifies and blends the images into a tiled geotiff, one output tile at a time
+        :param output_fname: output geotiff filename
+        :param ortho_nx_pix: number of x pixels in the mosaic
+        :param ortho_ny_pix: number of y pixels in the mosaic
+        :param world_polygon: polygon whose envelope is the extent of the mosaic, defaults to the extent of all
+        footprints
+        :param tile_size: size of the square output tiles, in pixels
+        :param blending: 'feather' or 'nadir'
+        :param nodata_val: nodata value of the mosaic, pixels of the images with this value are not used
+        :param interpolation: interpolation method used to warp the image bands
+        :param warp_backend: resampling backend, see image_utils.grid_warp_image_band
+        :param workers: if more than 1, output tiles are computed in a pool of this many processes
+        :return: the mosaic as a GeotiffImage
+        """
+        if blending not in BLENDING_METHODS:
+            raise ValueError("blending method should be one of " + str(BLENDING_METHODS))
+        if world_polygon is None:
+            world_polygon = self.get_extent()
+        envelope = world_polygon.envelope
+        minx, miny, maxx, maxy = envelope.bounds
+        geo_t = world_poly_to_geo_t(envelope, ortho_nx_pix, ortho_ny_pix)
+
+        image_dtype = self._images[0].read_window(self._bands[0], 0, 0, 1, 1).dtype
+        tile_params = {"grid_bounds": (minx, maxx, miny, maxy),
+                       "ortho_npix": (ortho_nx_pix, ortho_ny_pix),
+                       "world_proj": self._world_proj,
+                       "bands": self._bands,
+                       "blending": blending,
+                       "nodata_val": nodata_val,
+                       "interpolation": interpolation,
+                       "warp_backend": warp_backend,
+                       "image_dtype": image_dtype}
+
+        x_gsd = (maxx - minx) / ortho_nx_pix
+        y_gsd = (maxy - miny) / ortho_ny_pix
+        tasks = []
+        for y_offset in range(0, ortho_ny_pix, tile_size):
+            for x_offset in range(0, ortho_nx_pix, tile_size):
+                window = (x_offset, y_offset, min(tile_size, ortho_nx_pix - x_offset),
+                          min(tile_size, ortho_ny_pix - y_offset))
+                tile_polygon = box(minx + x_offset * x_gsd, maxy - (y_offset + window[3]) * y_gsd,
+                                   minx + (x_offset + window[2]) * x_gsd, maxy - y_offset * y_gsd)
+                tasks.append((window, self.get_contributing_images(tile_polygon)))
+
+        if workers is not None and workers > 1:
+            image_descriptions = [ortho_tools._get_picklable_description(overhead_image)
+                                  for overhead_image in self._images]
+            executor = ProcessPoolExecutor(max_workers=workers,
+                                           initializer=_init_mosaic_worker,
+                                           initargs=(image_descriptions,
+                                                     ortho_tools._get_picklable_description(self._dem),
+                                                     tile_params))
+            tile_results = executor.map(_mosaic_worker_task, tasks)
+        else:
+            executor = None
+            tile_results = (_mosaic_tile(lambda i: self._images[i], self._dem, task, tile_params) for task in tasks)
+
+        try:
+            gtiff_image = GeotiffImage.write_tiles_to_disk(output_fname,
+                                                           ((window[0], window[1], np.stack(tile, axis=2))
+                                                            for (window, image_indices), tile in
+                                                            zip(tasks, tile_results)),
+                                                           ortho_nx_pix, ortho_ny_pix, len(self._bands),
+                                                           gdal_array.NumericTypeCodeToGDALTypeCode(image_dtype),
+                                                           geo_t, self._world_proj, nodata_val=nodata_val)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return gtiff_image
+
+
+def _mosaic_tile(get_image,  # type: callable
+                 dem,  # type: AbstractDem
+                 task,  # type: tuple
+                 tile_params,  # type: dict
+                 ):  # type: (...) -> list
+    """
+    Orthorectifies and blends the contributing images of one output tile
+    :param get_image: function that returns an image given its index
+    :param dem: DEM used for the ground elevations
+    :param task: (window, contributing image indices)
+    :param tile_params: dictionary of mosaic parameters
+    :return: list of 2d ndarrays, one for each band
+    """
+    window, image_indices = task
+    minx, maxx, miny, maxy = tile_params["grid_bounds"]
+    ortho_nx_pix, ortho_ny_pix = tile_params["ortho_npix"]
+    world_proj = tile_params["world_proj"]
+    nodata_val = tile_params["nodata_val"]
+    image_dtype = tile_params["image_dtype"]
+    bands = tile_params["bands"]
+    tile_shape = (window[3], window[2])
+
+    weighted_sums = [np.zeros(tile_shape) for band in bands]
+    weights = [np.zeros(tile_shape) for band in bands]
+    if len(image_indices) > 0:
+        ground_x, ground_y = create_ground_grid(minx, maxx, miny, maxy, ortho_nx_pix, ortho_ny_pix, window=window)
+        alts = dem.get_elevations(ground_x, ground_y, world_proj)
+
+    for image_index in image_indices:
+        overhead_image = get_image(image_index)
+        point_calc = overhead_image.get_point_calculator()
+        npix_x = overhead_image.get_metadata().get_npix_x()
+        npix_y = overhead_image.get_metadata().get_npix_y()
+        pixels_x, pixels_y = None, None
+        for i, band in enumerate(bands):
+            if pixels_x is None or point_calc.bands_coregistered() is not True:
+                map_band = band if point_calc.bands_coregistered() is not True else 0
+                pixels_x, pixels_y = point_calc.lon_lat_alt_to_pixel_x_y(ground_x, ground_y, alts,
+                                                                         band=map_band, world_proj=world_proj)
+                pixel_weights = _get_blending_weights(pixels_x, pixels_y, npix_x, npix_y, tile_params["blending"])
+            warped = ortho_tools._warp_block_from_window(overhead_image, band, pixels_x, pixels_y, npix_x, npix_y,
+                                                         np.float64, nodata_val, tile_params["interpolation"],
+                                                         tile_params["warp_backend"])
+            band_weights = np.where(warped != nodata_val, pixel_weights, 0)
+            if tile_params["blending"] == 'feather':
+                weighted_sums[i] += band_weights * np.where(band_weights > 0, warped, 0)
+                weights[i] += band_weights
+            else:
+                # keep the value of the image with the highest weight, i.e. closest to the image center
+                better = band_weights > weights[i]
+                weighted_sums[i][better] = warped[better]
+                weights[i][better] = band_weights[better]
+
+    tile = []
+    for weighted_sum, weight in zip(weighted_sums, weights):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if tile_params["blending"] == 'feather':
+                blended = weighted_sum / weight
+            else:
+                blended = weighted_sum
+        blended[weight <= 0] = nodata_val
+        if np.issubdtype(image_dtype, np.integer):
+            blended = np.round(blended)
+        tile.append(blended.astype(image_dtype))
+    return tile
+
+
+def _get_blending_weights(pixels_x,  # type: ndarray
+                          pixels_y,  # type: ndarray
+                          npix_x,  # type: int
+                          npix_y,  # type: int
+                          blending,  # type: str
+                          ):  # type: (...) -> ndarray
+    """
+    Computes blending weights from image pixel locations.  Feather weights are the distance to the nearest image
+    edge in pixels, nadir weights decrease with the distance from the image center.  Locations outside of the image
+    have a weight of 0.
+    """
+    with np.errstate(invalid='ignore'):
+        if blending == 'feather':
+            weights = np.minimum(np.minimum(pixels_x + 0.5, npix_x - 0.5 - pixels_x),
+                                 np.minimum(pixels_y + 0.5, npix_y - 0.5 - pixels_y))
+        else:
+            center_distances = np.sqrt(np.square((pixels_x - (npix_x - 1) / 2.0) / npix_x) +
+                                       np.square((pixels_y - (npix_y - 1) / 2.0) / npix_y))
+            weights = 1.0 - center_distances
+            outside = (pixels_x < -0.5) | (pixels_x >= npix_x - 0.5) | (pixels_y < -0.5) | (pixels_y >= npix_y - 0.5)
+            weights[outside] = 0
+    weights[np.logical_not(np.isfinite(weights))] = 0
+    return np.maximum(weights, 0)
+
+
+def _init_mosaic_worker(image_descriptions,  # type: list
+                        dem_description,  # type: tuple
+                        tile_params,  # type: dict
+                        ):  # type: (...) -> None
+    rebuild_dem, dem_args = dem_description
+    _mosaic_worker_state["image_descriptions"] = image_descriptions
+    _mosaic_worker_state["images"] = {}
+    _mosaic_worker_state["dem"] = rebuild_dem(*dem_args)
+    _mosaic_worker_state["tile_params"] = tile_params
+
+
+def _get_worker_image(image_index,  # type: int
+                      ):  # type: (...) -> AbstractEarthOverheadImage
+    images = _mosaic_worker_state["images"]
+    if image_index not in images:
+        rebuild_image, image_args = _mosaic_worker_state["image_descriptions"][image_index]
+        images[image_index] = rebuild_image(*image_args)
+    return images[image_index]
+
+
+def _mosaic_worker_task(task,  # type: tuple
+                        ):  # type: (...) -> list
+    return _mosaic_tile(_get_worker_image, _mosaic_worker_state["dem"], task, _mosaic_worker_state["tile_params"])
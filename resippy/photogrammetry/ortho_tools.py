@@ -1,9 +1,13 @@
 from __future__ import division
 
+import os
+import tempfile
 import warnings
+from concurrent.futures import ProcessPoolExecutor
 from typing import Union
 
 import numpy as np
+from osgeo import gdal_array
 from numpy.core.multiarray import ndarray
 from shapely.geometry import MultiPoint, Polygon
 from shapely.ops import unary_union
@@ -12,10 +16,16 @@ from pyproj import Proj
 from resippy.image_objects.earth_overhead.abstract_earth_overhead_image import AbstractEarthOverheadImage
 from resippy.image_objects.earth_overhead.geotiff.geotiff_image_factory import GeotiffImageFactory
 from resippy.image_objects.earth_overhead.geotiff.geotiff_image import GeotiffImage
+from resippy.image_objects.earth_overhead.earth_overhead_point_calculators.approximate_point_calc \
+    import ApproximatePointCalc
+from resippy.image_objects.earth_overhead.earth_overhead_point_calculators.abstract_earth_overhead_point_calc \
+    import AbstractEarthOverheadPointCalc
 from resippy.photogrammetry.dem.abstract_dem import AbstractDem
+from resippy.photogrammetry.dem.geotiff_dem import GeotiffDem
 from resippy.photogrammetry import crs_defs as crs_defs
 from resippy.utils.photogrammetry_utils import create_ground_grid, world_poly_to_geo_t
 from resippy.photogrammetry.dem.dem_factory import DemFactory
+from resippy.photogrammetry.warp_map import WarpMap
 from resippy.utils.image_utils import image_utils as image_utils
 import numbers
 import time
@@ -23,6 +33,11 @@ import logging
 
 import matplotlib.pyplot as plt
 
+DEFAULT_ORTHO_BLOCK_SIZE = 512
+
+# image, point calculator and DEM objects rebuilt once per process by the orthorectification pool workers
+_ortho_worker_state = {}
+
 
 def get_pixel_values(image_object,  # type: AbstractEarthOverheadImage
                      lons,  # type: ndarray
@@ -30,32 +45,82 @@ def get_pixel_values(image_object,  # type: AbstractEarthOverheadImage
                      alts,  # type: ndarray
                      window=8  # type: int
                      ):  # type: (...) -> ndarray
-
+    """
+    Gets the mean pixel value of every band in a window around the image location of each ground point.  Windows
+    span [x - window/2, x + window/2) and [y - window/2, y + window/2) around the rounded pixel locations.  Pixels
+    equal to the image's nodata value, non-finite pixels and the parts of windows outside of the image are excluded
+    from the means.  Points whose windows contain no valid pixels get NaN.
+    :param image_object: image to sample
+    :param lons: longitudes of the ground points
+    :param lats: latitudes of the ground points
+    :param alts: altitudes of the ground points
+    :param window: window size in pixels
+    :return: ndarray of dimensions (n_bands, n_points)
+    """
     nodata = image_object.get_metadata().get_nodata_val()
-    wh = np.round(window/2.0).astype(np.int)
+    wh = int(np.round(window/2.0))
+    lons = np.ravel(lons)
+    lats = np.ravel(lats)
+    if np.ndim(alts) > 0:
+        alts = np.ravel(alts)
+    npix_x = image_object.get_metadata().get_npix_x()
+    npix_y = image_object.get_metadata().get_npix_y()
     pix_vals = []
     for band in range(image_object.get_metadata().get_n_bands()):
-        img = image_object.read_band_from_disk(band)
-        x,y = image_object.get_point_calculator().lon_lat_alt_to_pixel_x_y(lons, lats, alts, band=band)
-        locs = zip(np.round(x).astype(np.int), np.round(y).astype(np.int))
-        vals = []
-        for item in locs:
-            try:
-                xmin = item[0] - wh
-                xmax = item[0] + wh
-                ymin = item[1] - wh
-                ymax = item[1] + wh
-                pix_win = img[ymin:ymax, xmin:xmax]
-                good_inds = pix_win != nodata
-                val = np.mean(pix_win[good_inds])
-            except IndexError:
-                val = np.NaN
-            vals.append(val)
+        x, y = image_object.get_point_calculator().lon_lat_alt_to_pixel_x_y(lons, lats, alts, band=band)
+        finite = np.isfinite(x) & np.isfinite(y)
+        x = np.where(finite, np.round(x), 0)
+        y = np.where(finite, np.round(y), 0)
+        # clip the windows to the image, windows that are entirely outside of it become empty
+        xmin = np.clip(x - wh, 0, npix_x).astype(np.int64)
+        xmax = np.clip(x + wh, 0, npix_x).astype(np.int64)
+        ymin = np.clip(y - wh, 0, npix_y).astype(np.int64)
+        ymax = np.clip(y + wh, 0, npix_y).astype(np.int64)
+        vals = np.zeros(len(lons)) + np.NaN
+        sampled = finite & (xmax > xmin) & (ymax > ymin)
+        if sampled.any():
+            # only read the part of the band that the windows cover
+            x0, y0 = int(xmin[sampled].min()), int(ymin[sampled].min())
+            nx, ny = int(xmax[sampled].max()) - x0, int(ymax[sampled].max()) - y0
+            img = image_object.read_window(band, x0, y0, nx, ny)[:, :, 0]
+            value_table, count_table = _create_summed_area_tables(img, nodata)
+            window_indices = (xmin[sampled] - x0, xmax[sampled] - x0, ymin[sampled] - y0, ymax[sampled] - y0)
+            window_sums = _summed_area_table_window_sums(value_table, *window_indices)
+            window_counts = _summed_area_table_window_sums(count_table, *window_indices)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                vals[sampled] = np.where(window_counts > 0, window_sums / window_counts, np.NaN)
         pix_vals.append(vals)
 
     return np.array(pix_vals)
 
 
+def _create_summed_area_tables(image_band,  # type: ndarray
+                               nodata_val=None,  # type: float
+                               ):  # type: (...) -> (ndarray, ndarray)
+    """
+    Creates summed-area tables of the valid pixel values and valid pixel counts of an image band.  The tables have an
+    extra leading row and column of zeros, so that entry [y, x] is the sum over image_band[:y, :x].
+    """
+    valid = np.isfinite(image_band)
+    if nodata_val is not None:
+        valid &= image_band != nodata_val
+    ny, nx = np.shape(image_band)
+    value_table = np.zeros((ny + 1, nx + 1))
+    count_table = np.zeros((ny + 1, nx + 1))
+    np.cumsum(np.cumsum(np.where(valid, image_band, 0), axis=0, dtype=np.float64), axis=1, out=value_table[1:, 1:])
+    np.cumsum(np.cumsum(valid, axis=0, dtype=np.float64), axis=1, out=count_table[1:, 1:])
+    return value_table, count_table
+
+
+def _summed_area_table_window_sums(table,  # type: ndarray
+                                   xmin,  # type: ndarray
+                                   xmax,  # type: ndarray
+                                   ymin,  # type: ndarray
+                                   ymax,  # type: ndarray
+                                   ):  # type: (...) -> ndarray
+    return table[ymax, xmax] - table[ymin, xmax] - table[ymax, xmin] + table[ymin, xmin]
+
+
 # TODO replace this with the ray caster once it is tested and more robust.
 def get_pixel_lon_lats(overhead_image,  # type: AbstractEarthOverheadImage
                        dem=None,  # type: AbstractDem
@@ -72,7 +137,10 @@ def get_pixel_lon_lats(overhead_image,  # type: AbstractEarthOverheadImage
     if pixels_x is None or pixels_y is None:
         pixels_x, pixels_y = image_utils.create_pixel_grid(overhead_image.get_metadata().get_npix_x(),
                                                            overhead_image.get_metadata().get_npix_y())
-    alts = dem.get_highest_alt()
+    # start from the highest DEM elevation within the image footprint rather than the whole DEM
+    footprint = point_calc.get_ray_footprint_bounds(pixels_x, pixels_y, dem.get_highest_alt(), dem.get_lowest_alt(),
+                                                    band=band)
+    alts = dem.get_highest_alt(region=footprint, world_proj=point_calc.get_projection())
     lons_highest, lats_highest = point_calc.pixel_x_y_alt_to_lon_lat(pixels_x, pixels_y, alts,
                                                                      band=band,
                                                                      pixel_error_threshold=pixel_error_threshold,
@@ -117,8 +185,56 @@ def create_ortho_gtiff_image_world_to_sensor(overhead_image,  # type: AbstractEa
                                              nodata_val=0,  # type: float
                                              output_fname=None,  # type: str
                                              interpolation='nearest',  # type: str
-                                             mask_no_data_region=False # type: bool
+                                             mask_no_data_region=False,  # type: bool
+                                             max_approximation_pixel_error=None,  # type: float
+                                             block_size=None,  # type: int
+                                             workers=None,  # type: int
+                                             warp_backend='skimage',  # type: str
+                                             mask_occluded_pixels=False,  # type: bool
+                                             occlusion_alt_tolerance=1.0  # type: float
                                              ):  # type:  (...) -> GeotiffImage
+    """
+    Orthorectifies an overhead image onto a north-up grid by projecting the ground grid into the image and warping
+    the image bands onto it.
+    :param overhead_image: image to orthorectify
+    :param ortho_nx_pix: number of x pixels in the output image
+    :param ortho_ny_pix: number of y pixels in the output image
+    :param world_polygon: polygon whose envelope is the extent of the output image
+    :param world_proj: projection of world_polygon and of the output image
+    :param dem: DEM used for the ground elevations, defaults to a constant elevation of 0
+    :param bands: list of bands to orthorectify, defaults to all bands
+    :param nodata_val: nodata value of the output image
+    :param output_fname: output geotiff filename
+    :param interpolation: interpolation method used to warp the image bands
+    :param mask_no_data_region: if True an alpha band that masks the nodata region is added to the output
+    :param max_approximation_pixel_error: if set, the point calculator is wrapped in an ApproximatePointCalc with
+    this pixel tolerance
+    :param block_size: if set, the output is processed and written to output_fname in square blocks of this many
+    pixels, so that memory use does not grow with the output size.  output_fname must be provided in this case.
+    :param workers: if more than 1, blocks (and bands, for images whose bands are not coregistered) are
+    orthorectified in a pool of this many processes.  This implies block processing, with a default block size of
+    DEFAULT_ORTHO_BLOCK_SIZE.  Workers rebuild file-backed geotiff images and DEMs from their filenames, other image
+    and DEM objects are pickled.
+    :param warp_backend: resampling backend used to warp the image bands, see image_utils.grid_warp_image_band
+    :param mask_occluded_pixels: if True, output pixels whose ground locations are hidden from the sensor by the DEM
+    are set to nodata_val, to suppress layover.  Visibility is computed with a sensor space z-buffer, see
+    create_visibility_map.
+    :param occlusion_alt_tolerance: altitude tolerance of the z-buffer visibility test, in DEM units
+    :return: the orthorectified image as a GeotiffImage
+    """
+    if block_size is None and workers is not None and workers > 1:
+        block_size = DEFAULT_ORTHO_BLOCK_SIZE
+    if block_size is not None:
+        if output_fname is None:
+            raise ValueError("an output filename is required to stream the orthorectified image to disk")
+        return _create_ortho_gtiff_streaming(overhead_image, ortho_nx_pix, ortho_ny_pix, world_polygon,
+                                             world_proj=world_proj, dem=dem, bands=bands, nodata_val=nodata_val,
+                                             output_fname=output_fname, interpolation=interpolation,
+                                             mask_no_data_region=mask_no_data_region,
+                                             max_approximation_pixel_error=max_approximation_pixel_error,
+                                             block_size=block_size, workers=workers, warp_backend=warp_backend,
+                                             mask_occluded_pixels=mask_occluded_pixels,
+                                             occlusion_alt_tolerance=occlusion_alt_tolerance)
 
     envelope = world_polygon.envelope
     minx, miny, maxx, maxy = envelope.bounds
@@ -133,30 +249,52 @@ def create_ortho_gtiff_image_world_to_sensor(overhead_image,  # type: AbstractEa
     if bands is None:
         bands = list(range(overhead_image.get_metadata().get_n_bands()))
 
+    point_calc = overhead_image.get_point_calculator()
+    if max_approximation_pixel_error is not None:
+        point_calc = ApproximatePointCalc.init_from_point_calc(point_calc,
+                                                               max_pixel_error=max_approximation_pixel_error)
+
     images = []
-    if overhead_image.get_point_calculator().bands_coregistered() is not True:
+    # occlusion is computed with the geometry of band 0
+    visibility_pixels_x, visibility_pixels_y = None, None
+    if point_calc.bands_coregistered() is not True:
         for band in bands:
-            pixels_x, pixels_y = overhead_image.get_point_calculator(). \
+            pixels_x, pixels_y = point_calc. \
                 lon_lat_alt_to_pixel_x_y(image_ground_grid_x, image_ground_grid_y, alts, band=band, world_proj=world_proj)
-            image_data = overhead_image.read_band_from_disk(band)
+            if band == 0:
+                visibility_pixels_x, visibility_pixels_y = pixels_x, pixels_y
+            image_data = overhead_image.read_band(band)
             im_tp = image_data.dtype
 
             regridded = image_utils.grid_warp_image_band(image_data, pixels_x, pixels_y,
-                                                         nodata_val=nodata_val, interpolation=interpolation)
+                                                         nodata_val=nodata_val, interpolation=interpolation,
+                                                         backend=warp_backend)
             regridded = regridded.astype(im_tp)
             images.append(regridded)
     else:
-        pixels_x, pixels_y = overhead_image.get_point_calculator(). \
+        pixels_x, pixels_y = point_calc. \
             lon_lat_alt_to_pixel_x_y(image_ground_grid_x, image_ground_grid_y, alts, band=0, world_proj=world_proj)
+        visibility_pixels_x, visibility_pixels_y = pixels_x, pixels_y
         for band in bands:
-            image_data = overhead_image.read_band_from_disk(band)
+            image_data = overhead_image.read_band(band)
             im_tp = image_data.dtype
             regridded = image_utils.grid_warp_image_band(image_data, pixels_x, pixels_y,
-                                                         nodata_val=nodata_val, interpolation=interpolation)
+                                                         nodata_val=nodata_val, interpolation=interpolation,
+                                                         backend=warp_backend)
             regridded = regridded.astype(im_tp)
             images.append(regridded)
 
     orthorectified_image = np.stack(images, axis=2)
+    if mask_occluded_pixels:
+        if visibility_pixels_x is None:
+            # band 0 was not orthorectified, and the bands are not coregistered
+            visibility_pixels_x, visibility_pixels_y = point_calc.lon_lat_alt_to_pixel_x_y(
+                image_ground_grid_x, image_ground_grid_y, alts, band=0, world_proj=world_proj)
+        zbuffer = _create_zbuffer(overhead_image, point_calc, dem, minx, maxx, miny, maxy, ortho_nx_pix,
+                                  ortho_ny_pix, world_proj, DEFAULT_ORTHO_BLOCK_SIZE, occlusion_alt_tolerance)
+        visible = _get_zbuffer_visibility(zbuffer, visibility_pixels_x, visibility_pixels_y, alts,
+                                          occlusion_alt_tolerance)
+        orthorectified_image[np.logical_not(visible)] = nodata_val
     if mask_no_data_region:
         orthorectified_image = mask_image(orthorectified_image, nodata_val)
 
@@ -168,11 +306,324 @@ def create_ortho_gtiff_image_world_to_sensor(overhead_image,  # type: AbstractEa
     return gtiff_image
 
 
+def create_ortho_gtiff_image_from_warp_map(warp_map,  # type: WarpMap
+                                           overhead_image=None,  # type: AbstractEarthOverheadImage
+                                           image_data=None,  # type: ndarray
+                                           bands=None,  # type: List[int]
+                                           nodata_val=0,  # type: float
+                                           output_fname=None,  # type: str
+                                           interpolation='nearest',  # type: str
+                                           mask_no_data_region=False,  # type: bool
+                                           warp_backend='skimage',  # type: str
+                                           ):  # type: (...) -> GeotiffImage
+    """
+    Orthorectifies an image, or image data in the sensor's pixel space such as a detection map, using a precomputed
+    warp map.  No projections or DEM lookups are done.
+    :param warp_map: warp map computed for the sensor geometry and output grid
+    :param overhead_image: image to orthorectify, either this or image_data should be provided
+    :param image_data: ndarray of dimensions (ny, nx) or (ny, nx, nbands) to orthorectify
+    :param bands: list of bands to orthorectify, defaults to all bands
+    :param nodata_val: nodata value of the output image
+    :param output_fname: output geotiff filename
+    :param interpolation: interpolation method used to warp the image bands
+    :param mask_no_data_region: if True an alpha band that masks the nodata region is added to the output
+    :param warp_backend: resampling backend used to warp the image bands, see image_utils.grid_warp_image_band
+    :return: the orthorectified image as a GeotiffImage
+    """
+    if image_data is not None and image_data.ndim == 2:
+        image_data = np.expand_dims(image_data, axis=2)
+    if bands is None:
+        if image_data is not None:
+            bands = list(range(image_data.shape[2]))
+        else:
+            bands = list(range(overhead_image.get_metadata().get_n_bands()))
+
+    images = []
+    for band in bands:
+        if image_data is not None:
+            band_data = image_data[:, :, band]
+        else:
+            band_data = overhead_image.read_band(band)
+        images.append(warp_map.warp_image_band(band_data, band=band, nodata_val=nodata_val,
+                                               interpolation=interpolation, backend=warp_backend))
+
+    orthorectified_image = np.stack(images, axis=2)
+    if mask_no_data_region:
+        orthorectified_image = mask_image(orthorectified_image, nodata_val)
+
+    gtiff_image = GeotiffImageFactory.from_numpy_array(orthorectified_image, warp_map.get_geot(),
+                                                       warp_map.get_projection())
+    gtiff_image.get_metadata().set_nodata_val(nodata_val)
+    if output_fname is not None:
+        gtiff_image.write_to_disk(output_fname)
+
+    return gtiff_image
+
+
+def _create_ortho_gtiff_streaming(overhead_image,  # type: AbstractEarthOverheadImage
+                                  ortho_nx_pix,  # type: int
+                                  ortho_ny_pix,  # type: int
+                                  world_polygon,  # type: Polygon
+                                  world_proj=crs_defs.PROJ_4326,  # type: Proj
+                                  dem=None,  # type: AbstractDem
+                                  bands=None,  # type: List[int]
+                                  nodata_val=0,  # type: float
+                                  output_fname=None,  # type: str
+                                  interpolation='nearest',  # type: str
+                                  mask_no_data_region=False,  # type: bool
+                                  max_approximation_pixel_error=None,  # type: float
+                                  block_size=DEFAULT_ORTHO_BLOCK_SIZE,  # type: int
+                                  workers=None,  # type: int
+                                  warp_backend='skimage',  # type: str
+                                  mask_occluded_pixels=False,  # type: bool
+                                  occlusion_alt_tolerance=1.0,  # type: float
+                                  ):  # type:  (...) -> GeotiffImage
+    """
+    Streaming version of create_ortho_gtiff_image_world_to_sensor.  The output raster is processed one block at a
+    time: the ground grid, DEM elevations and pixel maps are computed for the block, only the window of the source
+    image that the block needs is read and warped, and the result is written into a tiled geotiff.  If more than
+    one worker is requested the blocks are computed in a process pool, and written in order as they complete.
+    """
+    envelope = world_polygon.envelope
+    minx, miny, maxx, maxy = envelope.bounds
+    geo_t = world_poly_to_geo_t(envelope, ortho_nx_pix, ortho_ny_pix)
+
+    if dem is None:
+        dem = DemFactory.constant_elevation(0)
+        dem.set_projection(crs_defs.PROJ_4326)
+
+    if bands is None:
+        bands = list(range(overhead_image.get_metadata().get_n_bands()))
+
+    point_calc = overhead_image.get_point_calculator()
+    if max_approximation_pixel_error is not None:
+        point_calc = ApproximatePointCalc.init_from_point_calc(point_calc,
+                                                               max_pixel_error=max_approximation_pixel_error)
+
+    image_dtype = overhead_image.read_window(bands[0], 0, 0, 1, 1).dtype
+    n_output_bands = len(bands)
+    if mask_no_data_region:
+        n_output_bands = n_output_bands + 1
+
+    block_params = {"grid_bounds": (minx, maxx, miny, maxy),
+                    "ortho_npix": (ortho_nx_pix, ortho_ny_pix),
+                    "world_proj": world_proj,
+                    "nodata_val": nodata_val,
+                    "interpolation": interpolation,
+                    "warp_backend": warp_backend,
+                    "image_dtype": image_dtype,
+                    "zbuffer": None,
+                    "occlusion_alt_tolerance": occlusion_alt_tolerance}
+    if mask_occluded_pixels:
+        block_params["zbuffer"] = _create_zbuffer(overhead_image, point_calc, dem, minx, maxx, miny, maxy,
+                                                  ortho_nx_pix, ortho_ny_pix, world_proj, block_size,
+                                                  occlusion_alt_tolerance)
+
+    # blocks of coregistered images share their pixel maps across bands, otherwise every band is a separate task
+    tasks = []
+    for y_offset in range(0, ortho_ny_pix, block_size):
+        for x_offset in range(0, ortho_nx_pix, block_size):
+            window = (x_offset, y_offset, min(block_size, ortho_nx_pix - x_offset),
+                      min(block_size, ortho_ny_pix - y_offset))
+            if point_calc.bands_coregistered() is True:
+                tasks.append((window, list(enumerate(bands))))
+            else:
+                tasks.extend([(window, [(output_band, band)]) for output_band, band in enumerate(bands)])
+
+    zbuffer_fname = None
+    if workers is not None and workers > 1:
+        worker_block_params = dict(block_params)
+        if block_params["zbuffer"] is not None:
+            # the z-buffer is shared with the workers through a memory mapped file, rather than pickled into each one
+            zbuffer_fd, zbuffer_fname = tempfile.mkstemp(suffix=".npy")
+            os.close(zbuffer_fd)
+            np.save(zbuffer_fname, block_params["zbuffer"])
+            worker_block_params["zbuffer"] = None
+            worker_block_params["zbuffer_fname"] = zbuffer_fname
+        executor = ProcessPoolExecutor(max_workers=workers,
+                                       initializer=_init_ortho_worker,
+                                       initargs=(_get_picklable_description(overhead_image),
+                                                 _get_picklable_description(dem),
+                                                 max_approximation_pixel_error,
+                                                 worker_block_params))
+        task_results = executor.map(_ortho_worker_task, tasks)
+    else:
+        executor = None
+        task_results = (_ortho_task(overhead_image, point_calc, dem, task, block_params) for task in tasks)
+
+    def tiles():
+        for (window, task_bands), blocks in zip(tasks, task_results):
+            for (output_band, band), block in zip(task_bands, blocks):
+                yield window[0], window[1], block, [output_band]
+                if mask_no_data_region and output_band == 0:
+                    alpha = np.zeros_like(block)
+                    alpha[block != nodata_val] = 255
+                    yield window[0], window[1], alpha, [n_output_bands - 1]
+
+    try:
+        gtiff_image = GeotiffImage.write_tiles_to_disk(output_fname, tiles(), ortho_nx_pix, ortho_ny_pix,
+                                                       n_output_bands,
+                                                       gdal_array.NumericTypeCodeToGDALTypeCode(image_dtype),
+                                                       geo_t, world_proj, nodata_val=nodata_val,
+                                                       alpha_band=mask_no_data_region)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if zbuffer_fname is not None:
+            os.remove(zbuffer_fname)
+    return gtiff_image
+
+
+def _ortho_task(overhead_image,  # type: AbstractEarthOverheadImage
+                point_calc,  # type: AbstractEarthOverheadPointCalc
+                dem,  # type: AbstractDem
+                task,  # type: tuple
+                block_params,  # type: dict
+                ):  # type: (...) -> list
+    """
+    Computes the orthorectified blocks for one output window and a list of (output band, image band) pairs
+    :return: list of 2d ndarrays, one for each band of the task
+    """
+    window, task_bands = task
+    minx, maxx, miny, maxy = block_params["grid_bounds"]
+    ortho_nx_pix, ortho_ny_pix = block_params["ortho_npix"]
+    world_proj = block_params["world_proj"]
+    ground_x, ground_y = create_ground_grid(minx, maxx, miny, maxy, ortho_nx_pix, ortho_ny_pix, window=window)
+    alts = dem.get_elevations(ground_x, ground_y, world_proj)
+
+    npix_x = overhead_image.get_metadata().get_npix_x()
+    npix_y = overhead_image.get_metadata().get_npix_y()
+    pixels_x, pixels_y = None, None
+    blocks = []
+    for output_band, band in task_bands:
+        if pixels_x is None or point_calc.bands_coregistered() is not True:
+            map_band = band if point_calc.bands_coregistered() is not True else 0
+            pixels_x, pixels_y = point_calc.lon_lat_alt_to_pixel_x_y(ground_x, ground_y, alts,
+                                                                     band=map_band, world_proj=world_proj)
+        blocks.append(_warp_block_from_window(overhead_image, band, pixels_x, pixels_y, npix_x, npix_y,
+                                              block_params["image_dtype"], block_params["nodata_val"],
+                                              block_params["interpolation"], block_params["warp_backend"]))
+    if block_params["zbuffer"] is not None:
+        visibility_pixels_x, visibility_pixels_y = point_calc.lon_lat_alt_to_pixel_x_y(ground_x, ground_y, alts,
+                                                                                       band=0, world_proj=world_proj)
+        visible = _get_zbuffer_visibility(block_params["zbuffer"], visibility_pixels_x, visibility_pixels_y, alts,
+                                          block_params["occlusion_alt_tolerance"])
+        for block in blocks:
+            block[np.logical_not(visible)] = block_params["nodata_val"]
+    return blocks
+
+
+def _get_picklable_description(obj):  # type: (...) -> tuple
+    """
+    Creates a lightweight description of an image or DEM that can be sent to worker processes.  File-backed geotiff
+    images and DEMs are described by their filename and settings, so that workers reopen the file rather than
+    receiving pickled image data.  Any other object is pickled as is.
+    :param obj: image or DEM object
+    :return: (rebuild function, arguments) tuple, calling the rebuild function with the arguments recreates obj
+    """
+    if isinstance(obj, GeotiffImage) and obj.get_dset() is not None:
+        return _rebuild_geotiff_image, (obj.get_dset().GetDescription(), obj.get_metadata().get_nodata_val())
+    if isinstance(obj, GeotiffDem) and isinstance(obj.gtiff, GeotiffImage) and obj.gtiff.get_dset() is not None:
+        dem_settings = {"nodata_value": obj.nodata_value,
+                        "interpolation_method": obj.get_interpolation_method(),
+                        "lazy_loading": obj.lazy_loading,
+                        "tile_size": obj.tile_size,
+                        "max_cached_tiles": obj.max_cached_tiles,
+                        "use_float32": obj.elevation_dtype == np.float32}
+        return _rebuild_geotiff_dem, (obj.gtiff.get_dset().GetDescription(), dem_settings)
+    return _return_object, (obj,)
+
+
+def _rebuild_geotiff_image(fname,  # type: str
+                           nodata_val,  # type: float
+                           ):  # type: (...) -> GeotiffImage
+    geotiff_image = GeotiffImageFactory.from_file(fname)
+    geotiff_image.get_metadata().set_nodata_val(nodata_val)
+    return geotiff_image
+
+
+def _rebuild_geotiff_dem(fname,  # type: str
+                         dem_settings,  # type: dict
+                         ):  # type: (...) -> GeotiffDem
+    geotiff_dem = DemFactory.from_gtiff_file(fname,
+                                             nodata_value=dem_settings["nodata_value"],
+                                             interpolation_method=dem_settings["interpolation_method"],
+                                             lazy_loading=dem_settings["lazy_loading"],
+                                             tile_size=dem_settings["tile_size"],
+                                             max_cached_tiles=dem_settings["max_cached_tiles"])
+    geotiff_dem.set_float32(dem_settings["use_float32"])
+    return geotiff_dem
+
+
+def _return_object(obj):
+    return obj
+
+
+def _init_ortho_worker(image_description,  # type: tuple
+                       dem_description,  # type: tuple
+                       max_approximation_pixel_error,  # type: float
+                       block_params,  # type: dict
+                       ):  # type: (...) -> None
+    rebuild_image, image_args = image_description
+    rebuild_dem, dem_args = dem_description
+    overhead_image = rebuild_image(*image_args)
+    point_calc = overhead_image.get_point_calculator()
+    if max_approximation_pixel_error is not None:
+        point_calc = ApproximatePointCalc.init_from_point_calc(point_calc,
+                                                               max_pixel_error=max_approximation_pixel_error)
+    _ortho_worker_state["overhead_image"] = overhead_image
+    _ortho_worker_state["point_calc"] = point_calc
+    _ortho_worker_state["dem"] = rebuild_dem(*dem_args)
+    if block_params.get("zbuffer_fname") is not None:
+        block_params["zbuffer"] = np.load(block_params["zbuffer_fname"], mmap_mode='r')
+    _ortho_worker_state["block_params"] = block_params
+
+
+def _ortho_worker_task(task,  # type: tuple
+                       ):  # type: (...) -> list
+    return _ortho_task(_ortho_worker_state["overhead_image"], _ortho_worker_state["point_calc"],
+                       _ortho_worker_state["dem"], task, _ortho_worker_state["block_params"])
+
+
+def _warp_block_from_window(overhead_image,  # type: AbstractEarthOverheadImage
+                            band,  # type: int
+                            pixels_x,  # type: ndarray
+                            pixels_y,  # type: ndarray
+                            npix_x,  # type: int
+                            npix_y,  # type: int
+                            image_dtype,  # type: np.dtype
+                            nodata_val,  # type: float
+                            interpolation,  # type: str
+                            warp_backend,  # type: str
+                            ):  # type: (...) -> ndarray
+    """
+    Warps one output block, reading only the window of the source band that the block's pixel maps fall in.  The
+    window is padded by a few pixels so that nearest neighbor and bilinear interpolation near its edges give the
+    same results as warping the full band.
+    """
+    window_pad = 3
+    valid = np.isfinite(pixels_x) & np.isfinite(pixels_y)
+    if not valid.any():
+        return np.zeros(np.shape(pixels_x), dtype=image_dtype) + np.asarray(nodata_val).astype(image_dtype)
+    x0 = int(max(np.floor(np.min(pixels_x[valid])) - window_pad, 0))
+    y0 = int(max(np.floor(np.min(pixels_y[valid])) - window_pad, 0))
+    x1 = int(min(np.ceil(np.max(pixels_x[valid])) + window_pad + 1, npix_x))
+    y1 = int(min(np.ceil(np.max(pixels_y[valid])) + window_pad + 1, npix_y))
+    if x1 <= x0 or y1 <= y0:
+        return np.zeros(np.shape(pixels_x), dtype=image_dtype) + np.asarray(nodata_val).astype(image_dtype)
+    image_window = overhead_image.read_window(band, x0, y0, x1 - x0, y1 - y0)[:, :, 0]
+    regridded = image_utils.grid_warp_image_band(image_window, pixels_x - x0, pixels_y - y0,
+                                                 nodata_val=nodata_val, interpolation=interpolation,
+                                                 backend=warp_backend)
+    return regridded.astype(image_dtype)
+
+
 def get_extent(overhead_image,  # type: AbstractEarthOverheadImage
                dem=None,  # type: AbstractDem
                bands=None,  # type: Union[int, list]
                pixel_error_threshold=0.01,  # type: float
-               max_iter=20  # type: int
+               max_iter=20,  # type: int
+               footprint_tolerance=None,  # type: float
                ):  # type: (...) -> Polygon
     """
     :param overhead_image
@@ -180,52 +631,349 @@ def get_extent(overhead_image,  # type: AbstractEarthOverheadImage
     :param bands:
     :param pixel_error_threshold:
     :param max_iter:
+    :param footprint_tolerance: if set, the footprint is computed adaptively rather than from every border pixel.
+    The image border starts out as a few samples per edge, and border segments are only split where the projected
+    midpoint deviates from the straight line between the projected segment ends by more than this tolerance, in the
+    units of the footprint's CRS.  The adaptive footprint is simplified by this tolerance, rather than by the fixed
+    tolerance used for the full border.
     :return:
 
     This will return image extents in the CRS specified by the DEM.  If no DEM is provided, the extents will be native
     To the image object.
     """
 
-    nx = overhead_image.get_metadata().get_npix_x()
-    ny = overhead_image.get_metadata().get_npix_y()
-    x = np.arange(0, nx)
-    y = np.arange(0, ny)
-    xx, yy = np.meshgrid(x, y, sparse=False)
-    x_border = np.concatenate((xx[0, :], xx[:, -1], xx[-1, :], xx[:, 0]))
-    y_border = np.concatenate((yy[0, :], yy[:, -1], yy[-1, :], yy[:, 0]))
-
     if type(bands) == (type(1)):
         bands = [bands]
 
     if bands is None:
         bands = np.arange(overhead_image.get_metadata().get_n_bands())
 
-    all_band_lons = np.array([])
-    all_band_lats = np.array([])
-
     if not overhead_image.get_point_calculator().bands_coregistered():
         warnings.warn("the bands for this image aren't co-registered.  Getting the full image extent using all bands.")
-        for band in bands:
-            lons, lats = get_pixel_lon_lats(overhead_image, pixels_x=x_border, pixels_y=y_border, dem=dem,
-                                            pixel_error_threshold=pixel_error_threshold,
-                                            max_iter=max_iter,
-                                            band=band)
-            all_band_lons = np.append(all_band_lons, lons)
-            all_band_lats = np.append(all_band_lats, lats)
     else:
-        lons, lats = get_pixel_lon_lats(overhead_image, pixels_x=x_border, pixels_y=y_border, dem=dem,
-                                        pixel_error_threshold=pixel_error_threshold,
-                                        max_iter=max_iter,
-                                        band=0)
+        bands = [0]
+
+    all_band_lons = np.array([])
+    all_band_lats = np.array([])
+    for band in bands:
+        if footprint_tolerance is None:
+            lons, lats = _get_border_lon_lats(overhead_image, dem, band, pixel_error_threshold, max_iter)
+        else:
+            lons, lats = _get_adaptive_border_lon_lats(overhead_image, dem, band, footprint_tolerance,
+                                                       pixel_error_threshold, max_iter)
         all_band_lons = np.append(all_band_lons, lons)
         all_band_lats = np.append(all_band_lats, lats)
 
     extents = [(MultiPoint(list(zip(all_band_lons, all_band_lats))))]
+    if footprint_tolerance is not None:
+        # the adaptive border is only accurate to the footprint tolerance, which is in the footprint's own CRS units,
+        # so the hull is simplified to that tolerance rather than the fixed tolerance used below
+        return unary_union(extents).convex_hull.simplify(footprint_tolerance)
     # TODO, check into whether we can get rid of this tolerance, also, this isn't a very good approach, since it assumes
     # TODO a particular CRS (probably 4326)
     return unary_union(extents).convex_hull.simplify(0.001)
 
 
+def _get_border_lon_lats(overhead_image,  # type: AbstractEarthOverheadImage
+                         dem,  # type: AbstractDem
+                         band,  # type: int
+                         pixel_error_threshold,  # type: float
+                         max_iter,  # type: int
+                         ):  # type: (...) -> (ndarray, ndarray)
+    nx = overhead_image.get_metadata().get_npix_x()
+    ny = overhead_image.get_metadata().get_npix_y()
+    x = np.arange(0, nx)
+    y = np.arange(0, ny)
+    xx, yy = np.meshgrid(x, y, sparse=False)
+    x_border = np.concatenate((xx[0, :], xx[:, -1], xx[-1, :], xx[:, 0]))
+    y_border = np.concatenate((yy[0, :], yy[:, -1], yy[-1, :], yy[:, 0]))
+    return get_pixel_lon_lats(overhead_image, pixels_x=x_border, pixels_y=y_border, dem=dem,
+                              pixel_error_threshold=pixel_error_threshold,
+                              max_iter=max_iter,
+                              band=band)
+
+
+def _get_adaptive_border_lon_lats(overhead_image,  # type: AbstractEarthOverheadImage
+                                  dem,  # type: AbstractDem
+                                  band,  # type: int
+                                  tolerance,  # type: float
+                                  pixel_error_threshold,  # type: float
+                                  max_iter,  # type: int
+                                  initial_samples_per_edge=4,  # type: int
+                                  ):  # type: (...) -> (ndarray, ndarray)
+    """
+    Projects the image border adaptively.  The border is a closed loop of pixel locations that starts out with the
+    corners and a few samples along each edge.  Segments run from every sample to the next one.  At every iteration
+    the midpoints of the segments that have not converged are projected together, and the segments whose projected
+    midpoints are further than the tolerance from the projected segments are split at their midpoints.  The projected
+    midpoints become the projections of the new samples, and only the two halves of split segments are tested at the
+    next iteration.  Segments that are within the tolerance, or that are no longer than a pixel, have converged.
+    :return: (lons, lats) of the border samples, in order around the border
+    """
+    nx = overhead_image.get_metadata().get_npix_x()
+    ny = overhead_image.get_metadata().get_npix_y()
+    corners_x = np.array([0, nx - 1, nx - 1, 0, 0], dtype=np.float64)
+    corners_y = np.array([0, 0, ny - 1, ny - 1, 0], dtype=np.float64)
+    edge_fractions = np.arange(initial_samples_per_edge) / initial_samples_per_edge
+    pixels_x = np.concatenate([corners_x[i] + (corners_x[i + 1] - corners_x[i]) * edge_fractions for i in range(4)])
+    pixels_y = np.concatenate([corners_y[i] + (corners_y[i + 1] - corners_y[i]) * edge_fractions for i in range(4)])
+
+    def project(xs, ys):
+        return get_pixel_lon_lats(overhead_image, pixels_x=xs, pixels_y=ys, dem=dem,
+                                  pixel_error_threshold=pixel_error_threshold, max_iter=max_iter, band=band)
+
+    lons, lats = project(pixels_x, pixels_y)
+    # converged[i] is True once the segment that starts at sample i does not need to be split any further
+    converged = np.zeros(len(pixels_x), dtype=bool)
+    while True:
+        next_x, next_y = np.roll(pixels_x, -1), np.roll(pixels_y, -1)
+        converged[np.hypot(next_x - pixels_x, next_y - pixels_y) <= 1] = True
+        to_test = np.nonzero(np.logical_not(converged))[0]
+        if len(to_test) == 0:
+            break
+        next_to_test = (to_test + 1) % len(pixels_x)
+        mid_x = (pixels_x[to_test] + next_x[to_test]) / 2.0
+        mid_y = (pixels_y[to_test] + next_y[to_test]) / 2.0
+        mid_lons, mid_lats = project(mid_x, mid_y)
+        deviations = _point_to_segment_distances(mid_lons, mid_lats, lons[to_test], lats[to_test],
+                                                 lons[next_to_test], lats[next_to_test])
+        # segments with unprojectable ends are not refined
+        split = deviations > tolerance
+        converged[to_test[np.logical_not(split)]] = True
+        if not split.any():
+            break
+        insert_at = to_test[split] + 1
+        pixels_x = np.insert(pixels_x, insert_at, mid_x[split])
+        pixels_y = np.insert(pixels_y, insert_at, mid_y[split])
+        lons = np.insert(lons, insert_at, mid_lons[split])
+        lats = np.insert(lats, insert_at, mid_lats[split])
+        # the first half of a split segment keeps its start sample, the second half starts at the new sample
+        converged = np.insert(converged, insert_at, False)
+
+    finite = np.isfinite(lons) & np.isfinite(lats)
+    return lons[finite], lats[finite]
+
+
+def _point_to_segment_distances(xs,  # type: ndarray
+                                ys,  # type: ndarray
+                                start_xs,  # type: ndarray
+                                start_ys,  # type: ndarray
+                                end_xs,  # type: ndarray
+                                end_ys,  # type: ndarray
+                                ):  # type: (...) -> ndarray
+    segment_dx = end_xs - start_xs
+    segment_dy = end_ys - start_ys
+    squared_lengths = np.square(segment_dx) + np.square(segment_dy)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fractions = ((xs - start_xs) * segment_dx + (ys - start_ys) * segment_dy) / squared_lengths
+    fractions = np.clip(np.where(squared_lengths > 0, fractions, 0), 0, 1)
+    return np.hypot(xs - (start_xs + fractions * segment_dx), ys - (start_ys + fractions * segment_dy))
+
+
+def create_visibility_map(overhead_image,  # type: AbstractEarthOverheadImage
+                          ortho_nx_pix,  # type: int
+                          ortho_ny_pix,  # type: int
+                          world_polygon,  # type: Polygon
+                          world_proj=crs_defs.PROJ_4326,  # type: Proj
+                          dem=None,  # type: AbstractDem
+                          alt_tolerance=1.0,  # type: float
+                          block_size=DEFAULT_ORTHO_BLOCK_SIZE,  # type: int
+                          max_approximation_pixel_error=None,  # type: float
+                          ):  # type: (...) -> ndarray
+    """
+    Computes which pixels of an orthorectified output grid are visible from the sensor, using a z-buffer in sensor
+    space.  In a first pass over the output grid, tile by tile, every ground location is projected into the image,
+    and each image pixel of the z-buffer keeps the highest ground altitude that projects into it.  Because rays of
+    overhead sensors descend from the sensor to the ground, the highest ground location along a ray is the one closest
+    to the sensor.  Vertical DEM discontinuities, such as building walls, are added to the z-buffer as well.  In a
+    second pass a ground location is visible if its altitude is within alt_tolerance of the z-buffer altitude of its
+    image pixel.  Both passes cost O(N) in output pixels, plus the image space length of the walls.
+
+    The output grid should sample the ground at roughly the sensor's resolution or finer, so that occluding surfaces
+    fill the z-buffer.  The alt_tolerance keeps sloped terrain that maps many ground locations into one image pixel
+    from occluding itself.  Visibility is computed with the geometry of band 0.
+    :param overhead_image: image whose sensor geometry is used
+    :param ortho_nx_pix: number of x pixels in the output grid
+    :param ortho_ny_pix: number of y pixels in the output grid
+    :param world_polygon: polygon whose envelope is the extent of the output grid
+    :param world_proj: projection of world_polygon and of the output grid
+    :param dem: DEM used for the ground elevations, defaults to a constant elevation of 0
+    :param alt_tolerance: altitude tolerance of the visibility test, in DEM units
+    :param block_size: size of the square output tiles that are processed at a time, in pixels
+    :param max_approximation_pixel_error: if set, the point calculator is wrapped in an ApproximatePointCalc with
+    this pixel tolerance
+    :return: boolean ndarray of dimensions (ortho_ny_pix, ortho_nx_pix), True where the ground is visible.  Ground
+    locations that are outside of the image are not visible.
+    """
+    minx, miny, maxx, maxy = world_polygon.envelope.bounds
+    if dem is None:
+        dem = DemFactory.constant_elevation(0)
+        dem.set_projection(crs_defs.PROJ_4326)
+    point_calc = overhead_image.get_point_calculator()
+    if max_approximation_pixel_error is not None:
+        point_calc = ApproximatePointCalc.init_from_point_calc(point_calc,
+                                                               max_pixel_error=max_approximation_pixel_error)
+
+    zbuffer = _create_zbuffer(overhead_image, point_calc, dem, minx, maxx, miny, maxy, ortho_nx_pix, ortho_ny_pix,
+                              world_proj, block_size, alt_tolerance)
+    visible = np.zeros((ortho_ny_pix, ortho_nx_pix), dtype=bool)
+    for window, pixels_x, pixels_y, alts in _iterate_projected_blocks(point_calc, dem, minx, maxx, miny, maxy,
+                                                                     ortho_nx_pix, ortho_ny_pix, world_proj,
+                                                                     block_size):
+        x_offset, y_offset, window_nx, window_ny = window
+        visible[y_offset:y_offset + window_ny, x_offset:x_offset + window_nx] = \
+            _get_zbuffer_visibility(zbuffer, pixels_x, pixels_y, alts, alt_tolerance)
+    return visible
+
+
+def _iterate_projected_blocks(point_calc,  # type: AbstractEarthOverheadPointCalc
+                              dem,  # type: AbstractDem
+                              minx,  # type: float
+                              maxx,  # type: float
+                              miny,  # type: float
+                              maxy,  # type: float
+                              ortho_nx_pix,  # type: int
+                              ortho_ny_pix,  # type: int
+                              world_proj,  # type: Proj
+                              block_size,  # type: int
+                              ):
+    """
+    Generates (window, pixel x, pixel y, alts) for every block of an output grid, using the geometry of band 0
+    """
+    for y_offset in range(0, ortho_ny_pix, block_size):
+        for x_offset in range(0, ortho_nx_pix, block_size):
+            window = (x_offset, y_offset, min(block_size, ortho_nx_pix - x_offset),
+                      min(block_size, ortho_ny_pix - y_offset))
+            ground_x, ground_y = create_ground_grid(minx, maxx, miny, maxy, ortho_nx_pix, ortho_ny_pix, window=window)
+            alts = dem.get_elevations(ground_x, ground_y, world_proj)
+            pixels_x, pixels_y = point_calc.lon_lat_alt_to_pixel_x_y(ground_x, ground_y, alts,
+                                                                     band=0, world_proj=world_proj)
+            yield window, pixels_x, pixels_y, alts
+
+
+def _get_zbuffer_shape(overhead_image,  # type: AbstractEarthOverheadImage
+                       ):  # type: (...) -> tuple
+    return overhead_image.get_metadata().get_npix_y(), overhead_image.get_metadata().get_npix_x()
+
+
+def _create_zbuffer(overhead_image,  # type: AbstractEarthOverheadImage
+                    point_calc,  # type: AbstractEarthOverheadPointCalc
+                    dem,  # type: AbstractDem
+                    minx,  # type: float
+                    maxx,  # type: float
+                    miny,  # type: float
+                    maxy,  # type: float
+                    ortho_nx_pix,  # type: int
+                    ortho_ny_pix,  # type: int
+                    world_proj,  # type: Proj
+                    block_size,  # type: int
+                    alt_tolerance,  # type: float
+                    ):  # type: (...) -> ndarray
+    """
+    Creates a z-buffer in sensor space, holding the highest ground altitude that projects into each image pixel.
+    The output grid only samples the tops of vertical discontinuities in the DEM, such as building walls, so the
+    walls are added to the z-buffer by sampling the image space line between the projections of the top and the
+    bottom of every discontinuity at one pixel spacing.  The bottom of a discontinuity is the lowest altitude of the
+    grid location's 4 neighbors.
+    """
+    zbuffer = np.full(_get_zbuffer_shape(overhead_image), -np.inf, dtype=np.float32)
+    for y_offset in range(0, ortho_ny_pix, block_size):
+        for x_offset in range(0, ortho_nx_pix, block_size):
+            window_nx = min(block_size, ortho_nx_pix - x_offset)
+            window_ny = min(block_size, ortho_ny_pix - y_offset)
+            # the DEM is sampled with a one pixel halo to find the lowest neighbors at the block edges
+            halo_x0 = max(x_offset - 1, 0)
+            halo_y0 = max(y_offset - 1, 0)
+            halo_x1 = min(x_offset + window_nx + 1, ortho_nx_pix)
+            halo_y1 = min(y_offset + window_ny + 1, ortho_ny_pix)
+            halo_x, halo_y = create_ground_grid(minx, maxx, miny, maxy, ortho_nx_pix, ortho_ny_pix,
+                                                window=(halo_x0, halo_y0, halo_x1 - halo_x0, halo_y1 - halo_y0))
+            halo_alts = np.zeros(np.shape(halo_x)) + dem.get_elevations(halo_x, halo_y, world_proj)
+            padded_alts = np.pad(halo_alts, 1, mode='edge')
+            lowest_neighbor_alts = np.minimum(np.minimum(padded_alts[:-2, 1:-1], padded_alts[2:, 1:-1]),
+                                              np.minimum(padded_alts[1:-1, :-2], padded_alts[1:-1, 2:]))
+            block = (slice(y_offset - halo_y0, y_offset - halo_y0 + window_ny),
+                     slice(x_offset - halo_x0, x_offset - halo_x0 + window_nx))
+            ground_x, ground_y = halo_x[block], halo_y[block]
+            alts, lowest_neighbor_alts = halo_alts[block], lowest_neighbor_alts[block]
+
+            pixels_x, pixels_y = point_calc.lon_lat_alt_to_pixel_x_y(ground_x, ground_y, alts,
+                                                                     band=0, world_proj=world_proj)
+            _update_zbuffer(zbuffer, pixels_x, pixels_y, alts)
+
+            walls = alts - lowest_neighbor_alts > alt_tolerance
+            if walls.any():
+                wall_bottoms_x, wall_bottoms_y = point_calc.lon_lat_alt_to_pixel_x_y(
+                    ground_x[walls], ground_y[walls], lowest_neighbor_alts[walls], band=0, world_proj=world_proj)
+                _update_zbuffer_with_walls(zbuffer, pixels_x[walls], pixels_y[walls], alts[walls],
+                                           wall_bottoms_x, wall_bottoms_y, lowest_neighbor_alts[walls])
+    return zbuffer
+
+
+def _update_zbuffer_with_walls(zbuffer,  # type: ndarray
+                               tops_x,  # type: ndarray
+                               tops_y,  # type: ndarray
+                               top_alts,  # type: ndarray
+                               bottoms_x,  # type: ndarray
+                               bottoms_y,  # type: ndarray
+                               bottom_alts,  # type: ndarray
+                               ):  # type: (...) -> None
+    with np.errstate(invalid='ignore'):
+        pixel_lengths = np.hypot(bottoms_x - tops_x, bottoms_y - tops_y)
+    finite = np.isfinite(pixel_lengths)
+    n_samples = np.ceil(pixel_lengths[finite]).astype(np.int64) + 1
+    wall_indices = np.repeat(np.arange(len(n_samples)), n_samples)
+    sample_numbers = np.arange(len(wall_indices)) - np.repeat(np.cumsum(n_samples) - n_samples, n_samples)
+    fractions = sample_numbers / np.maximum(n_samples[wall_indices] - 1, 1)
+
+    def interpolate(tops, bottoms):
+        tops = tops[finite][wall_indices]
+        return tops + (bottoms[finite][wall_indices] - tops) * fractions
+
+    _update_zbuffer(zbuffer, interpolate(tops_x, bottoms_x), interpolate(tops_y, bottoms_y),
+                    interpolate(top_alts, bottom_alts))
+
+
+def _get_zbuffer_indices(zbuffer,  # type: ndarray
+                         pixels_x,  # type: ndarray
+                         pixels_y,  # type: ndarray
+                         ):  # type: (...) -> (ndarray, ndarray)
+    """
+    :return: (flat z-buffer indices, mask of the pixel locations that are inside of the z-buffer)
+    """
+    ny, nx = np.shape(zbuffer)
+    with np.errstate(invalid='ignore'):
+        cols = np.floor(np.ravel(pixels_x) + 0.5)
+        rows = np.floor(np.ravel(pixels_y) + 0.5)
+        inside = (cols >= 0) & (cols < nx) & (rows >= 0) & (rows < ny)
+    flat_indices = rows[inside].astype(np.int64) * nx + cols[inside].astype(np.int64)
+    return flat_indices, inside
+
+
+def _update_zbuffer(zbuffer,  # type: ndarray
+                    pixels_x,  # type: ndarray
+                    pixels_y,  # type: ndarray
+                    alts,  # type: ndarray
+                    ):  # type: (...) -> None
+    flat_indices, inside = _get_zbuffer_indices(zbuffer, pixels_x, pixels_y)
+    alts = np.ravel(np.zeros(np.shape(pixels_x)) + alts)[inside]
+    finite = np.isfinite(alts)
+    np.maximum.at(zbuffer.reshape(-1), flat_indices[finite], alts[finite])
+
+
+def _get_zbuffer_visibility(zbuffer,  # type: ndarray
+                            pixels_x,  # type: ndarray
+                            pixels_y,  # type: ndarray
+                            alts,  # type: ndarray
+                            alt_tolerance,  # type: float
+                            ):  # type: (...) -> ndarray
+    flat_indices, inside = _get_zbuffer_indices(zbuffer, pixels_x, pixels_y)
+    alts = np.ravel(np.zeros(np.shape(pixels_x)) + alts)
+    visible = np.zeros(len(alts), dtype=bool)
+    visible[inside] = alts[inside] >= zbuffer.reshape(-1)[flat_indices] - alt_tolerance
+    return visible.reshape(np.shape(pixels_x))
+
+
 def are_pixels_obstructed_by_dem(earth_overhead_image,      # type: AbstractEarthOverheadImage
                                  pixels_x,                  # type: ndarray
                                  pixels_y,              # type: ndarray
@@ -239,18 +987,26 @@ def are_pixels_obstructed_by_dem(earth_overhead_image,      # type: AbstractEart
     DEFAULT_DEM_RESOLUTION = 5
     if dem_resolution is None:
         dem_resolution = DEFAULT_DEM_RESOLUTION
-    highest_alts = np.zeros_like(pixels_x)
-    highest_alts[:] = dem.get_highest_alt() + 0.001
+    point_calc = earth_overhead_image.get_point_calculator()
+    # only the part of the DEM between the ground points and the points where their rays reach the highest
+    # DEM elevation can obstruct them
+    footprint = point_calc.get_ray_footprint_bounds(pixels_x, pixels_y, dem.get_highest_alt(), dem.get_lowest_alt(),
+                                                    band=band)
+    region = (min(np.nanmin(lons), footprint[0]), min(np.nanmin(lats), footprint[1]),
+              max(np.nanmax(lons), footprint[2]), max(np.nanmax(lats), footprint[3]))
+    highest_alts = np.zeros_like(pixels_x, dtype=float)
+    highest_alts[:] = dem.get_highest_alt(region=region, world_proj=point_calc.get_projection()) + 0.001
 
     if alts is None:
         alts = dem.get_elevations(lons, lats)
 
     obstructed_mask = np.zeros_like(lons)
 
-    lons_highest, lats_highest = earth_overhead_image.get_point_calculator().pixel_x_y_alt_to_lon_lat(pixels_x, pixels_y, highest_alts, band=band)
-    lon_diffs = lons - lons_highest
-    lat_diffs = lats - lats_highest
-    horizontal_distances = np.sqrt(np.square(lon_diffs + lat_diffs))
+    lons_highest, lats_highest = point_calc.pixel_x_y_alt_to_lon_lat(pixels_x, pixels_y, highest_alts, band=band)
+    # the ray is stepped from the ground point toward the sensor, up to where it reaches the highest DEM elevation
+    lon_diffs = lons_highest - lons
+    lat_diffs = lats_highest - lats
+    horizontal_distances = np.sqrt(np.square(lon_diffs) + np.square(lat_diffs))
     vertical_distances = highest_alts - alts
     max_horizontal_distance = horizontal_distances.max()
     n_dem_steps = max_horizontal_distance / dem_resolution
@@ -0,0 +1,192 @@
+from __future__ import division
+
+import json
+
+import numpy as np
+from numpy import ndarray
+from pyproj import Proj
+from shapely.geometry import Polygon
+
+from resippy.image_objects.earth_overhead.earth_overhead_point_calculators.abstract_earth_overhead_point_calc \
+    import AbstractEarthOverheadPointCalc
+from resippy.image_objects.earth_overhead.earth_overhead_point_calculators.approximate_point_calc \
+    import ApproximatePointCalc
+from resippy.photogrammetry.dem.abstract_dem import AbstractDem
+from resippy.photogrammetry.dem.dem_factory import DemFactory
+from resippy.photogrammetry import crs_defs as crs_defs
+from resippy.utils.photogrammetry_utils import create_ground_grid, world_poly_to_geo_t
+from resippy.utils.image_utils import image_utils as image_utils
+
+
+class WarpMap:
+    """
+    Precomputed pixel locations of an output ground grid in a sensor's image, for a given point calculator and DEM.
+    A warp map only needs to be computed once for a sensor geometry and output grid, after which any band or derived
+    product that shares the geometry, such as a detection map, can be orthorectified without any projections or DEM
+    lookups.  Pixel locations are stored as float32.  Images with coregistered bands store a single map, otherwise
+    there is one map for each band.
+
+    Warp maps can be saved to .npz files, or to .npy files that are memory mapped when they are loaded.  The
+    metadata of .npy warp maps is saved to a .json file alongside the .npy file.
+    """
+
+    def __init__(self):
+        self._pixels_x = None  # type: ndarray
+        self._pixels_y = None  # type: ndarray
+        self._bands = None  # type: list
+        self._geo_t = None  # type: list
+        self._projection = None  # type: Proj
+
+    @classmethod
+    def init_from_point_calc(cls,
+                             point_calc,  # type: AbstractEarthOverheadPointCalc
+                             ortho_nx_pix,  # type: int
+                             ortho_ny_pix,  # type: int
+                             world_polygon,  # type: Polygon
+                             world_proj=crs_defs.PROJ_4326,  # type: Proj
+                             dem=None,  # type: AbstractDem
+                             bands=None,  # type: list
+                             max_approximation_pixel_error=None,  # type: float
+                             ):  # type: (...) -> WarpMap
+        """
+        Computes a warp map for the output grid used by ortho_tools.create_ortho_gtiff_image_world_to_sensor
+        :param point_calc: point calculator of the sensor
+        :param ortho_nx_pix: number of x pixels in the output grid
+        :param ortho_ny_pix: number of y pixels in the output grid
+        :param world_polygon: polygon whose envelope is the extent of the output grid
+        :param world_proj: projection of world_polygon and of the output grid
+        :param dem: DEM used for the ground elevations, defaults to a constant elevation of 0
+        :param bands: bands to compute maps for if the point calculator's bands are not coregistered, defaults to
+        band 0 only
+        :param max_approximation_pixel_error: if set, the point calculator is wrapped in an ApproximatePointCalc with
+        this pixel tolerance
+        :return: WarpMap
+        """
+        envelope = world_polygon.envelope
+        minx, miny, maxx, maxy = envelope.bounds
+        ground_grid_x, ground_grid_y = create_ground_grid(minx, maxx, miny, maxy, ortho_nx_pix, ortho_ny_pix)
+
+        if dem is None:
+            dem = DemFactory.constant_elevation(0)
+            dem.set_projection(crs_defs.PROJ_4326)
+        alts = dem.get_elevations(ground_grid_x, ground_grid_y, world_proj)
+
+        if max_approximation_pixel_error is not None:
+            point_calc = ApproximatePointCalc.init_from_point_calc(point_calc,
+                                                                   max_pixel_error=max_approximation_pixel_error)
+        if point_calc.bands_coregistered() is True or bands is None:
+            bands = [0]
+
+        warp_map = cls()
+        warp_map._pixels_x = np.zeros((len(bands), ortho_ny_pix, ortho_nx_pix), dtype=np.float32)
+        warp_map._pixels_y = np.zeros((len(bands), ortho_ny_pix, ortho_nx_pix), dtype=np.float32)
+        for i, band in enumerate(bands):
+            pixels_x, pixels_y = point_calc.lon_lat_alt_to_pixel_x_y(ground_grid_x, ground_grid_y, alts,
+                                                                     band=band, world_proj=world_proj)
+            warp_map._pixels_x[i] = pixels_x
+            warp_map._pixels_y[i] = pixels_y
+        warp_map._bands = list(bands)
+        warp_map._geo_t = world_poly_to_geo_t(envelope, ortho_nx_pix, ortho_ny_pix)
+        warp_map._projection = world_proj
+        return warp_map
+
+    @classmethod
+    def init_from_file(cls,
+                       fname,  # type: str
+                       ):  # type: (...) -> WarpMap
+        """
+        Loads a warp map saved by write_to_disk.  Warp maps saved as .npy files are memory mapped read-only.
+        :param fname: .npz or .npy filename
+        :return: WarpMap
+        """
+        warp_map = cls()
+        if fname.endswith(".npz"):
+            with np.load(fname) as npz_file:
+                pixel_coords = npz_file["pixel_coords"]
+                metadata = json.loads(str(npz_file["metadata"]))
+        else:
+            pixel_coords = np.load(fname, mmap_mode='r')
+            with open(fname + ".json") as json_file:
+                metadata = json.load(json_file)
+        warp_map._pixels_x = pixel_coords[0]
+        warp_map._pixels_y = pixel_coords[1]
+        warp_map._bands = metadata["bands"]
+        warp_map._geo_t = metadata["geo_t"]
+        warp_map._projection = Proj(metadata["projection"])
+        return warp_map
+
+    def write_to_disk(self,
+                      fname,  # type: str
+                      ):  # type: (...) -> None
+        """
+        Saves the warp map.  If fname ends with .npz the warp map is saved to a single .npz file, otherwise the pixel
+        locations are saved to an .npy file that can be memory mapped, and the metadata to fname + '.json'
+        :param fname: output filename
+        """
+        metadata = {"bands": self._bands,
+                    "geo_t": list(self._geo_t),
+                    "projection": self._projection.srs}
+        if fname.endswith(".npz"):
+            np.savez(fname, pixel_coords=np.stack((self._pixels_x, self._pixels_y)), metadata=json.dumps(metadata))
+        else:
+            pixel_coords = np.lib.format.open_memmap(fname, mode='w+', dtype=np.float32,
+                                                     shape=(2,) + np.shape(self._pixels_x))
+            pixel_coords[0] = self._pixels_x
+            pixel_coords[1] = self._pixels_y
+            pixel_coords.flush()
+            del pixel_coords
+            with open(fname + ".json", "w") as json_file:
+                json.dump(metadata, json_file)
+
+    def get_pixel_x_y(self,
+                      band=None,  # type: int
+                      ):  # type: (...) -> (ndarray, ndarray)
+        """
+        Gets the image pixel locations of the output grid
+        :param band: band number.  If the warp map holds a single map it is used for every band
+        :return: (pixel x, pixel y) as float32 2d ndarrays of dimensions (ny, nx)
+        """
+        if len(self._bands) == 1 or band is None:
+            index = 0
+        elif band in self._bands:
+            index = self._bands.index(band)
+        else:
+            raise ValueError("the warp map does not contain pixel locations for band " + str(band))
+        return self._pixels_x[index], self._pixels_y[index]
+
+    def get_bands(self):  # type: (...) -> list
+        return self._bands
+
+    def get_geot(self):  # type: (...) -> list
+        return self._geo_t
+
+    def get_projection(self):  # type: (...) -> Proj
+        return self._projection
+
+    def get_npix_x(self):  # type: (...) -> int
+        return np.shape(self._pixels_x)[2]
+
+    def get_npix_y(self):  # type: (...) -> int
+        return np.shape(self._pixels_x)[1]
+
+    def warp_image_band(self,
+                        image_band,  # type: ndarray
+                        band=None,  # type: int
+                        nodata_val=0,  # type: float
+                        interpolation='nearest',  # type: str
+                        backend='skimage',  # type: str
+                        ):  # type: (...) -> ndarray
+        """
+        Warps an image band, or any 2d product derived from it, onto the output grid
+        :param image_band: 2d ndarray in the sensor's pixel space
+        :param band: band number used to select the map if the bands are not coregistered
+        :param nodata_val: value for output pixels that fall outside of image_band
+        :param interpolation: interpolation method, see image_utils.grid_warp_image_band
+        :param backend: resampling backend, see image_utils.grid_warp_image_band
+        :return: warped band as a 2d ndarray with the dtype of image_band
+        """
+        pixels_x, pixels_y = self.get_pixel_x_y(band)
+        warped = image_utils.grid_warp_image_band(image_band, pixels_x, pixels_y,
+                                                  nodata_val=nodata_val, interpolation=interpolation,
+                                                  backend=backend)
+        return warped.astype(image_band.dtype)
@@ -0,0 +1,190 @@
+from __future__ import division
+
+import numpy as np
+from numpy import ndarray
+from typing import Union
+
+from resippy.image_objects.abstract_image import AbstractImage
+from resippy.utils import spectral_utils as spectral_tools
+
+# number of samples per block used when accumulating statistics of 1d cubes
+DEFAULT_BLOCK_SAMPLES = 65536
+
+# number of image lines per block used when accumulating statistics of 2d cubes and image objects
+DEFAULT_BLOCK_LINES = 64
+
+
+class SpectralStatisticsAccumulator:
+    """
+    Accumulates the spectral mean and covariance of samples that are added one block at a time, so that statistics
+    can be computed for image cubes that do not fit in memory.  Only the block being added is held in memory, in
+    float64 and already demeaned by its own mean.
+
+    Each block is reduced to a (count, mean, scatter matrix) partial, and partials are merged with the pairwise update
+    of Chan, Golub and LeVeque, the parallel form of Welford's algorithm:
+    delta = mean_b - mean_a, mean = mean_a + delta * n_b / n, scatter = scatter_a + scatter_b + outer(delta, delta) *
+    n_a * n_b / n.  Partials are merged like the digits of a binary counter, so that only partials of similar counts
+    are merged and there are at most log2(number of blocks) partials at any time.  As with pairwise summation, this
+    keeps the rounding error from growing with the number of blocks the way a running sum would.
+    """
+
+    def __init__(self):
+        # list of [level, count, mean, scatter] partials, with decreasing levels
+        self._partials = []
+
+    def add_samples(self,
+                    samples,  # type: ndarray
+                    mask=None,  # type: ndarray
+                    ):  # type: (...) -> None
+        """
+        Adds a block of samples
+        :param samples: ndarray of dimensions (n_samples, n_bands), of any numeric dtype such as float32
+        :param mask: optional ndarray of n_samples values, samples where the mask is nonzero are excluded.  This is
+        the same convention as the image masks of spectral_image_processing_1d
+        :return: None
+        """
+        if mask is not None:
+            samples = samples[np.ravel(mask) == 0]
+        count = np.shape(samples)[0]
+        if count == 0:
+            return
+        samples = np.asarray(samples, dtype=np.float64)
+        mean = samples.mean(axis=0)
+        demeaned = samples - mean
+        scatter = np.dot(demeaned.transpose(), demeaned)
+        self._partials.append([0, count, mean, scatter])
+        while len(self._partials) > 1 and self._partials[-1][0] == self._partials[-2][0]:
+            partial_b = self._partials.pop()
+            partial_a = self._partials.pop()
+            self._partials.append([partial_a[0] + 1] + self._merge_partials(partial_a[1:], partial_b[1:]))
+
+    def add_image_cube(self,
+                       spectral_image,  # type: Union[ndarray, AbstractImage]
+                       image_mask=None,  # type: ndarray
+                       block_lines=DEFAULT_BLOCK_LINES,  # type: int
+                       block_samples=DEFAULT_BLOCK_SAMPLES,  # type: int
+                       ):  # type: (...) -> None
+        """
+        Adds all samples of an image cube, one block at a time
+        :param spectral_image: 2d cube of dimensions (ny, nx, nbands), such as a memory mapped ENVI cube, 1d cube of
+        dimensions (n_samples, n_bands), or an image object.  Image objects are read with read_window.
+        :param image_mask: optional mask of dimensions (ny, nx) for 2d cubes and image objects, or (n_samples) for 1d
+        cubes.  Samples where the mask is nonzero are excluded
+        :param block_lines: number of image lines per block for 2d cubes and image objects
+        :param block_samples: number of samples per block for 1d cubes
+        :return: None
+        """
+        if isinstance(spectral_image, AbstractImage):
+            nx = spectral_image.get_metadata().get_npix_x()
+            ny = spectral_image.get_metadata().get_npix_y()
+            for y_offset in range(0, ny, block_lines):
+                n_lines = min(block_lines, ny - y_offset)
+                block = spectral_image.read_window(None, 0, y_offset, nx, n_lines)
+                self._add_2d_block(block, image_mask, y_offset)
+        elif spectral_tools.is_2d_cube(spectral_image):
+            for y_offset in range(0, np.shape(spectral_image)[0], block_lines):
+                self._add_2d_block(spectral_image[y_offset:y_offset + block_lines], image_mask, y_offset)
+        else:
+            for offset in range(0, np.shape(spectral_image)[0], block_samples):
+                block_mask = None
+                if image_mask is not None:
+                    block_mask = np.ravel(image_mask)[offset:offset + block_samples]
+                self.add_samples(spectral_image[offset:offset + block_samples], block_mask)
+
+    def _add_2d_block(self,
+                      block,  # type: ndarray
+                      image_mask,  # type: ndarray
+                      y_offset,  # type: int
+                      ):  # type: (...) -> None
+        block_mask = None
+        if image_mask is not None:
+            block_mask = image_mask[y_offset:y_offset + np.shape(block)[0]]
+        self.add_samples(spectral_tools.flatten_image_cube(block), block_mask)
+
+    def merge(self,
+              other,  # type: SpectralStatisticsAccumulator
+              ):  # type: (...) -> None
+        """
+        Merges the statistics of another accumulator into this one, for example to combine statistics that were
+        accumulated in parallel over different parts of a scene
+        :param other: accumulator to merge
+        :return: None
+        """
+        other_totals = other._get_totals()
+        if other_totals is not None:
+            totals = self._get_totals()
+            if totals is not None:
+                other_totals = self._merge_partials(totals, other_totals)
+            level = max([partial[0] for partial in self._partials + other._partials])
+            self._partials = [[level] + other_totals]
+
+    def get_count(self):  # type: (...) -> int
+        totals = self._get_totals()
+        if totals is None:
+            return 0
+        return totals[0]
+
+    def get_mean(self):  # type: (...) -> ndarray
+        """
+        gets the spectral mean of the accumulated samples
+        :return: ndarray of n_bands values, or None if no samples have been added
+        """
+        totals = self._get_totals()
+        if totals is None:
+            return None
+        return totals[1]
+
+    def get_covariance(self,
+                       ddof=1,  # type: int
+                       ):  # type: (...) -> ndarray
+        """
+        gets the spectral covariance of the accumulated samples
+        :param ddof: delta degrees of freedom.  The default of 1 matches np.cov
+        :return: ndarray of dimensions (n_bands, n_bands), or None if no samples have been added
+        """
+        totals = self._get_totals()
+        if totals is None:
+            return None
+        return totals[2] / (totals[0] - ddof)
+
+    def _get_totals(self):  # type: (...) -> list
+        if len(self._partials) == 0:
+            return None
+        # merge the smallest partials first
+        totals = self._partials[-1][1:]
+        for partial in reversed(self._partials[:-1]):
+            totals = self._merge_partials(partial[1:], totals)
+        return totals
+
+    @staticmethod
+    def _merge_partials(partial_a,  # type: list
+                        partial_b,  # type: list
+                        ):  # type: (...) -> list
+        count_a, mean_a, scatter_a = partial_a
+        count_b, mean_b, scatter_b = partial_b
+        count = count_a + count_b
+        delta = mean_b - mean_a
+        mean = mean_a + delta * (count_b / count)
+        scatter = scatter_a + scatter_b + np.outer(delta, delta) * (count_a * count_b / count)
+        return [count, mean, scatter]
+
+
+def compute_spectral_mean_and_covariance(spectral_image,  # type: Union[ndarray, AbstractImage]
+                                         image_mask=None,  # type: ndarray
+                                         block_lines=DEFAULT_BLOCK_LINES,  # type: int
+                                         block_samples=DEFAULT_BLOCK_SAMPLES,  # type: int
+                                         ):  # type: (...) -> (ndarray, ndarray)
+    """
+    Computes the spectral mean and covariance of an image cube out of core, one block at a time.  The results can be
+    passed to the spectral mean and inverse covariance arguments of rx_anomaly_detector and ace.
+    :param spectral_image: 2d cube of dimensions (ny, nx, nbands), 1d cube of dimensions (n_samples, n_bands), or an
+    image object
+    :param image_mask: optional mask, samples where the mask is nonzero are excluded
+    :param block_lines: number of image lines per block for 2d cubes and image objects
+    :param block_samples: number of samples per block for 1d cubes
+    :return: (spectral mean, spectral covariance)
+    """
+    accumulator = SpectralStatisticsAccumulator()
+    accumulator.add_image_cube(spectral_image, image_mask=image_mask, block_lines=block_lines,
+                               block_samples=block_samples)
+    return accumulator.get_mean(), accumulator.get_covariance()
@@ -2,6 +2,7 @@ from resippy.utils import string_utils
 import numpy as np
 
 import os
+import sys
 
 ENVI_DTYPES_TO_NUMPY = {"1": np.uint8,
                         "2": np.int16,
@@ -182,39 +183,69 @@ def write_envi_header(header_dict,      # type: dict
             f.write("\n")
 
 
-# TODO: add more interleave formats, only BIP is currently supported
+ENVI_INTERLEAVES = ['bil', 'bip', 'bsq']
+
+# number of image lines copied at a time by write_envi_image
+_WRITE_BLOCK_LINES = 256
+
+
 def write_envi_image(image_cube,                    # type: np.ndarray
                      output_fname,                  # type: str
                      output_header_fname=None,      # type: str
                      interleave='bil',              # type: str
                      ):                             # type: (...) -> None
+    """
+    Writes an image cube to a raw ENVI file and header.  The file is written through a memory map, a block of lines
+    at a time, so image cubes that are themselves memory mapped are never fully loaded into memory.  The data is
+    written in the byte order of image_cube's dtype.  output_fname should not be the file that image_cube is memory
+    mapped from.
+    :param image_cube: ndarray of dimensions (ny, nx, nbands)
+    :param output_fname: output image filename
+    :param output_header_fname: output header filename, defaults to output_fname + ".hdr"
+    :param interleave: one of 'bil', 'bip' or 'bsq'
+    :return: None
+    """
     if output_header_fname is None:
         output_header_fname = output_fname + ".hdr"
+    interleave = interleave.lower()
+    if interleave not in ENVI_INTERLEAVES:
+        raise ValueError("interleave should be one of " + str(ENVI_INTERLEAVES))
     ny, nx, nbands = image_cube.shape
-    raw_data = np.zeros(ny*nx*nbands, dtype=image_cube.dtype)
-    if interleave == 'bil':
-        raw_data_counter = 0
-        for l in range(ny):
-            for b in range(nbands):
-                data_chunk = image_cube[l, :, b]
-                raw_data[raw_data_counter:raw_data_counter+nx] = data_chunk
-                raw_data_counter = raw_data_counter+nx
-    raw_data.tofile(output_fname)
-
-    envi_dtype = numpy_dtype_to_envi_dtype(image_cube.dtype)
+    raw_data = np.memmap(output_fname, dtype=image_cube.dtype, mode='w+', shape=(ny * nx * nbands,))
+    output_cube = construct_image_cube_from_raw_data(raw_data, nx, ny, nbands, interleave)
+    for line in range(0, ny, _WRITE_BLOCK_LINES):
+        output_cube[line:line + _WRITE_BLOCK_LINES] = image_cube[line:line + _WRITE_BLOCK_LINES]
+    raw_data.flush()
+    del output_cube
+    del raw_data
+
+    envi_dtype = numpy_dtype_to_envi_dtype(image_cube.dtype.newbyteorder('='))
+    is_big_endian = image_cube.dtype.byteorder == '>' or \
+        (image_cube.dtype.byteorder == '=' and sys.byteorder == 'big')
 
     envi_header = {}
     envi_header['samples'] = int(nx)
     envi_header['lines'] = int(ny)
     envi_header['bands'] = int(nbands)
+    envi_header['header offset'] = 0
     envi_header['data type'] = int(envi_dtype)
     envi_header['interleave'] = interleave
+    envi_header['byte order'] = int(is_big_endian)
     write_envi_header(envi_header, output_header_fname)
 
 
 def read_envi_image(image_file,             # type: str
                     header_file=None,       # type: str
+                    memmap=True,            # type: bool
                     ):                      # type: (...) -> np.ndarray
+    """
+    Reads an ENVI image cube.  The header offset, byte order and interleave of the header are honored.
+    :param image_file: raw ENVI image filename
+    :param header_file: header filename, guessed from image_file if not provided
+    :param memmap: if True the image file is memory mapped read-only and a lazy view of it is returned, so only the
+    parts of the cube that are accessed are read from disk.  Otherwise the whole file is read into memory.
+    :return: ndarray of dimensions (ny, nx, nbands)
+    """
     if header_file is None:
         try:
             header_guesses = [image_file[:-4] + ".hdr", image_file + ".hdr"]
@@ -229,17 +260,35 @@ def read_envi_image(image_file,             # type: str
     nbands = int(envi_header['bands'])
     envi_dtype = envi_header['data type']
     interleave = envi_header['interleave']
-    envi_image_data = read_all_image_data_to_numpy_array(image_file, envi_dtype)
+    envi_image_data = read_all_image_data_to_numpy_array(image_file, envi_dtype,
+                                                         header_offset=envi_header.get('header offset', 0),
+                                                         byte_order=envi_header.get('byte order', 0),
+                                                         memmap=memmap)
     image_cube = construct_image_cube_from_raw_data(envi_image_data, nx, ny, nbands, interleave)
     return image_cube
 
 
 def read_all_image_data_to_numpy_array(envi_image_path,     # type: str
                                        envi_dtype,          # type: int
+                                       header_offset=0,     # type: int
+                                       byte_order=0,        # type: int
+                                       memmap=True,         # type: bool
                                        ):                   # type: (...) -> np.ndarray
-    numpy_dtype = envi_dtype_to_numpy_dtype(envi_dtype)
-    numpy_data = np.fromfile(envi_image_path, numpy_dtype)
-    return numpy_data
+    """
+    Reads the raw data of an ENVI image file as a flat array
+    :param envi_image_path: raw ENVI image filename
+    :param envi_dtype: ENVI data type code
+    :param header_offset: number of bytes before the image data
+    :param byte_order: ENVI byte order, 0 for little endian and 1 for big endian
+    :param memmap: if True the file is memory mapped read-only, otherwise it is read into memory
+    :return: flat ndarray
+    """
+    numpy_dtype = np.dtype(envi_dtype_to_numpy_dtype(envi_dtype)).newbyteorder('>' if int(byte_order) == 1 else '<')
+    if memmap:
+        return np.memmap(envi_image_path, dtype=numpy_dtype, mode='r', offset=int(header_offset))
+    with open(envi_image_path, 'rb') as f:
+        f.seek(int(header_offset))
+        return np.fromfile(f, numpy_dtype)
 
 
 def construct_image_cube_from_raw_data(raw_envi_data,       # type: np.ndarray
@@ -248,12 +297,22 @@ def construct_image_cube_from_raw_data(raw_envi_data,       # type: np.ndarray
                                        nbands,              # type: int
                                        interleave,          # type: str
                                        ):                   # type: (...) -> np.ndarray
-    image_cube = np.zeros((ny, nx, nbands), dtype=raw_envi_data.dtype)
+    """
+    Creates a (ny, nx, nbands) view of flat ENVI image data, without copying it.  Data beyond the end of the cube,
+    such as trailing bytes in the file, is ignored.
+    :param raw_envi_data: flat ndarray of image data, in file order
+    :param nx: number of samples
+    :param ny: number of lines
+    :param nbands: number of bands
+    :param interleave: one of 'bil', 'bip' or 'bsq'
+    :return: ndarray view of dimensions (ny, nx, nbands)
+    """
+    interleave = interleave.lower()
+    raw_envi_data = raw_envi_data[:ny * nx * nbands]
     if interleave == 'bil':
-        raw_data_counter = 0
-        for l in range(ny):
-            for b in range(nbands):
-                data_chunk = raw_envi_data[raw_data_counter:raw_data_counter+nx]
-                image_cube[l, :, b] = data_chunk
-                raw_data_counter = raw_data_counter+nx
-    return image_cube
+        return raw_envi_data.reshape((ny, nbands, nx)).transpose((0, 2, 1))
+    elif interleave == 'bip':
+        return raw_envi_data.reshape((ny, nx, nbands))
+    elif interleave == 'bsq':
+        return raw_envi_data.reshape((nbands, ny, nx)).transpose((1, 2, 0))
+    raise ValueError("interleave should be one of " + str(ENVI_INTERLEAVES))
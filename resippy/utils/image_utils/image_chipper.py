@@ -6,6 +6,7 @@ from typing import Union
 import os
 import imageio
 import resippy.utils.image_utils.image_utils as image_utils
+from resippy.image_objects.abstract_image import AbstractImage
 
 
 def get_nchips(image_chips,     # type: ndarray
@@ -13,7 +14,17 @@ def get_nchips(image_chips,     # type: ndarray
     return image_chips.shape[0]
 
 
-def chip_entire_image_to_memory(input_image,                    # type: ndarray
+def _get_image_shape(input_image,   # type: Union[ndarray, AbstractImage]
+                     ):             # type: (...) -> (int, int, int)
+    if isinstance(input_image, AbstractImage):
+        metadata = input_image.get_metadata()
+        return metadata.get_npix_y(), metadata.get_npix_x(), metadata.get_n_bands()
+    if len(input_image.shape) == 2:
+        return input_image.shape[0], input_image.shape[1], 1
+    return input_image.shape
+
+
+def chip_entire_image_to_memory(input_image,                    # type: Union[ndarray, AbstractImage]
                                 chip_ny_pixels=256,             # type: int
                                 chip_nx_pixels=256,             # type: int
                                 npix_overlap_y=0,               # type: int
@@ -22,12 +33,7 @@ def chip_entire_image_to_memory(input_image,                    # type: ndarray
                                 keep_within_image_bounds=True   # type: bool
                                 ):                              # type: (...) -> (ndarray, list)
 
-    is_input_grayscale = len(input_image.shape) == 2
-    if is_input_grayscale:
-        ny = input_image.shape[0]
-        nx = input_image.shape[1]
-        input_image = np.reshape(input_image, (ny, nx, 1))
-    ny, nx, nbands = input_image.shape
+    ny, nx, nbands = _get_image_shape(input_image)
     y_idxs = np.arange(0, ny, chip_ny_pixels - npix_overlap_y)
     x_idxs = np.arange(0, nx, chip_nx_pixels - npix_overlap_x)
     y_idxs[np.where(y_idxs >= ny - chip_ny_pixels)] = ny - chip_ny_pixels
@@ -54,7 +60,8 @@ def chip_entire_image_to_memory(input_image,                    # type: ndarray
 
 # TODO support for chipping outside of image bounds is not yet supported.
 # TODO Indices will be adjusted to keep within image bounds.
-def chip_images_by_pixel_upper_lefts(input_image,                   # type: ndarray
+# Image objects are chipped with windowed reads, so only the chips are read from disk.
+def chip_images_by_pixel_upper_lefts(input_image,                   # type: Union[ndarray, AbstractImage]
                                      pixel_y_ul_list,               # type: list
                                      pixel_x_ul_list,               # type: list
                                      chip_ny_pixels=256,            # type: int
@@ -69,12 +76,13 @@ def chip_images_by_pixel_upper_lefts(input_image,                   # type: ndar
 
     pixel_x_ul_list = np.array(pixel_x_ul_list)
     pixel_y_ul_list = np.array(pixel_y_ul_list)
-    is_input_grayscale = len(input_image.shape) == 2
+    is_input_image_object = isinstance(input_image, AbstractImage)
+    is_input_grayscale = not is_input_image_object and len(input_image.shape) == 2
     if is_input_grayscale:
         ny = input_image.shape[0]
         nx = input_image.shape[1]
         input_image = np.reshape(input_image, (ny, nx, 1))
-    ny, nx, nbands = input_image.shape
+    ny, nx, nbands = _get_image_shape(input_image)
 
     if keep_within_image_bounds:
         pixel_x_ul_list[np.where(pixel_x_ul_list > nx - chip_nx_pixels)] = nx - chip_nx_pixels
@@ -91,15 +99,23 @@ def chip_images_by_pixel_upper_lefts(input_image,                   # type: ndar
         nbands = len(bands)
 
     is_output_grayscale = is_input_grayscale or len(bands) == 1
-    all_chips = np.zeros((n_chips, chip_ny_pixels, chip_nx_pixels, nbands), dtype=input_image.dtype)
+    if is_input_image_object:
+        chip_dtype = input_image.read_window(list(bands), 0, 0, 1, 1).dtype
+    else:
+        chip_dtype = input_image.dtype
+    all_chips = np.zeros((n_chips, chip_ny_pixels, chip_nx_pixels, nbands), dtype=chip_dtype)
 
     chip_counter = 0
     upper_lefts = []
     n_pix = len(pixel_x_ul_list)
     for cnt, dat in enumerate(zip(pixel_y_ul_list, pixel_x_ul_list)):
         y, x = dat
-        all_chips[chip_counter, :, :, :] = \
-            input_image[y: y + chip_ny_pixels, x: x + chip_nx_pixels, bands]
+        if is_input_image_object:
+            all_chips[chip_counter, :, :, :] = \
+                input_image.read_window(list(bands), int(x), int(y), chip_nx_pixels, chip_ny_pixels)
+        else:
+            all_chips[chip_counter, :, :, :] = \
+                input_image[y: y + chip_ny_pixels, x: x + chip_nx_pixels, bands]
         chip_counter += 1
         upper_lefts.append((y, x))
         per = round(float(cnt) / float(n_pix) * 100.0)
@@ -113,7 +129,7 @@ def chip_images_by_pixel_upper_lefts(input_image,                   # type: ndar
     return all_chips, upper_lefts
 
 
-def chip_images_by_pixel_centers(input_image,                   # type: ndarray
+def chip_images_by_pixel_centers(input_image,                   # type: Union[ndarray, AbstractImage]
                                  pixel_y_center_list,               # type: list
                                  pixel_x_center_list,               # type: list
                                  chip_ny_pixels=256,            # type: int
@@ -1,11 +1,15 @@
 from __future__ import division
 
+from concurrent.futures import ThreadPoolExecutor
 from numpy import ndarray
 import numpy as np
 from typing import Union
 from skimage import transform as sktransform
+from scipy import ndimage as ndi
+import cv2
 import gdal
 import ogr
+from osgeo import gdal_array
 import seaborn
 from seaborn.palettes import _ColorPalette
 from PIL import Image
@@ -25,30 +29,139 @@ def create_uniform_image_data(nx,  # type: int
     return image_data.astype(dtype)
 
 
+INTERPOLATION_ORDERS = {'nearest': 0,
+                        'bilinear': 1,
+                        'biquadratic': 2,
+                        'bicubic': 3,
+                        'biquartic': 4,
+                        'biquintic': 5}
+
+WARP_BACKENDS = ['skimage', 'scipy', 'opencv', 'native']
+
+# data types supported by cv2.remap
+_OPENCV_REMAP_DTYPES = [np.uint8, np.uint16, np.int16, np.float32, np.float64]
+# cv2.remap only handles images with dimensions below SHRT_MAX
+_OPENCV_MAX_DIMENSION = 32767
+
+
 def grid_warp_image_band(image_to_warp,  # type: ndarray
                          image_x_coords,  # type: ndarray
                          image_y_coords,  # type: ndarray
                          nodata_val=0,  # type: int
-                         interpolation='nearest'  # type: str
+                         interpolation='nearest',  # type: str
+                         backend='skimage'  # type: str
                          ):  # type: (...) -> ndarray
-    coords = np.array([image_y_coords, image_x_coords])
-    if interpolation == 'nearest':
-        order = 0
-    elif interpolation == 'bilinear':
-        order = 1
-    elif interpolation == 'biquadratic':
-        order = 2
-    elif interpolation == 'bicubic':
-        order = 3
-    elif interpolation == 'biquartic':
-        order = 4
-    elif interpolation == 'biquintic':
-        order = 5
-    else:
+    """
+    Warps an image band onto a grid of (possibly fractional) image pixel locations.  Grid locations outside of the
+    image are set to nodata_val, and interpolation near the image edges treats pixels outside the image as
+    nodata_val.
+    :param image_to_warp: 2d ndarray to warp
+    :param image_x_coords: image x pixel locations of the output grid
+    :param image_y_coords: image y pixel locations of the output grid
+    :param nodata_val: value of the output grid outside of the image
+    :param interpolation: one of 'nearest', 'bilinear', 'biquadratic', 'bicubic', 'biquartic' or 'biquintic'.  The
+    higher orders use spline interpolation.
+    :param backend: resampling implementation, all backends follow the nodata and interpolation order semantics of
+    skimage.transform.warp:
+    'skimage' - skimage.transform.warp, works in float64 for interpolation orders above 0.
+    'scipy' - scipy.ndimage.map_coordinates directly, without skimage's input checks and conversions.
+    'opencv' - cv2.remap with float32 maps, multithreaded.  OpenCV quantizes bilinear weights to 1/32 of a pixel,
+    so bilinear results differ slightly from the other backends.  Orders above 1, image types cv2.remap does not
+    support and very large images fall back to the 'scipy' backend.
+    'native' - numpy gather, for nearest neighbor interpolation only.
+    :return: warped image band, with the dtype of the input image for nearest neighbor interpolation
+    """
+    if interpolation not in INTERPOLATION_ORDERS:
         raise ValueError("Interpolation not supported: " + interpolation)
+    order = INTERPOLATION_ORDERS[interpolation]
+
+    if backend == 'skimage':
+        coords = np.array([image_y_coords, image_x_coords])
+        warped_image = sktransform.warp(image_to_warp, coords, preserve_range=True,
+                                        mode='constant', cval=nodata_val, order=order)
+    elif backend == 'scipy':
+        warped_image = _scipy_grid_warp(image_to_warp, image_x_coords, image_y_coords, nodata_val, order)
+    elif backend == 'opencv':
+        warped_image = _opencv_grid_warp(image_to_warp, image_x_coords, image_y_coords, nodata_val, order)
+    elif backend == 'native':
+        if order != 0:
+            raise ValueError("the native warp backend only supports nearest neighbor interpolation")
+        warped_image = _native_nearest_grid_warp(image_to_warp, image_x_coords, image_y_coords, nodata_val)
+    else:
+        raise ValueError("Warp backend not supported: " + str(backend) + ", should be one of " + str(WARP_BACKENDS))
+    return warped_image
+
+
+def _scipy_grid_warp(image_to_warp,  # type: ndarray
+                     image_x_coords,  # type: ndarray
+                     image_y_coords,  # type: ndarray
+                     nodata_val,  # type: float
+                     order,  # type: int
+                     ):  # type: (...) -> ndarray
+    if order > 0 and image_to_warp.dtype != np.float32:
+        image_to_warp = image_to_warp.astype(np.float64)
+    coords = np.array([image_y_coords, image_x_coords], dtype=np.float64)
+    warped_image = ndi.map_coordinates(image_to_warp, coords, order=order, mode='grid-constant', cval=nodata_val,
+                                       prefilter=order > 1)
+    if order > 1:
+        # spline interpolation can overshoot, clip to the range of the input like skimage does.  The range is
+        # expanded to include nodata_val if it is outside of the input range and within the range of the output.
+        min_val = np.nanmin(image_to_warp)
+        max_val = np.nanmax(image_to_warp)
+        if not min_val <= nodata_val <= max_val and \
+                np.nanmin(warped_image) <= nodata_val <= np.nanmax(warped_image):
+            min_val = min(min_val, nodata_val)
+            max_val = max(max_val, nodata_val)
+        np.clip(warped_image, min_val, max_val, out=warped_image)
+    return warped_image
+
 
-    warped_image = sktransform.warp(image_to_warp, coords, preserve_range=True,
-                                    mode='constant', cval=nodata_val, order=order)
+def _opencv_grid_warp(image_to_warp,  # type: ndarray
+                      image_x_coords,  # type: ndarray
+                      image_y_coords,  # type: ndarray
+                      nodata_val,  # type: float
+                      order,  # type: int
+                      ):  # type: (...) -> ndarray
+    if order > 1 or image_to_warp.dtype.type not in _OPENCV_REMAP_DTYPES or \
+            max(np.shape(image_to_warp)) >= _OPENCV_MAX_DIMENSION:
+        return _scipy_grid_warp(image_to_warp, image_x_coords, image_y_coords, nodata_val, order)
+
+    invalid = np.logical_not(np.isfinite(image_x_coords) & np.isfinite(image_y_coords))
+    if order == 0:
+        # round half up like scipy, rather than OpenCV's round half to even
+        map_x = np.floor(np.asarray(image_x_coords, dtype=np.float64) + 0.5).astype(np.float32)
+        map_y = np.floor(np.asarray(image_y_coords, dtype=np.float64) + 0.5).astype(np.float32)
+        cv_interpolation = cv2.INTER_NEAREST
+    else:
+        if image_to_warp.dtype != np.float32 and image_to_warp.dtype != np.float64:
+            image_to_warp = image_to_warp.astype(np.float32)
+        map_x = np.asarray(image_x_coords, dtype=np.float32)
+        map_y = np.asarray(image_y_coords, dtype=np.float32)
+        cv_interpolation = cv2.INTER_LINEAR
+    if invalid.any():
+        # OpenCV maps NaN locations into the image, move them outside of it instead
+        map_x = np.where(invalid, np.float32(-2), map_x)
+        map_y = np.where(invalid, np.float32(-2), map_y)
+    warped_image = cv2.remap(image_to_warp, map_x, map_y, cv_interpolation,
+                             borderMode=cv2.BORDER_CONSTANT, borderValue=nodata_val)
+    if order > 0 and invalid.any():
+        warped_image[invalid] = np.nan
+    return warped_image
+
+
+def _native_nearest_grid_warp(image_to_warp,  # type: ndarray
+                              image_x_coords,  # type: ndarray
+                              image_y_coords,  # type: ndarray
+                              nodata_val,  # type: float
+                              ):  # type: (...) -> ndarray
+    ny, nx = np.shape(image_to_warp)
+    with np.errstate(invalid='ignore'):
+        cols = np.floor(np.asarray(image_x_coords) + 0.5)
+        rows = np.floor(np.asarray(image_y_coords) + 0.5)
+        valid = (cols >= 0) & (cols < nx) & (rows >= 0) & (rows < ny)
+    warped_image = np.empty(np.shape(image_x_coords), dtype=image_to_warp.dtype)
+    warped_image[...] = np.asarray(nodata_val).astype(image_to_warp.dtype)
+    warped_image[valid] = image_to_warp[rows[valid].astype(np.int64), cols[valid].astype(np.int64)]
     return warped_image
 
 
@@ -121,6 +234,49 @@ def gdal_grid_image_band(image_to_warp,  # type: ndarray
     print("done")
 
 
+def gdal_read_all_bands(dset,  # type: gdal.Dataset
+                        workers=None,  # type: int
+                        interleaved=False,  # type: bool
+                        ):  # type: (...) -> ndarray
+    """
+    Reads all bands of a GDAL dataset into a single preallocated array, without stacking copies of the bands.
+    :param dset: GDAL dataset to read
+    :param workers: if greater than 1, bands are read concurrently by this many threads.  Each thread reads a subset
+    of the bands using its own dataset handle, opened from the dataset's description.  GDAL releases the GIL while it
+    decodes, so this speeds up reading compressed or many-band images.  Datasets without a description, such as
+    in-memory datasets, are read serially.
+    :param interleaved: if True the dataset is read with a single band-interleaved ReadAsArray call on the dataset,
+    which lets GDAL read pixel-interleaved files such as BIP ENVI files in one pass.  workers is ignored.
+    :return: ndarray of dimensions (ny, nx, nbands)
+    """
+    nbands = dset.RasterCount
+    dtype = gdal_array.GDALTypeCodeToNumericTypeCode(dset.GetRasterBand(1).DataType)
+    image_data = np.empty((dset.RasterYSize, dset.RasterXSize, nbands), dtype=dtype)
+    if interleaved:
+        dset.ReadAsArray(buf_obj=np.moveaxis(image_data, 2, 0))
+        return image_data
+
+    def read_bands(band_dset, band_numbers):
+        for band_number in band_numbers:
+            band_dset.GetRasterBand(band_number + 1).ReadAsArray(buf_obj=image_data[:, :, band_number])
+
+    fname = dset.GetDescription()
+    if workers is None or workers <= 1 or nbands == 1 or not fname:
+        read_bands(dset, range(nbands))
+        return image_data
+
+    def read_bands_with_own_handle(band_numbers):
+        thread_dset = gdal.Open(fname, gdal.GA_ReadOnly)
+        read_bands(thread_dset, band_numbers)
+        thread_dset = None
+
+    n_threads = min(workers, nbands)
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        # list forces any exceptions raised in the threads to be re-raised here
+        list(executor.map(read_bands_with_own_handle, [range(i, nbands, n_threads) for i in range(n_threads)]))
+    return image_data
+
+
 def is_grayscale(image_2d  # type: ndarray
                  ):  # type: (...) -> bool
     return len(image_2d.shape) == 2
@@ -52,15 +52,34 @@ def create_ground_grid(min_x,   # type: float
                        max_y,   # type: float
                        npix_x,  # type: int
                        npix_y,  # type: int
+                       window=None,  # type: tuple
                        ):       # type: (...) -> (ndarray, ndarray)
-    ground_y_arr, ground_x_arr = np.mgrid[0:npix_y, 0:npix_x]
+    """
+    Creates a grid of ground locations at the pixel centers of a north-up raster
+    :param min_x: minimum x of the raster's extent
+    :param max_x: maximum x of the raster's extent
+    :param min_y: minimum y of the raster's extent
+    :param max_y: maximum y of the raster's extent
+    :param npix_x: number of x pixels in the raster
+    :param npix_y: number of y pixels in the raster
+    :param window: optional (x_offset, y_offset, window_npix_x, window_npix_y) pixel window.  If it is provided only
+    the window of the ground grid is created, with the same values as the corresponding part of the full grid.
+    :return: (ground x, ground y) as 2d numpy ndarrays
+    """
+    if window is None:
+        window = (0, 0, npix_x, npix_y)
+    x_offset, y_offset, window_npix_x, window_npix_y = window
+    ground_y_arr, ground_x_arr = np.mgrid[y_offset:y_offset + window_npix_y, x_offset:x_offset + window_npix_x]
     ground_x_arr = ground_x_arr/npix_x*(max_x - min_x)
     ground_y_arr = (ground_y_arr - npix_y) * -1
     ground_y_arr = ground_y_arr/npix_y*(max_y - min_y)
     ground_x_arr = ground_x_arr + min_x
     ground_y_arr = ground_y_arr + min_y
-    x_gsd = np.abs(ground_x_arr[0, 1] - ground_x_arr[0, 0])
-    y_gsd = np.abs(ground_y_arr[0, 0] - ground_y_arr[1, 0])
+    # the ground sample distances are computed from the first two rows and columns of the full grid
+    first_xs = np.arange(2)/npix_x*(max_x - min_x) + min_x
+    first_ys = ((np.arange(2) - npix_y) * -1)/npix_y*(max_y - min_y) + min_y
+    x_gsd = np.abs(first_xs[1] - first_xs[0])
+    y_gsd = np.abs(first_ys[0] - first_ys[1])
     return ground_x_arr + x_gsd/2.0, ground_y_arr - y_gsd/2.0
 
 
@@ -0,0 +1,93 @@
+from __future__ import division
+
+import unittest
+import numpy as np
+from numpy import ndarray
+from resippy.image_objects.abstract_image import AbstractImage
+from resippy.image_objects.abstract_image_metadata import AbstractImageMetadata
+
+
+class CountingImage(AbstractImage):
+    """
+    Image whose bands are generated on the fly, counting the number of bands that are read from disk.
+    """
+
+    def __init__(self, npix_x=60, npix_y=40, nbands=4):
+        super(CountingImage, self).__init__()
+        metadata = AbstractImageMetadata()
+        metadata.set_npix_x(npix_x)
+        metadata.set_npix_y(npix_y)
+        metadata.set_n_bands(nbands)
+        self.set_metadata(metadata)
+        self.n_disk_reads = 0
+
+    def read_all_image_data_from_disk(self):  # type: (...) -> ndarray
+        return np.stack([self.read_band_from_disk(band) for band in range(self.get_metadata().get_n_bands())],
+                        axis=2)
+
+    def read_band_from_disk(self,
+                            band_number  # type: int
+                            ):  # type: (...) -> ndarray
+        self.n_disk_reads += 1
+        ys, xs = np.mgrid[0:self.get_metadata().get_npix_y(), 0:self.get_metadata().get_npix_x()]
+        return (xs + 100 * ys + 10000 * band_number).astype(np.float64)
+
+
+class TestAbstractImage(unittest.TestCase):
+
+    def test_band_cache(self):
+        image = CountingImage()
+        band_nbytes = 60 * 40 * 8
+
+        # the cache is disabled by default
+        image.read_band(0)
+        image.read_band(0)
+        assert image.n_disk_reads == 2
+        assert image.get_band_cache_hits() == image.get_band_cache_misses() == 0
+
+        image.set_band_cache_max_bytes(2 * band_nbytes)
+        expected = image.read_band_from_disk(1)
+        image.n_disk_reads = 0
+        assert (image.read_band(1) == expected).all()
+        assert (image.read_band(1) == expected).all()
+        assert image.n_disk_reads == 1
+        assert image.get_band_cache_hits() == 1
+        assert image.get_band_cache_misses() == 1
+
+        # windows of cached bands are sliced from the cache
+        assert (image.read_window(1, 10, 5, 20, 15)[:, :, 0] == expected[5:20, 10:30]).all()
+        assert image.n_disk_reads == 1
+        assert image.get_band_cache_hits() == 2
+
+        # band 2 is least recently used when band 3 is read, so it is evicted
+        image.read_band(2)
+        image.read_band(1)
+        image.read_band(3)
+        image.n_disk_reads = 0
+        image.read_band(1)
+        image.read_band(3)
+        assert image.n_disk_reads == 0
+        image.read_band(2)
+        assert image.n_disk_reads == 1
+
+        # cached bands are shared between calls, so they are read-only
+        with self.assertRaises(ValueError):
+            image.read_band(2)[0, 0] = 0
+
+        image.close_image()
+        assert image.get_band_cache_hits() == image.get_band_cache_misses() == 0
+        image.read_band(2)
+        assert image.n_disk_reads == 2
+        print("band cache test passed")
+
+    def test_read_window(self):
+        image = CountingImage()
+        full_image = image.read_all_image_data_from_disk()
+        assert (image.read_window(None, 10, 5, 20, 15) == full_image[5:20, 10:30, :]).all()
+        assert (image.read_window([3, 1], 10, 5, 20, 15) == full_image[5:20, 10:30, [3, 1]]).all()
+        assert image.read_window(2, 10, 5, 20, 15).shape == (15, 20, 1)
+        print("read window test passed")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+from __future__ import division
+
+import unittest
+import numpy as np
+from pyproj import Proj
+from resippy.image_objects.earth_overhead.earth_overhead_point_calculators.ideal_pinhole_fpa_local_utm_point_calc \
+    import IdealPinholeFpaLocalUtmPointCalc
+from resippy.photogrammetry.dem.abstract_dem import AbstractDem
+from resippy.photogrammetry.dem.dem_elevation_pyramid import DemElevationPyramid
+
+
+class HillsDem(AbstractDem):
+    """
+    Smooth analytic DEM in local meters, used to check ray intersections without needing a DEM file
+    """
+    def __init__(self):
+        super(HillsDem, self).__init__()
+
+    def get_elevations(self, world_x, world_y, world_proj=None):
+        return 40 + 25 * np.sin(np.asarray(world_x) / 35.0) * np.cos(np.asarray(world_y) / 50.0)
+
+    def get_highest_alt(self, region=None, world_proj=None):
+        return 65.0
+
+    def get_lowest_alt(self, region=None, world_proj=None):
+        return 15.0
+
+    def get_mean_alt(self):
+        return 40.0
+
+    def convert_reference(self, dst_fname, dst_epsg_code):
+        return None
+
+
+class WallDem(AbstractDem):
+    """
+    Flat ground with a thin, tall wall between x = 10.6 and x = 11.1, in local meters.  The wall is much narrower than
+    the elevation pyramid's cells
+    """
+    def __init__(self):
+        super(WallDem, self).__init__()
+
+    def get_elevations(self, world_x, world_y, world_proj=None):
+        world_x = np.asarray(world_x)
+        return np.where(np.logical_and(world_x >= 10.6, world_x <= 11.1), 40.0, 0.0)
+
+    def get_highest_alt(self, region=None, world_proj=None):
+        return 40.0
+
+    def get_lowest_alt(self, region=None, world_proj=None):
+        return 0.0
+
+    def get_mean_alt(self):
+        return 0.5
+
+    def convert_reference(self, dst_fname, dst_epsg_code):
+        return None
+
+
+def create_oblique_point_calc():  # type: (...) -> IdealPinholeFpaLocalUtmPointCalc
+    local_proj = Proj(proj='utm', zone=18, ellps='WGS84')
+    return IdealPinholeFpaLocalUtmPointCalc.init_from_local_params(0, 0, 800, local_proj,
+                                                                  np.deg2rad(20), np.deg2rad(10), np.deg2rad(5),
+                                                                  640, 480, 5, 5, 10)
+
+
+class TestDemRayCaster(unittest.TestCase):
+
+    def test_elevation_pyramid(self):
+        dem = HillsDem()
+        pyramid = DemElevationPyramid.init_from_dem(dem, -100, 100, -50, 50, 1.0)
+        finest_mins, finest_maxes = pyramid.get_cell_min_max(0)
+        coarsest_mins, coarsest_maxes = pyramid.get_cell_min_max(pyramid.get_n_levels() - 1)
+        assert coarsest_mins.shape == (1, 1)
+        assert coarsest_mins[0, 0] == finest_mins.min()
+        assert coarsest_maxes[0, 0] == finest_maxes.max()
+        assert (finest_mins <= finest_maxes).all()
+
+        # the sampled pyramid is kept by the DEM and reused for bounding boxes that it covers
+        cached_pyramid = dem.get_elevation_pyramid(-100, 100, -50, 50, 1.0)
+        assert dem.get_elevation_pyramid(-50, 50, -20, 20, 1.0) is cached_pyramid
+        assert dem.get_elevation_pyramid(-50, 150, -20, 20, 1.0) is not cached_pyramid
+        print("dem elevation pyramid test passed")
+
+    def test_ray_caster_sharp_obstacle(self):
+        dem = WallDem()
+        # 2 meter cells from -20 to 20, the wall is inside of the cells in column 15
+        cell_maxes = np.zeros((20, 20))
+        cell_maxes[:, 15] = 40
+        min_levels, max_levels = DemElevationPyramid.build_min_max_levels(np.zeros((20, 20)), cell_maxes)
+        pyramid = DemElevationPyramid.init_from_levels(dem, -20, -20, 2, 2, min_levels, max_levels, 0.1)
+
+        # the rays are below the top of the wall at x = 10.6, and back above the ground where they leave the wall's cell
+        start_ys = np.linspace(-15, 15, 7)
+        start_xs = np.zeros(7)
+        end_xs = np.zeros(7) + 30
+        xs, ys, alts = pyramid.cast_rays(start_xs, start_ys, 50, end_xs, start_ys, -1)
+        assert np.allclose(xs, 10.6, atol=1e-2)
+        assert np.allclose(ys, start_ys)
+        assert np.allclose(alts, 50 - 51 / 30 * xs, atol=1e-2)
+
+        # rays that pass over the wall land on the ground behind it
+        xs, ys, alts = pyramid.cast_rays(start_xs, start_ys, 90, end_xs, start_ys, -1)
+        assert np.allclose(xs, 90 * 30 / 91, atol=1e-2)
+        assert np.allclose(alts, 0, atol=1e-2)
+        print("dem ray caster sharp obstacle test passed")
+
+    def test_ray_caster(self):
+        point_calc = create_oblique_point_calc()
+        dem = HillsDem()
+        pixels_x, pixels_y = np.meshgrid(np.linspace(0, 639, 40), np.linspace(0, 479, 30))
+        lons, lats, alts = point_calc.pixel_x_y_to_lon_lat_alt(pixels_x, pixels_y, dem, dem_sample_distance=0.5)
+        assert lons.shape == pixels_x.shape
+        assert np.isfinite(alts).all()
+        assert np.allclose(alts, dem.get_elevations(lons, lats), atol=1e-2)
+
+        reprojected_pixels_x, reprojected_pixels_y = point_calc.lon_lat_alt_to_pixel_x_y(lons, lats, alts)
+        assert np.abs(reprojected_pixels_x - pixels_x).max() < 0.01
+        assert np.abs(reprojected_pixels_y - pixels_y).max() < 0.01
+        print("hierarchical dem ray caster test passed")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+from __future__ import division
+
+import unittest
+import numpy as np
+from resippy.utils import envi_utils
+
+
+class TestEnviUtils(unittest.TestCase):
+
+    def test_interleaves(self):
+        image_cube = np.random.randint(0, 10000, (40, 30, 7)).astype(np.uint16)
+        output_fname = "/tmp/test_envi_interleave.img"
+        for interleave in envi_utils.ENVI_INTERLEAVES:
+            envi_utils.write_envi_image(image_cube, output_fname, interleave=interleave)
+            read_cube = envi_utils.read_envi_image(output_fname)
+            assert isinstance(read_cube.base, np.memmap)
+            assert read_cube.shape == image_cube.shape
+            assert (read_cube == image_cube).all()
+            assert (envi_utils.read_envi_image(output_fname, memmap=False) == image_cube).all()
+
+        # raw bil data is ordered line, band, sample
+        envi_utils.write_envi_image(image_cube, output_fname, interleave='bil')
+        raw_data = np.fromfile(output_fname, dtype=np.uint16)
+        assert (raw_data[:30] == image_cube[0, :, 0]).all()
+        assert (raw_data[30:60] == image_cube[0, :, 1]).all()
+        print("envi interleave test passed")
+
+    def test_header_offset_and_byte_order(self):
+        image_cube = np.random.uniform(-1, 1, (20, 15, 4)).astype(np.float32)
+        output_fname = "/tmp/test_envi_offset.img"
+        header_offset = 128
+        with open(output_fname, "wb") as f:
+            f.write(b"\0" * header_offset)
+            f.write(image_cube.transpose((2, 0, 1)).astype('>f4').tobytes())
+        envi_utils.write_envi_header({"samples": 15, "lines": 20, "bands": 4, "header offset": header_offset,
+                                      "data type": 4, "interleave": "bsq", "byte order": 1},
+                                     output_fname + ".hdr")
+        read_cube = envi_utils.read_envi_image(output_fname)
+        assert (read_cube == image_cube).all()
+
+        # big endian cubes are written with a big endian byte order
+        copy_fname = "/tmp/test_envi_offset_copy.img"
+        envi_utils.write_envi_image(read_cube, copy_fname, interleave='bip')
+        assert envi_utils.read_envi_header(copy_fname + ".hdr")['byte order'] == 1
+        assert (envi_utils.read_envi_image(copy_fname) == image_cube).all()
+        print("envi header offset and byte order test passed")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+from __future__ import division
+
+import unittest
+import numpy as np
+import resippy.photogrammetry.crs_defs as crs_defs
+from resippy.image_objects.image_factory import ImageFactory
+from resippy.photogrammetry.dem.dem_factory import DemFactory
+
+
+def write_test_dem(output_fname,  # type: str
+                   npix_x=300,  # type: int
+                   npix_y=200,  # type: int
+                   nodata_val=-9999  # type: float
+                   ):  # type: (...) -> np.ndarray
+    ys, xs = np.mgrid[0:npix_y, 0:npix_x]
+    dem_data = (100 + 30 * np.sin(xs / 40.0) * np.cos(ys / 25.0)).astype(np.float32)
+    dem_data[10:20, 250:270] = nodata_val
+    geot = [500000, 1, 0, 4200000, 0, -1]
+    gtiff_image = ImageFactory.geotiff.from_numpy_array(dem_data, geot, crs_defs.PROJ_4326, nodata_val=nodata_val)
+    gtiff_image.write_to_disk(output_fname)
+    return dem_data
+
+
+class TestGeotiffDem(unittest.TestCase):
+
+    def test_lazy_loading(self):
+        dem_fname = "/tmp/test_geotiff_dem.tif"
+        dem_data = write_test_dem(dem_fname)
+        eager_dem = DemFactory.from_gtiff_file(dem_fname, nodata_value=-9999)
+        lazy_dem = DemFactory.from_gtiff_file(dem_fname, nodata_value=-9999, lazy_loading=True,
+                                              tile_size=64, max_cached_tiles=4)
+        assert lazy_dem.dem_data is None
+
+        world_x = 500000 + np.random.uniform(0, 299, 1000)
+        world_y = 4200000 - np.random.uniform(0, 199, 1000)
+        eager_elevations = eager_dem.get_elevations(world_x, world_y)
+        lazy_elevations = lazy_dem.get_elevations(world_x, world_y)
+        assert np.allclose(eager_elevations, lazy_elevations, equal_nan=True)
+        assert len(lazy_dem._tile_cache) <= 4
+
+        valid_data = dem_data[dem_data != -9999]
+        assert lazy_dem.get_highest_alt() == eager_dem.get_highest_alt() == valid_data.max()
+        assert lazy_dem.get_lowest_alt() == eager_dem.get_lowest_alt() == valid_data.min()
+        assert np.isclose(lazy_dem.get_mean_alt(), eager_dem.get_mean_alt())
+        print("lazy tile-cached geotiff dem test passed")
+
+    def test_interpolation(self):
+        dem_fname = "/tmp/test_geotiff_dem.tif"
+        dem_data = write_test_dem(dem_fname)
+        world_x = 500000 + np.random.uniform(5, 240, 1000)
+        world_y = 4200000 - np.random.uniform(30, 190, 1000)
+        expected = 100 + 30 * np.sin((world_x - 500000 - 0.5) / 40.0) * np.cos((4200000 - world_y - 0.5) / 25.0)
+        for interpolation_method, tolerance in [('bilinear', 0.01), ('bicubic', 1e-3)]:
+            dem = DemFactory.from_gtiff_file(dem_fname, nodata_value=-9999, interpolation_method=interpolation_method)
+            # pixel centers return the DEM values exactly
+            center_elevations = dem.get_elevations(500000 + np.arange(300) + 0.5, np.zeros(300) + 4200000 - 100.5)
+            assert np.allclose(center_elevations, dem_data[100, :])
+            assert np.abs(dem.get_elevations(world_x, world_y) - expected).max() < tolerance
+            assert np.isnan(dem.get_elevations(np.array([500000 + 255.2]), np.array([4200000 - 15.3])))
+            assert np.isfinite(dem.get_elevations(np.array([500000 + 249.9]), np.array([4200000 - 15.3])))
+
+        # world locations keep their float64 precision, so float32 elevations are only rounded
+        dem.set_float32(True)
+        float32_elevations = dem.get_elevations(world_x, world_y)
+        assert float32_elevations.dtype == np.float32
+        assert np.abs(float32_elevations - expected).max() < tolerance + 1e-4
+
+        with self.assertRaises(TypeError):
+            DemFactory.from_gtiff_file(dem_fname, nodata_value=-9999, interpolation_method='linear')
+        print("geotiff dem interpolation test passed")
+
+    def test_regional_alts(self):
+        dem_fname = "/tmp/test_geotiff_dem.tif"
+        dem_data = write_test_dem(dem_fname).astype(float)
+        dem_data[dem_data == -9999] = np.nan
+        region = (500000 + 10.2, 4200000 - 40.5, 500000 + 50.7, 4200000 - 20.1)
+        region_data = dem_data[20:41, 10:51]
+
+        dem = DemFactory.from_gtiff_file(dem_fname, nodata_value=-9999)
+        assert dem.get_highest_alt(region) == np.nanmax(region_data)
+        assert dem.get_lowest_alt(region) == np.nanmin(region_data)
+        assert dem.get_highest_alt(region) < dem.get_highest_alt()
+
+        lazy_dem = DemFactory.from_gtiff_file(dem_fname, nodata_value=-9999, lazy_loading=True, tile_size=32)
+        assert np.nanmax(region_data) <= lazy_dem.get_highest_alt(region) <= lazy_dem.get_highest_alt()
+        assert lazy_dem.get_lowest_alt() <= lazy_dem.get_lowest_alt(region) <= np.nanmin(region_data)
+        print("regional geotiff dem elevation test passed")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,8 @@ import unittest
 from resippy.utils.image_utils import image_utils as image_utils
 import resippy.photogrammetry.crs_defs as crs_defs
 from resippy.image_objects.image_factory import ImageFactory
+from resippy.image_objects.earth_overhead.geotiff.geotiff_image import GeotiffImage
+import resippy.utils.image_utils.image_chipper as image_chipper
 import numpy as np
 import osgeo.gdal_array as gdal_array
 import osr
@@ -67,6 +69,103 @@ class TestGeotiffImages(unittest.TestCase):
         from_disk_osr_wkt = from_disk_osr.ExportToWkt()
         assert numpy_osr_wkt == from_disk_osr_wkt
 
+    def test_read_window(self):
+        npix_x = 300
+        npix_y = 200
+        output_fname = "/tmp/test_geotiff_window.tif"
+        geot = [0, 1, 0, 0, 0, -1]
+        ys, xs = np.mgrid[0:npix_y, 0:npix_x]
+        image_data = np.stack((xs + 1000 * ys, xs * 3 + ys, xs * ys), axis=2).astype(np.int32)
+        gtiff_image = ImageFactory.geotiff.from_numpy_array(image_data, geot, crs_defs.PROJ_4326)
+        gtiff_image.write_to_disk(output_fname)
+        gtiff_image_from_file = ImageFactory.geotiff.from_file(output_fname)
+
+        expected_window = image_data[50:90, 120:180, :]
+        for image in [gtiff_image, gtiff_image_from_file]:
+            assert (image.read_window(None, 120, 50, 60, 40) == expected_window).all()
+            assert (image.read_window([2, 0], 120, 50, 60, 40) == expected_window[:, :, [2, 0]]).all()
+            assert image.read_window(1, 120, 50, 60, 40).shape == (40, 60, 1)
+        assert gtiff_image_from_file.get_image_data() is None
+
+        chips, upper_lefts = image_chipper.chip_entire_image_to_memory(image_data, chip_ny_pixels=64,
+                                                                       chip_nx_pixels=64, bands=[0, 2])
+        file_chips, file_upper_lefts = image_chipper.chip_entire_image_to_memory(gtiff_image_from_file,
+                                                                                 chip_ny_pixels=64,
+                                                                                 chip_nx_pixels=64, bands=[0, 2])
+        assert upper_lefts == file_upper_lefts
+        assert (chips == file_chips).all()
+        print("windowed read test passed")
+
+    def test_parallel_read(self):
+        npix_x = 300
+        npix_y = 200
+        nbands = 7
+        output_fname = "/tmp/test_geotiff_parallel.tif"
+        geot = [0, 1, 0, 0, 0, -1]
+        image_data = np.random.randint(0, 4000, (npix_y, npix_x, nbands)).astype(np.uint16)
+        gtiff_image = ImageFactory.geotiff.from_numpy_array(image_data, geot, crs_defs.PROJ_4326)
+        gtiff_image.write_to_disk(output_fname)
+        gtiff_image_from_file = ImageFactory.geotiff.from_file(output_fname)
+
+        for read_options in [{}, {"workers": 3}, {"workers": 16}, {"interleaved": True}]:
+            read_data = gtiff_image_from_file.read_all_image_data_from_disk(**read_options)
+            assert read_data.dtype == image_data.dtype
+            assert (read_data == image_data).all()
+        print("parallel band read test passed")
+
+    def test_streaming_write(self):
+        npix_x = 300
+        npix_y = 200
+        nbands = 2
+        output_fname = "/tmp/test_geotiff_streaming.tif"
+        geot = [0, 1, 0, 0, 0, -1]
+        ys, xs = np.mgrid[0:npix_y, 0:npix_x]
+        image_data = np.stack((xs + ys, xs * ys), axis=2).astype(np.int32)
+        gdal_dtype = gdal_array.NumericTypeCodeToGDALTypeCode(image_data.dtype)
+
+        tiles = ((x, y, image_data[y:y + 64, x:x + 64, :]) for y in range(0, npix_y, 64) for x in range(0, npix_x, 64))
+        gtiff_image = GeotiffImage.write_tiles_to_disk(
+            output_fname, tiles, npix_x, npix_y, nbands, gdal_dtype, geot, crs_defs.PROJ_4326, nodata_val=-1,
+            compression="DEFLATE", predictor=2, compression_level=6, num_threads=2, block_size=64)
+        assert (gtiff_image.read_all_image_data_from_disk() == image_data).all()
+        assert gtiff_image.get_dset().GetRasterBand(2).GetNoDataValue() == -1
+        assert gtiff_image.get_dset().GetRasterBand(1).GetBlockSize() == [64, 64]
+
+        # tiles can also write a subset of the bands
+        band_tiles = [(0, 0, image_data[:, :, 1], [1]), (0, 0, image_data[:, :, 0], [0])]
+        gtiff_image = GeotiffImage.write_tiles_to_disk(
+            output_fname, band_tiles, npix_x, npix_y, nbands, gdal_dtype, geot, crs_defs.PROJ_4326)
+        assert (gtiff_image.read_all_image_data_from_disk() == image_data).all()
+
+        copy_fname = "/tmp/test_geotiff_streaming_copy.tif"
+        gtiff_image.write_to_disk(copy_fname, compression="LZW", predictor=2, num_threads="ALL_CPUS", block_size=32)
+        assert gtiff_image.get_image_data() is None
+        assert (ImageFactory.geotiff.from_file(copy_fname).read_all_image_data_from_disk() == image_data).all()
+        print("streaming geotiff write test passed")
+
+    def test_cog(self):
+        npix_x = 1000
+        npix_y = 600
+        output_fname = "/tmp/test_geotiff_cog.tif"
+        geot = [0, 1, 0, 0, 0, -1]
+        image_data = np.zeros((npix_y, npix_x, 1), dtype=np.uint8) + 10
+        image_data[:, :npix_x // 2, :] = 200
+        gtiff_image = ImageFactory.geotiff.from_numpy_array(image_data, geot, crs_defs.PROJ_4326)
+        gtiff_image.write_cog_to_disk(output_fname, block_size=128)
+
+        cog_image = ImageFactory.geotiff.from_file(output_fname)
+        assert (cog_image.read_all_image_data_from_disk() == image_data).all()
+        band = cog_image.get_dset().GetRasterBand(1)
+        assert band.GetBlockSize() == [128, 128]
+        # overviews are added until one fits in a single block
+        assert band.GetOverviewCount() == 3
+        overview = band.GetOverview(2)
+        assert (overview.XSize, overview.YSize) == (125, 75)
+        assert overview.GetBlockSize() == [128, 128]
+        overview_data = overview.ReadAsArray()
+        assert (overview_data[:, :60] == 200).all() and (overview_data[:, 65:] == 10).all()
+        print("cloud optimized geotiff test passed")
+
 
 if __name__ == '__main__':
     unittest.main()
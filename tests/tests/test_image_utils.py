@@ -0,0 +1,53 @@
+from __future__ import division
+
+import unittest
+import numpy as np
+from resippy.utils.image_utils import image_utils
+
+
+def create_warp_test_data():  # type: (...) -> (np.ndarray, np.ndarray, np.ndarray)
+    ys, xs = np.mgrid[0:240, 0:320]
+    image_band = (1000 + 800 * np.sin(xs / 23.0) * np.cos(ys / 17.0)).astype(np.uint16)
+    out_ys, out_xs = np.mgrid[0:200, 0:300].astype(np.float64)
+    # rotated and shifted grid that extends past the image on every side
+    pixels_x = out_xs * 1.1 + out_ys * 0.15 - 20.25
+    pixels_y = out_ys * 1.2 - out_xs * 0.1 + 10.5
+    return image_band, pixels_x, pixels_y
+
+
+class TestImageUtils(unittest.TestCase):
+
+    def test_warp_backends(self):
+        image_band, pixels_x, pixels_y = create_warp_test_data()
+        for interpolation in ['nearest', 'bilinear', 'bicubic']:
+            expected = image_utils.grid_warp_image_band(image_band, pixels_x, pixels_y, nodata_val=0,
+                                                        interpolation=interpolation)
+            for backend in ['scipy', 'opencv', 'native']:
+                if backend == 'native' and interpolation != 'nearest':
+                    continue
+                warped = image_utils.grid_warp_image_band(image_band, pixels_x, pixels_y, nodata_val=0,
+                                                          interpolation=interpolation, backend=backend)
+                assert warped.shape == expected.shape
+                if interpolation == 'nearest':
+                    assert warped.dtype == image_band.dtype
+                    assert np.array_equal(warped, expected)
+                elif backend == 'opencv' and interpolation == 'bilinear':
+                    # OpenCV quantizes bilinear weights to 1/32 of a pixel, which matters most at the image edges
+                    # where values are blended with nodata
+                    inside = (pixels_x >= 0) & (pixels_x <= 319) & (pixels_y >= 0) & (pixels_y <= 239)
+                    assert np.allclose(warped[inside], expected[inside], atol=1)
+                    assert np.allclose(warped, expected, atol=1800 / 32)
+                else:
+                    assert np.allclose(warped, expected)
+        print("warp backends test passed")
+
+    def test_native_warp_backend_bilinear(self):
+        image_band, pixels_x, pixels_y = create_warp_test_data()
+        with self.assertRaises(ValueError):
+            image_utils.grid_warp_image_band(image_band, pixels_x, pixels_y, interpolation='bilinear',
+                                             backend='native')
+        print("native warp backend interpolation check test passed")
+
+
+if __name__ == '__main__':
+    unittest.main()
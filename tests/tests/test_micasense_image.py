@@ -0,0 +1,45 @@
+from __future__ import division
+
+import unittest
+import numpy as np
+from imageio import imwrite
+from resippy.image_objects.earth_overhead.micasense.micasense_image import MicasenseImage
+
+
+def create_band_files(npix_x=90,  # type: int
+                      npix_y=70,  # type: int
+                      nbands=2,  # type: int
+                      ):  # type: (...) -> list
+    ys, xs = np.mgrid[0:npix_y, 0:npix_x]
+    band_fnames = []
+    for band_number in range(nbands):
+        band_fname = "/tmp/micasense_test_band_" + str(band_number + 1) + ".tif"
+        imwrite(band_fname, (xs + 100 * ys + 10000 * band_number).astype(np.uint16))
+        band_fnames.append(band_fname)
+    return band_fnames
+
+
+class TestMicasenseImage(unittest.TestCase):
+
+    def test_read_window(self):
+        micasense_image = MicasenseImage()
+        micasense_image.band_fnames = create_band_files()
+
+        # windows are read through GDAL, full bands through imageio, both should give the same pixels
+        window = micasense_image.read_window_from_disk([0, 1], 20, 10, 40, 30)
+        for window_band, band_number in enumerate([0, 1]):
+            full_band = micasense_image.read_band_from_disk(band_number)
+            assert window.dtype == full_band.dtype
+            assert np.array_equal(window[:, :, window_band], full_band[10:40, 20:60])
+
+        # the band files are only opened once
+        band_dset = micasense_image._get_band_dset(0)
+        micasense_image.read_window_from_disk([0], 0, 0, 5, 5)
+        assert micasense_image._get_band_dset(0) is band_dset
+        micasense_image.close_image()
+        assert len(micasense_image._band_dsets) == 0
+        print("micasense read window test passed")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+from __future__ import division
+
+import unittest
+import numpy as np
+from shapely.geometry import box
+import resippy.photogrammetry.crs_defs as crs_defs
+import resippy.photogrammetry.ortho_tools as ortho_tools
+from resippy.photogrammetry.ortho_mosaic import OrthoMosaic
+from resippy.image_objects.image_factory import ImageFactory
+from pyproj import Proj
+from resippy.utils.photogrammetry_utils import reproject_geometry
+
+GSD = 0.001
+MIN_LON = -77.1
+MAX_LAT = 38.97
+
+
+def create_scene(npix_x=400,  # type: int
+                 npix_y=300  # type: int
+                 ):  # type: (...) -> np.ndarray
+    ys, xs = np.mgrid[0:npix_y, 0:npix_x]
+    return (1 + (xs * 7 + ys * 3) % 1000).astype(np.uint16)
+
+
+def crop_scene(scene,  # type: np.ndarray
+               x_offset,  # type: int
+               y_offset,  # type: int
+               npix_x,  # type: int
+               npix_y,  # type: int
+               ):  # type: (...) -> object
+    geot = [MIN_LON + x_offset * GSD, GSD, 0, MAX_LAT - y_offset * GSD, 0, -GSD]
+    image_data = scene[y_offset:y_offset + npix_y, x_offset:x_offset + npix_x]
+    return ImageFactory.geotiff.from_numpy_array(image_data, geot, crs_defs.PROJ_4326)
+
+
+class TestOrthoMosaic(unittest.TestCase):
+
+    def test_mosaic(self):
+        scene = create_scene()
+        windows = [(0, 0, 200, 150), (150, 20, 200, 150), (100, 120, 250, 150)]
+        images = [crop_scene(scene, *window) for window in windows]
+        footprints = [box(MIN_LON + x * GSD, MAX_LAT - (y + ny) * GSD, MIN_LON + (x + nx) * GSD, MAX_LAT - y * GSD)
+                      for x, y, nx, ny in windows]
+        mosaic = OrthoMosaic.init_from_images(images, footprints=footprints)
+        assert mosaic.get_contributing_images(box(-76.94, 38.92, -76.93, 38.93)) == [0, 1]
+
+        # offset the output grid by a quarter pixel so that nearest neighbor lookups are unambiguous
+        world_polygon = box(MIN_LON + GSD / 4, MAX_LAT - 300 * GSD + GSD / 4, MIN_LON + 400 * GSD + GSD / 4,
+                            MAX_LAT + GSD / 4)
+        expected = ortho_tools.create_ortho_gtiff_image_world_to_sensor(crop_scene(scene, 0, 0, 400, 300), 400, 300,
+                                                                        world_polygon).get_image_data()[:, :, 0]
+        for blending in ['feather', 'nadir']:
+            for workers in [None, 2]:
+                mosaic_image = mosaic.create_mosaic("/tmp/test_mosaic.tif", 400, 300, world_polygon=world_polygon,
+                                                    tile_size=64, blending=blending, workers=workers)
+                mosaic_data = mosaic_image.read_band_from_disk(0)
+                valid = mosaic_data != 0
+                assert valid.mean() > 0.6
+                assert np.array_equal(mosaic_data[valid], expected[valid])
+        print("ortho mosaic test passed")
+
+    def test_mosaic_in_projected_world_proj(self):
+        scene = create_scene()
+        windows = [(0, 0, 200, 150), (150, 20, 200, 150)]
+        images = [crop_scene(scene, *window) for window in windows]
+        utm_proj = Proj(proj='utm', zone=18, ellps='WGS84')
+
+        # footprints computed from the default DEM are in its projection, and are reprojected to the world proj
+        mosaic = OrthoMosaic.init_from_images(images, world_proj=utm_proj)
+        expected_footprint = reproject_geometry(box(MIN_LON, MAX_LAT - 150 * GSD, MIN_LON + 200 * GSD, MAX_LAT),
+                                                crs_defs.PROJ_4326, utm_proj)
+        assert mosaic.get_footprints()[0].symmetric_difference(expected_footprint).area < \
+            0.03 * expected_footprint.area
+        region = reproject_geometry(box(-76.94, 38.92, -76.93, 38.93), crs_defs.PROJ_4326, utm_proj)
+        assert mosaic.get_contributing_images(region) == [0, 1]
+
+        mosaic_image = mosaic.create_mosaic("/tmp/test_mosaic_utm.tif", 200, 100, tile_size=64)
+        assert (mosaic_image.read_band_from_disk(0) != 0).mean() > 0.6
+        print("ortho mosaic in a projected world proj test passed")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+from __future__ import division
+
+import unittest
+import numpy as np
+from pyproj import Proj
+from shapely.geometry import box
+import resippy.photogrammetry.crs_defs as crs_defs
+import resippy.photogrammetry.ortho_tools as ortho_tools
+from resippy.image_objects.image_factory import ImageFactory
+from resippy.image_objects.earth_overhead.earth_overhead_point_calculators.ideal_pinhole_fpa_local_utm_point_calc \
+    import IdealPinholeFpaLocalUtmPointCalc
+from resippy.image_objects.earth_overhead.physical_camera.physical_camera_image import PhysicalCameraImage
+from resippy.image_objects.earth_overhead.physical_camera.physical_camera_metadata import PhysicalCameraMetadata
+from resippy.photogrammetry.dem.abstract_dem import AbstractDem
+
+
+def create_test_image(npix_x=300,  # type: int
+                      npix_y=200,  # type: int
+                      ):  # type: (...) -> np.ndarray
+    ys, xs = np.mgrid[0:npix_y, 0:npix_x]
+    image_data = np.zeros((npix_y, npix_x, 2), dtype=np.uint16)
+    image_data[:, :, 0] = 1 + (xs * 7 + ys * 3) % 1000
+    image_data[:, :, 1] = 1 + (xs * 2 + ys * 5) % 500
+    geot = [-77.1, 0.001, 0, 38.97, 0, -0.001]
+    return ImageFactory.geotiff.from_numpy_array(image_data, geot, crs_defs.PROJ_4326)
+
+
+class HillsDem(AbstractDem):
+    """
+    Smooth analytic DEM in local meters, its hills bend the projected image border
+    """
+    def __init__(self):
+        super(HillsDem, self).__init__()
+
+    def get_elevations(self, world_x, world_y, world_proj=None):
+        return 40 + 25 * np.sin(np.asarray(world_x) / 35.0) * np.cos(np.asarray(world_y) / 50.0)
+
+    def get_highest_alt(self, region=None, world_proj=None):
+        return 65.0
+
+    def get_lowest_alt(self, region=None, world_proj=None):
+        return 15.0
+
+    def get_mean_alt(self):
+        return 40.0
+
+    def convert_reference(self, dst_fname, dst_epsg_code):
+        return None
+
+
+def create_oblique_image():  # type: (...) -> PhysicalCameraImage
+    local_proj = Proj(proj='utm', zone=18, ellps='WGS84')
+    point_calc = IdealPinholeFpaLocalUtmPointCalc.init_from_local_params(0, 0, 800, local_proj,
+                                                                        np.deg2rad(20), np.deg2rad(10), np.deg2rad(5),
+                                                                        640, 480, 5, 5, 10)
+    metadata = PhysicalCameraMetadata()
+    metadata.set_npix_x(640)
+    metadata.set_npix_y(480)
+    metadata.set_n_bands(1)
+    image = PhysicalCameraImage()
+    image.set_metadata(metadata)
+    image.set_point_calculator(point_calc)
+    return image
+
+
+class TestOrthoTools(unittest.TestCase):
+
+    def test_streaming_ortho(self):
+        overhead_image = create_test_image()
+        # the output extends beyond the image so that some blocks are partially or entirely nodata
+        world_polygon = box(-77.12, 38.75, -76.85, 38.96)
+        in_memory_ortho = ortho_tools.create_ortho_gtiff_image_world_to_sensor(overhead_image, 270, 210,
+                                                                               world_polygon,
+                                                                               interpolation='bilinear',
+                                                                               mask_no_data_region=True)
+        streamed_ortho = ortho_tools.create_ortho_gtiff_image_world_to_sensor(overhead_image, 270, 210,
+                                                                              world_polygon,
+                                                                              interpolation='bilinear',
+                                                                              mask_no_data_region=True,
+                                                                              output_fname="/tmp/streamed_ortho.tif",
+                                                                              block_size=64)
+        streamed_data = streamed_ortho.read_all_image_data_from_disk()
+        assert streamed_data.shape == in_memory_ortho.get_image_data().shape
+        assert np.array_equal(streamed_data, in_memory_ortho.get_image_data())
+        assert np.allclose(streamed_ortho.get_point_calculator().get_geot(),
+                           in_memory_ortho.get_point_calculator().get_geot())
+        print("streaming ortho test passed")
+
+    def test_parallel_ortho(self):
+        overhead_image = create_test_image()
+        world_polygon = box(-77.12, 38.75, -76.85, 38.96)
+        in_memory_ortho = ortho_tools.create_ortho_gtiff_image_world_to_sensor(overhead_image, 270, 210,
+                                                                               world_polygon,
+                                                                               interpolation='bilinear')
+        parallel_ortho = ortho_tools.create_ortho_gtiff_image_world_to_sensor(overhead_image, 270, 210,
+                                                                              world_polygon,
+                                                                              interpolation='bilinear',
+                                                                              output_fname="/tmp/parallel_ortho.tif",
+                                                                              block_size=64,
+                                                                              workers=3)
+        assert np.array_equal(parallel_ortho.read_all_image_data_from_disk(), in_memory_ortho.get_image_data())
+        print("parallel ortho test passed")
+
+    def test_get_pixel_values(self):
+        overhead_image = create_test_image()
+        overhead_image.get_metadata().set_nodata_val(1)
+        image_band = overhead_image.get_image_band(0)
+        pixels_x = np.array([0.2, 5.6, 150.3, 297.8, 299.4, 120.0, -30.0, 400.0])
+        pixels_y = np.array([0.4, 197.7, 100.2, 3.1, 199.2, 50.0, -30.0, 100.0])
+        # the geotiff point calculator maps pixel x, y to the corner based location x, y
+        lons = -77.1 + pixels_x * 0.001
+        lats = 38.97 - pixels_y * 0.001
+        pixel_values = ortho_tools.get_pixel_values(overhead_image, lons, lats, 0, window=8)
+        assert pixel_values.shape == (2, len(pixels_x))
+        for x, y, value in zip(pixels_x, pixels_y, pixel_values[0]):
+            x = int(np.round(x))
+            y = int(np.round(y))
+            pixel_window = image_band[max(y - 4, 0):max(y + 4, 0), max(x - 4, 0):max(x + 4, 0)]
+            good_pixels = pixel_window[pixel_window != 1]
+            if len(good_pixels) == 0:
+                assert np.isnan(value)
+            else:
+                assert np.isclose(value, good_pixels.mean())
+        assert np.isnan(pixel_values[0][-2]) and np.isnan(pixel_values[0][-1])
+        print("get pixel values test passed")
+
+    def test_adaptive_extent(self):
+        overhead_image = create_oblique_image()
+        dem = HillsDem()
+        tolerance = 1.0
+        full_extent = ortho_tools.get_extent(overhead_image, dem=dem)
+        adaptive_extent = ortho_tools.get_extent(overhead_image, dem=dem, footprint_tolerance=tolerance)
+        assert full_extent.hausdorff_distance(adaptive_extent) < tolerance
+
+        # the terrain bends the border, so some of the 16 initial border segments are split, but far fewer border
+        # pixels are projected than for the full border
+        lons, lats = ortho_tools._get_adaptive_border_lon_lats(overhead_image, dem, 0, tolerance, 0.01, 20)
+        assert 16 < len(lons) < 100
+        print("adaptive extent test passed")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -127,6 +127,14 @@ class TestCrsTools(unittest.TestCase):
         assert np.isclose(offsets_solved, offset_matrix).all()
         print("offsets solver test passed")
 
+    def test_ground_grid_window(self):
+        full_x, full_y = photogram.create_ground_grid(-77.1, -76.9, 38.8, 38.97, 300, 250)
+        window_x, window_y = photogram.create_ground_grid(-77.1, -76.9, 38.8, 38.97, 300, 250,
+                                                          window=(128, 64, 100, 90))
+        assert np.array_equal(full_x[64:154, 128:228], window_x)
+        assert np.array_equal(full_y[64:154, 128:228], window_y)
+        print("ground grid window test passed")
+
 
 if __name__ == '__main__':
     unittest.main()
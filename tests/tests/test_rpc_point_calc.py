@@ -0,0 +1,259 @@
+from __future__ import division
+
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from resippy.image_objects.earth_overhead.earth_overhead_point_calculators.rpc_point_calc import RPCPointCalc
+from resippy.image_objects.earth_overhead.earth_overhead_point_calculators.approximate_point_calc \
+    import ApproximatePointCalc
+from resippy.utils import photogrammetry_utils
+import numpy as np
+
+
+def create_rpc_point_calc():  # type: (...) -> RPCPointCalc
+    samp_num_coeff = np.array([-2.401488e-03, 1.014755e+00, 1.773499e-02, 2.048626e-02, -4.609470e-05,
+                               4.830748e-04, -2.015272e-04, 1.212827e-03, 5.065720e-06, 3.740396e-05,
+                               -1.582743e-07, 1.437278e-06, 3.620892e-08, 2.144755e-07, -1.333671e-07,
+                               0.000000e+00, -5.229308e-08, 1.111695e-06, -1.337535e-07, 0.000000e+00])
+
+    samp_den_coeff = np.array([1.000000e+00, 1.197118e-03, 9.340466e-05, -4.381989e-04, 3.359669e-08,
+                               0.000000e+00, 2.959469e-08, 1.412447e-06, 8.398708e-08, -1.782544e-07,
+                               0.000000e+00, 0.000000e+00, 0.000000e+00, 0.000000e+00, 0.000000e+00,
+                               0.000000e+00, 0.000000e+00, 0.000000e+00, 0.000000e+00, 0.000000e+00])
+
+    line_num_coeff = np.array([3.448567e-03, 1.975650e-02, -1.147937e+00, 1.622923e-01, 5.249710e-05,
+                               4.231537e-05, 3.559660e-04, -9.052539e-05, -1.932047e-03, -2.341649e-05,
+                               -1.025999e-06, 0.000000e+00, -1.116629e-07, 1.635365e-07, -1.704056e-07,
+                               -3.139215e-06, 1.607936e-06, 1.281797e-07, 1.412060e-06, -2.638793e-07])
+
+    line_den_coeff = np.array([1.000000e+00, -1.294475e-05, 1.682046e-03, -1.481430e-04, 1.503771e-07,
+                               7.529185e-07, -4.596928e-07, 0.000000e+00, 2.736755e-06, -1.609702e-06,
+                               3.466453e-08, 1.066716e-08, 0.000000e+00, 0.000000e+00, 0.000000e+00,
+                               0.000000e+00, -7.020142e-08, 1.766701e-08, 2.536018e-07, 0.000000e+00])
+
+    return RPCPointCalc.init_from_coeffs(samp_num_coeff, samp_den_coeff, 1283.0, 1009.0,
+                                         line_num_coeff, line_den_coeff, 1143.0, 856.0,
+                                         0.0142, 32.8902, 0.0167, 13.1706, 501.0, 42.0)
+
+
+def create_lon_lat_grid(point_calc,  # type: RPCPointCalc
+                        nx=50,  # type: int
+                        ny=40  # type: int
+                        ):  # type: (...) -> (np.ndarray, np.ndarray)
+    lon_center, lat_center = point_calc.get_approximate_lon_lat_center()
+    return photogrammetry_utils.create_ground_grid(lon_center - 0.01, lon_center + 0.01,
+                                                  lat_center - 0.01, lat_center + 0.01,
+                                                  nx, ny)
+
+
+class TestRPCPointCalc(unittest.TestCase):
+
+    def test_iterative_solver_per_point_convergence(self):
+        point_calc = create_rpc_point_calc()
+        lons, lats = create_lon_lat_grid(point_calc)
+        alts = np.zeros_like(lons) + 100
+        pixels_x, pixels_y = point_calc.lon_lat_alt_to_pixel_x_y(lons, lats, alts)
+
+        max_pixel_error = 0.001
+        solved_lons, solved_lats, n_iterations, residuals = \
+            point_calc._pixel_x_y_alt_to_lon_lat_native_solver(pixels_x, pixels_y, alts,
+                                                               max_pixel_error=max_pixel_error,
+                                                               return_solver_stats=True)
+        assert solved_lons.shape == lons.shape
+        assert n_iterations.shape == lons.shape
+        assert residuals.shape == lons.shape
+        assert (residuals <= max_pixel_error).all()
+        assert n_iterations.min() < n_iterations.max()
+
+        solved_pixels_x, solved_pixels_y = point_calc.lon_lat_alt_to_pixel_x_y(solved_lons, solved_lats, alts)
+        assert np.abs(solved_pixels_x - pixels_x).max() <= max_pixel_error
+        assert np.abs(solved_pixels_y - pixels_y).max() <= max_pixel_error
+
+        solved_lon, solved_lat = point_calc._pixel_x_y_alt_to_lon_lat_native_solver(pixels_x[3, 4], pixels_y[3, 4],
+                                                                                    100.0)
+        assert np.ndim(solved_lon) == 0
+        assert np.isclose(solved_lon, solved_lons[3, 4])
+        print("per-point iterative solver test passed")
+
+    def test_analytic_partials(self):
+        point_calc = create_rpc_point_calc()
+        x = np.linspace(-1, 1, 21)
+        y = np.linspace(1, -1, 21)
+        z = np.linspace(-0.5, 0.5, 21)
+        delta = 1e-6
+        for coeffs in [point_calc._samp_num_coeff, point_calc._samp_den_coeff,
+                       point_calc._line_num_coeff, point_calc._line_den_coeff]:
+            p, dp_dx, dp_dy = RPCPointCalc.compute_p_and_partials(coeffs, x, y, z)
+            assert np.allclose(p, RPCPointCalc.compute_p(coeffs, x, y, z))
+            fd_dx = (RPCPointCalc.compute_p(coeffs, x + delta, y, z) -
+                     RPCPointCalc.compute_p(coeffs, x - delta, y, z)) / (2 * delta)
+            fd_dy = (RPCPointCalc.compute_p(coeffs, x, y + delta, z) -
+                     RPCPointCalc.compute_p(coeffs, x, y - delta, z)) / (2 * delta)
+            assert np.allclose(dp_dx, fd_dx, atol=1e-8)
+            assert np.allclose(dp_dy, fd_dy, atol=1e-8)
+        print("analytic rpc partial derivatives test passed")
+
+    def test_newton_inverse(self):
+        point_calc = create_rpc_point_calc()
+        lons, lats = create_lon_lat_grid(point_calc)
+        alts = np.zeros_like(lons) + 250
+        pixels_x, pixels_y = point_calc.lon_lat_alt_to_pixel_x_y(lons, lats, alts)
+
+        solved_lons, solved_lats = point_calc.pixel_x_y_alt_to_lon_lat(pixels_x, pixels_y, alts,
+                                                                       pixel_error_threshold=0.001)
+        assert solved_lons.shape == lons.shape
+        assert np.allclose(solved_lons, lons, rtol=0, atol=1e-7)
+        assert np.allclose(solved_lats, lats, rtol=0, atol=1e-7)
+
+        # the caller's convergence threshold and iteration limit are used by the Newton inverse
+        one_iteration_lons, one_iteration_lats = point_calc.pixel_x_y_alt_to_lon_lat(pixels_x, pixels_y, alts,
+                                                                                     max_iter=1)
+        assert np.abs(one_iteration_lons - lons).max() > 1e-6
+        precise_lons, precise_lats = point_calc.pixel_x_y_alt_to_lon_lat(pixels_x, pixels_y, alts,
+                                                                         pixel_error_threshold=1e-7)
+        reprojected_x, reprojected_y = point_calc.lon_lat_alt_to_pixel_x_y(precise_lons, precise_lats, alts)
+        assert np.abs(reprojected_x - pixels_x).max() <= 1e-7
+        assert np.abs(reprojected_y - pixels_y).max() <= 1e-7
+
+        solved_lon, solved_lat = point_calc.pixel_x_y_alt_to_lon_lat(pixels_x[0, 0], pixels_y[0, 0], 250,
+                                                                     pixel_error_threshold=0.001)
+        assert np.ndim(solved_lon) == 0
+        assert np.isclose(solved_lon, lons[0, 0], rtol=0, atol=1e-7)
+        assert np.isclose(solved_lat, lats[0, 0], rtol=0, atol=1e-7)
+        print("rpc newton inverse test passed")
+
+    def test_inverse_rpc(self):
+        point_calc = create_rpc_point_calc()
+        fit_errors = point_calc.fit_inverse_rpc()
+        assert fit_errors["max_pixel_error"] < 0.01
+        assert point_calc.get_inverse_rpc_fit_errors() == fit_errors
+
+        lons, lats = create_lon_lat_grid(point_calc)
+        alts = np.zeros_like(lons) + 250
+        pixels_x, pixels_y = point_calc.lon_lat_alt_to_pixel_x_y(lons, lats, alts)
+
+        point_calc.set_inverse_rpc_newton_polish(False)
+        fitted_lons, fitted_lats = point_calc.pixel_x_y_alt_to_lon_lat(pixels_x, pixels_y, alts)
+        fitted_pixels_x, fitted_pixels_y = point_calc.lon_lat_alt_to_pixel_x_y(fitted_lons, fitted_lats, alts)
+        assert np.abs(fitted_pixels_x - pixels_x).max() < 0.01
+        assert np.abs(fitted_pixels_y - pixels_y).max() < 0.01
+
+        point_calc.set_inverse_rpc_newton_polish(True)
+        polished_lons, polished_lats = point_calc.pixel_x_y_alt_to_lon_lat(pixels_x, pixels_y, alts)
+        assert np.allclose(polished_lons, lons, rtol=0, atol=1e-7)
+        assert np.allclose(polished_lats, lats, rtol=0, atol=1e-7)
+
+        inverse_rpc_fname = "/tmp/test_inverse_rpc.npz"
+        point_calc.save_inverse_rpc(inverse_rpc_fname)
+        reloaded_point_calc = create_rpc_point_calc()
+        reloaded_point_calc.load_inverse_rpc(inverse_rpc_fname)
+        reloaded_point_calc.set_inverse_rpc_newton_polish(False)
+        assert reloaded_point_calc.get_inverse_rpc_fit_errors() == fit_errors
+        reloaded_lons, reloaded_lats = reloaded_point_calc.pixel_x_y_alt_to_lon_lat(pixels_x, pixels_y, alts)
+        assert (reloaded_lons == fitted_lons).all()
+        assert (reloaded_lats == fitted_lats).all()
+        print("inverse rpc test passed")
+
+    def test_approximate_point_calc(self):
+        point_calc = create_rpc_point_calc()
+        lons, lats = create_lon_lat_grid(point_calc, nx=301, ny=257)
+        alts = np.zeros_like(lons) + 100
+        pixels_x, pixels_y = point_calc.lon_lat_alt_to_pixel_x_y(lons, lats, alts)
+
+        max_pixel_error = 0.05
+        approximate_point_calc = ApproximatePointCalc.init_from_point_calc(point_calc,
+                                                                           max_pixel_error=max_pixel_error)
+        approximate_pixels_x, approximate_pixels_y = approximate_point_calc.lon_lat_alt_to_pixel_x_y(lons, lats, alts)
+        assert approximate_pixels_x.shape == lons.shape
+        assert np.abs(approximate_pixels_x - pixels_x).max() <= max_pixel_error
+        assert np.abs(approximate_pixels_y - pixels_y).max() <= max_pixel_error
+
+        # altitudes that are not locally planar, such as a building on a DEM, are refined down to exact projections
+        building_alts = np.zeros_like(lons) + 100
+        building_alts[100:130, 77:151] += 300
+        building_alts[200:203, 10:13] += 300
+        pixels_x, pixels_y = point_calc.lon_lat_alt_to_pixel_x_y(lons, lats, building_alts)
+        approximate_pixels_x, approximate_pixels_y = \
+            approximate_point_calc.lon_lat_alt_to_pixel_x_y(lons, lats, building_alts)
+        assert np.abs(approximate_pixels_x - pixels_x).max() <= max_pixel_error
+        assert np.abs(approximate_pixels_y - pixels_y).max() <= max_pixel_error
+
+        pixels_x, pixels_y = point_calc.lon_lat_alt_to_pixel_x_y(lons, lats, alts)
+        approximate_pixel_x, approximate_pixel_y = \
+            approximate_point_calc.lon_lat_alt_to_pixel_x_y(lons[:, 0], lats[:, 0], alts[:, 0])
+        assert (approximate_pixel_x == pixels_x[:, 0]).all()
+        assert (approximate_pixel_y == pixels_y[:, 0]).all()
+        print("approximate point calc test passed")
+
+    def test_ray_footprint_bounds(self):
+        point_calc = create_rpc_point_calc()
+        lons, lats = create_lon_lat_grid(point_calc, nx=120, ny=90)
+        pixels_x, pixels_y = point_calc.lon_lat_alt_to_pixel_x_y(lons, lats, np.zeros_like(lons) + 100)
+        bounds = point_calc.get_ray_footprint_bounds(pixels_x, pixels_y, 400, -50)
+
+        # the bounds from the projected border contain every pixel's rays, and are close to the exact bounds
+        footprint_lons = []
+        footprint_lats = []
+        for alt in (400, -50):
+            alt_lons, alt_lats = point_calc.pixel_x_y_alt_to_lon_lat(pixels_x, pixels_y, np.zeros_like(lons) + alt)
+            footprint_lons.append(alt_lons)
+            footprint_lats.append(alt_lats)
+        exact_bounds = (np.min(footprint_lons), np.min(footprint_lats),
+                        np.max(footprint_lons), np.max(footprint_lats))
+        assert bounds[0] <= exact_bounds[0] and bounds[1] <= exact_bounds[1]
+        assert bounds[2] >= exact_bounds[2] and bounds[3] >= exact_bounds[3]
+        assert np.allclose(bounds, exact_bounds, rtol=0, atol=0.05 * (exact_bounds[2] - exact_bounds[0]))
+        print("ray footprint bounds test passed")
+
+    def test_chunked_evaluation(self):
+        point_calc = create_rpc_point_calc()
+        lons, lats = create_lon_lat_grid(point_calc)
+        alts = np.zeros_like(lons) + 100
+        pixels_x, pixels_y = point_calc.lon_lat_alt_to_pixel_x_y(lons, lats, alts)
+        solved_lons, solved_lats = point_calc.pixel_x_y_alt_to_lon_lat(pixels_x, pixels_y, alts)
+
+        point_calc.set_chunk_size(333)
+        chunked_pixels_x, chunked_pixels_y = point_calc.lon_lat_alt_to_pixel_x_y(lons, lats, alts)
+        assert chunked_pixels_x.shape == lons.shape
+        assert np.allclose(chunked_pixels_x, pixels_x, rtol=0, atol=1e-9)
+        assert np.allclose(chunked_pixels_y, pixels_y, rtol=0, atol=1e-9)
+        for scalar_alt in [100, np.array(100.0)]:
+            scalar_alt_pixels_x, scalar_alt_pixels_y = point_calc.lon_lat_alt_to_pixel_x_y(lons, lats, scalar_alt)
+            assert np.allclose(scalar_alt_pixels_x, pixels_x, rtol=0, atol=1e-9)
+            assert np.allclose(scalar_alt_pixels_y, pixels_y, rtol=0, atol=1e-9)
+
+        chunked_lons, chunked_lats = point_calc.pixel_x_y_alt_to_lon_lat(pixels_x, pixels_y, alts)
+        assert chunked_lons.shape == lons.shape
+        assert np.allclose(chunked_lons, solved_lons, rtol=0, atol=1e-9)
+        assert np.allclose(chunked_lats, solved_lats, rtol=0, atol=1e-9)
+
+        point_calc.set_memory_budget(1e6)
+        assert point_calc.get_chunk_size() == 1953
+        print("chunked point calc evaluation test passed")
+
+    def test_multithreaded_evaluation(self):
+        point_calc = create_rpc_point_calc()
+        lons, lats = create_lon_lat_grid(point_calc, nx=211, ny=97)
+        alts = np.zeros_like(lons) + 100
+        point_calc.set_chunk_size(1000)
+        serial_pixels_x, serial_pixels_y = point_calc.lon_lat_alt_to_pixel_x_y(lons, lats, alts)
+        serial_lons, serial_lats = point_calc.pixel_x_y_alt_to_lon_lat(serial_pixels_x, serial_pixels_y, alts)
+
+        point_calc.set_n_workers(4)
+        threaded_pixels_x, threaded_pixels_y = point_calc.lon_lat_alt_to_pixel_x_y(lons, lats, alts)
+        threaded_lons, threaded_lats = point_calc.pixel_x_y_alt_to_lon_lat(serial_pixels_x, serial_pixels_y, alts)
+        assert (threaded_pixels_x == serial_pixels_x).all()
+        assert (threaded_pixels_y == serial_pixels_y).all()
+        assert (threaded_lons == serial_lons).all()
+        assert (threaded_lats == serial_lats).all()
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            point_calc.set_executor(executor)
+            shared_pixels_x, shared_pixels_y = point_calc.lon_lat_alt_to_pixel_x_y(lons, lats, alts)
+            point_calc.set_executor(None)
+        assert (shared_pixels_x == serial_pixels_x).all()
+        assert (shared_pixels_y == serial_pixels_y).all()
+        print("multithreaded point calc evaluation test passed")
+
+
+if __name__ == '__main__':
+    unittest.main()
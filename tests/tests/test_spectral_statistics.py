@@ -0,0 +1,62 @@
+from __future__ import division
+
+import unittest
+import numpy as np
+from resippy.spectral import spectral_image_processing_1d as sp1d
+from resippy.spectral import spectral_statistics
+from resippy.spectral.spectral_statistics import SpectralStatisticsAccumulator
+from resippy.utils import spectral_utils
+from resippy.utils import envi_utils
+
+
+class TestSpectralStatistics(unittest.TestCase):
+
+    def test_statistics_match_in_memory(self):
+        ny, nx, nbands = 70, 50, 6
+        image_cube = np.random.normal(0, 1, (ny, nx, nbands)) * np.arange(1, nbands + 1)
+        image_cube = image_cube.astype(np.float32)
+        flattened_cube = spectral_utils.flatten_image_cube(image_cube)
+        expected_mean = sp1d.compute_image_cube_spectral_mean(flattened_cube.astype(np.float64))
+        expected_covariance = sp1d.compute_image_cube_spectral_covariance(flattened_cube.astype(np.float64))
+
+        for cube, options in [(image_cube, {"block_lines": 8}), (flattened_cube, {"block_samples": 333})]:
+            mean, covariance = spectral_statistics.compute_spectral_mean_and_covariance(cube, **options)
+            assert np.allclose(mean, expected_mean)
+            assert np.allclose(covariance, expected_covariance)
+
+        # masked samples are excluded, with the same mask convention as the in-memory functions
+        image_mask = np.zeros((ny, nx))
+        image_mask[10:40, 5:20] = 1
+        flattened_mask = np.ravel(image_mask)
+        expected_masked_covariance = sp1d.compute_image_cube_spectral_covariance(flattened_cube.astype(np.float64),
+                                                                                 flattened_mask)
+        mean, covariance = spectral_statistics.compute_spectral_mean_and_covariance(image_cube, image_mask,
+                                                                                    block_lines=16)
+        assert np.allclose(mean, flattened_cube[flattened_mask == 0].astype(np.float64).mean(axis=0))
+        assert np.allclose(covariance, expected_masked_covariance)
+        print("out of core spectral statistics test passed")
+
+    def test_memmap_cube_and_merge(self):
+        ny, nx, nbands = 64, 40, 5
+        image_cube = (1e4 + np.random.normal(0, 1, (ny, nx, nbands))).astype(np.float32)
+        output_fname = "/tmp/test_spectral_statistics.img"
+        envi_utils.write_envi_image(image_cube, output_fname, interleave='bsq')
+        memmap_cube = envi_utils.read_envi_image(output_fname)
+
+        accumulator_top = SpectralStatisticsAccumulator()
+        accumulator_top.add_image_cube(memmap_cube[:30], block_lines=7)
+        accumulator_bottom = SpectralStatisticsAccumulator()
+        accumulator_bottom.add_image_cube(memmap_cube[30:], block_lines=7)
+        accumulator_top.merge(accumulator_bottom)
+
+        flattened_cube = spectral_utils.flatten_image_cube(image_cube).astype(np.float64)
+        assert accumulator_top.get_count() == ny * nx
+        assert np.allclose(accumulator_top.get_mean(), flattened_cube.mean(axis=0), rtol=0, atol=1e-8)
+        assert np.allclose(accumulator_top.get_covariance(), np.cov(flattened_cube.transpose()), rtol=0, atol=1e-8)
+        assert np.allclose(accumulator_top.get_covariance(ddof=0), np.cov(flattened_cube.transpose(), ddof=0))
+        assert SpectralStatisticsAccumulator().get_mean() is None
+        print("memory mapped cube spectral statistics test passed")
+
+
+if __name__ == '__main__':
+    unittest.main()
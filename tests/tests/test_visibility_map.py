@@ -0,0 +1,122 @@
+from __future__ import division
+
+import unittest
+import numpy as np
+from pyproj import Proj
+from shapely.geometry import box
+from resippy.image_objects.earth_overhead.earth_overhead_point_calculators.ideal_pinhole_fpa_local_utm_point_calc \
+    import IdealPinholeFpaLocalUtmPointCalc
+from resippy.image_objects.earth_overhead.physical_camera.physical_camera_image import PhysicalCameraImage
+from resippy.image_objects.earth_overhead.physical_camera.physical_camera_metadata import PhysicalCameraMetadata
+from resippy.photogrammetry.dem.abstract_dem import AbstractDem
+import resippy.photogrammetry.ortho_tools as ortho_tools
+
+SENSOR_X = 0
+SENSOR_Y = 0
+SENSOR_ALT = 800
+
+
+class BuildingDem(AbstractDem):
+    """
+    Flat ground with a single box shaped building, in local meters
+    """
+    def __init__(self, min_x, max_x, min_y, max_y, height):
+        super(BuildingDem, self).__init__()
+        self.building_bounds = (min_x, max_x, min_y, max_y)
+        self.height = height
+
+    def get_elevations(self, world_x, world_y, world_proj=None):
+        min_x, max_x, min_y, max_y = self.building_bounds
+        world_x = np.asarray(world_x)
+        world_y = np.asarray(world_y)
+        inside = (world_x >= min_x) & (world_x <= max_x) & (world_y >= min_y) & (world_y <= max_y)
+        return np.where(inside, self.height, 0.0)
+
+    def get_highest_alt(self, region=None, world_proj=None):
+        return self.height
+
+    def get_lowest_alt(self, region=None, world_proj=None):
+        return 0.0
+
+    def get_mean_alt(self):
+        return 0.0
+
+    def convert_reference(self, dst_fname, dst_epsg_code):
+        return None
+
+
+def create_oblique_image():  # type: (...) -> PhysicalCameraImage
+    local_proj = Proj(proj='utm', zone=18, ellps='WGS84')
+    point_calc = IdealPinholeFpaLocalUtmPointCalc.init_from_local_params(SENSOR_X, SENSOR_Y, SENSOR_ALT, local_proj,
+                                                                        np.deg2rad(20), np.deg2rad(10), 0,
+                                                                        640, 480, 5, 5, 10)
+    metadata = PhysicalCameraMetadata()
+    metadata.set_npix_x(640)
+    metadata.set_npix_y(480)
+    metadata.set_n_bands(1)
+    image = PhysicalCameraImage()
+    image.set_metadata(metadata)
+    image.set_point_calculator(point_calc)
+    return image
+
+
+class TestVisibilityMap(unittest.TestCase):
+
+    def test_building_occlusion(self):
+        image = create_oblique_image()
+        point_calc = image.get_point_calculator()
+        center_x, center_y = point_calc.pixel_x_y_alt_to_lon_lat(np.array([320.0]), np.array([240.0]), 0)
+        center_x, center_y = center_x[0], center_y[0]
+        dem = BuildingDem(center_x - 10, center_x + 10, center_y - 10, center_y + 10, 40)
+        world_polygon = box(center_x - 60, center_y - 60, center_x + 60, center_y + 60)
+        visible = ortho_tools.create_visibility_map(image, 480, 480, world_polygon,
+                                                    world_proj=point_calc.get_projection(), dem=dem, block_size=128)
+
+        # brute force occlusion of the ground points, by sampling the lines of sight to the sensor
+        ground_x, ground_y = ortho_tools.create_ground_grid(center_x - 60, center_x + 60, center_y - 60,
+                                                            center_y + 60, 480, 480)
+        ground_x, ground_y, visible = ground_x[::4, ::4], ground_y[::4, ::4], visible[::4, ::4]
+        ground_alts = dem.get_elevations(ground_x, ground_y)
+        # the lines of sight are above the building height within 6 percent of the way to the sensor
+        fractions = np.linspace(0.0005, 0.06, 600)[:, np.newaxis]
+        ray_x = np.ravel(ground_x) + (SENSOR_X - np.ravel(ground_x)) * fractions
+        ray_y = np.ravel(ground_y) + (SENSOR_Y - np.ravel(ground_y)) * fractions
+        ray_alts = np.ravel(ground_alts) + (SENSOR_ALT - np.ravel(ground_alts)) * fractions
+        occluded = (dem.get_elevations(ray_x, ray_y) > ray_alts).any(axis=0).reshape(ground_x.shape)
+
+        ground = ground_alts == 0
+        assert occluded[ground].sum() > 100
+        assert np.logical_not(visible[occluded & ground]).mean() > 0.97
+        assert visible[np.logical_not(occluded) & ground].mean() > 0.97
+        assert visible[ground_alts > 0].mean() > 0.97
+        print("building occlusion test passed")
+
+    def test_pixels_obstructed_by_dem(self):
+        image = create_oblique_image()
+        point_calc = image.get_point_calculator()
+        center_x, center_y = point_calc.pixel_x_y_alt_to_lon_lat(np.array([320.0]), np.array([240.0]), 0)
+        center_x, center_y = center_x[0], center_y[0]
+        dem = BuildingDem(center_x - 10, center_x + 10, center_y - 10, center_y + 10, 40)
+
+        # integer pixel locations, and the ground points they see if nothing is in the way
+        pixels_y, pixels_x = np.mgrid[120:360:3, 200:440:3]
+        ground_x, ground_y = point_calc.pixel_x_y_alt_to_lon_lat(pixels_x, pixels_y, np.zeros(pixels_x.shape))
+        ground_alts = np.zeros(pixels_x.shape)
+        obstructed = ortho_tools.are_pixels_obstructed_by_dem(image, pixels_x, pixels_y, ground_x, ground_y, dem,
+                                                              alts=ground_alts, dem_resolution=0.25)
+
+        fractions = np.linspace(0.0005, 0.06, 600)[:, np.newaxis]
+        ray_x = np.ravel(ground_x) + (SENSOR_X - np.ravel(ground_x)) * fractions
+        ray_y = np.ravel(ground_y) + (SENSOR_Y - np.ravel(ground_y)) * fractions
+        ray_alts = SENSOR_ALT * fractions
+        occluded = (dem.get_elevations(ray_x, ray_y) > ray_alts).any(axis=0).reshape(ground_x.shape)
+
+        ground = dem.get_elevations(ground_x, ground_y) == 0
+        assert occluded[ground].sum() > 100
+        assert obstructed[occluded & ground].mean() > 0.97
+        assert obstructed[np.logical_not(occluded) & ground].mean() < 0.03
+        print("pixels obstructed by dem test passed")
+
+
+if __name__ == '__main__':
+    unittest.main()
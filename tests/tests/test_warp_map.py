@@ -0,0 +1,58 @@
+from __future__ import division
+
+import os
+import unittest
+import numpy as np
+from shapely.geometry import box
+from pyproj import Proj
+from resippy.image_objects.earth_overhead.earth_overhead_point_calculators.ideal_pinhole_fpa_local_utm_point_calc \
+    import IdealPinholeFpaLocalUtmPointCalc
+from resippy.photogrammetry.dem.dem_factory import DemFactory
+from resippy.photogrammetry.warp_map import WarpMap
+from resippy.utils.photogrammetry_utils import create_ground_grid
+from resippy.utils.image_utils import image_utils
+
+
+def create_point_calc():  # type: (...) -> IdealPinholeFpaLocalUtmPointCalc
+    local_proj = Proj(proj='utm', zone=18, ellps='WGS84')
+    return IdealPinholeFpaLocalUtmPointCalc.init_from_local_params(0, 0, 800, local_proj,
+                                                                  np.deg2rad(10), np.deg2rad(5), np.deg2rad(5),
+                                                                  640, 480, 5, 5, 10)
+
+
+class TestWarpMap(unittest.TestCase):
+
+    def test_warp_map(self):
+        point_calc = create_point_calc()
+        dem = DemFactory.constant_elevation(25)
+        world_polygon = box(-300, -200, 300, 200)
+        warp_map = WarpMap.init_from_point_calc(point_calc, 150, 100, world_polygon,
+                                                world_proj=point_calc.get_projection(), dem=dem)
+        ground_x, ground_y = create_ground_grid(-300, 300, -200, 200, 150, 100)
+        alts = dem.get_elevations(ground_x, ground_y)
+        pixels_x, pixels_y = point_calc.lon_lat_alt_to_pixel_x_y(ground_x, ground_y, alts,
+                                                                 world_proj=point_calc.get_projection())
+        warp_pixels_x, warp_pixels_y = warp_map.get_pixel_x_y()
+        assert warp_pixels_x.dtype == np.float32
+        assert np.allclose(warp_pixels_x, pixels_x, atol=1e-3)
+        assert np.allclose(warp_pixels_y, pixels_y, atol=1e-3)
+
+        image_band = np.random.uniform(1, 100, (480, 640))
+        warped = warp_map.warp_image_band(image_band, interpolation='bilinear')
+        expected = image_utils.grid_warp_image_band(image_band, pixels_x, pixels_y, interpolation='bilinear')
+        assert np.allclose(warped, expected, atol=0.01)
+
+        for fname in ["/tmp/test_warp_map.npz", "/tmp/test_warp_map.npy"]:
+            warp_map.write_to_disk(fname)
+            loaded_warp_map = WarpMap.init_from_file(fname)
+            loaded_pixels_x, loaded_pixels_y = loaded_warp_map.get_pixel_x_y()
+            assert np.array_equal(loaded_pixels_x, warp_pixels_x)
+            assert np.array_equal(loaded_pixels_y, warp_pixels_y)
+            assert np.allclose(loaded_warp_map.get_geot(), warp_map.get_geot())
+            assert loaded_warp_map.get_npix_x() == 150 and loaded_warp_map.get_npix_y() == 100
+        os.remove("/tmp/test_warp_map.npy.json")
+        print("warp map test passed")
+
+
+if __name__ == '__main__':
+    unittest.main()